@@ -1,11 +1,75 @@
-from .accessibility import *
-from .colgen import *
-from .dtaapi import *
-from .utils import *
+""" Path4GMNS
+
+Submodules are imported on first access to their public functions so that
+importing the package stays cheap, and the path engine and DTALite will not
+be loaded until they are actually used.
+"""
+from importlib import import_module
 
 
 __version__ = '0.7.1'
 
 
-# print out the current version
-print('path4gmns, version '+__version__)
\ No newline at end of file
+# public function -> submodule it comes from
+_LAZY_ATTRS = {
+    'evaluate_accessibility': 'accessibility',
+    'perform_network_assignment': 'colgen',
+    'perform_network_assignment_DTALite': 'dtaapi',
+    'perform_odme_batch': 'odme',
+    'read_network': 'utils',
+    'load_columns': 'utils',
+    'save_column_pool': 'utils',
+    'load_column_pool': 'utils',
+    'save_demand_matrices': 'utils',
+    'read_demand_matrices': 'utils',
+    'output_columns': 'utils',
+    'output_link_performance': 'utils',
+    'download_sample_data_sets': 'utils',
+    'output_agent_paths': 'utils',
+    'output_odme_performance': 'utils',
+    'output_path_link_propotion': 'utils',
+    'output_od_path_propotion': 'utils',
+    'output_od_link_propotion': 'utils',
+    'output_link_performance_parquet': 'utils',
+    'output_columns_parquet': 'utils',
+    'output_path_link_propotion_parquet': 'utils',
+    'output_odme_performance_parquet': 'utils'
+}
+
+
+_SUBMODULES = {
+    'accessibility',
+    'checkpoint',
+    'classes',
+    'colgen',
+    'consts',
+    'dtaapi',
+    'odme',
+    'path',
+    'utils'
+}
+
+
+__all__ = list(_LAZY_ATTRS.keys())
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return import_module('.'+name, __name__)
+
+    try:
+        module = import_module('.'+_LAZY_ATTRS[name], __name__)
+    except KeyError:
+        raise AttributeError(
+            f'module {__name__!r} has no attribute {name!r}'
+        ) from None
+
+    attr = getattr(module, name)
+    # cache it so that __getattr__() will not be called again
+    globals()[name] = attr
+
+    return attr
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
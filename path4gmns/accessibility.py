@@ -1,9 +1,12 @@
 import os
 import csv
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 from .classes import AccessNetwork
-from .path import single_source_shortest_path
+from .path import single_source_shortest_path, _get_worker_network
 from .consts import MAX_LABEL_COST, MIN_TIME_BUDGET, \
                     BUDGET_TIME_INTVL, MAX_TIME_BUDGET
 
@@ -28,33 +31,71 @@ def _get_interval_id(t):
     return int(t/(MIN_TIME_BUDGET+BUDGET_TIME_INTVL)) + 1
 
 
-def _update_min_travel_time(an, at, min_travel_times):
+def _get_interval_ids(t):
+    """ vectorized _get_interval_id() for an array of nonnegative t """
+    ids = (t / (MIN_TIME_BUDGET+BUDGET_TIME_INTVL)).astype(np.int64)
+    ids += (t % (MIN_TIME_BUDGET+BUDGET_TIME_INTVL)) != 0
+    ids[t < MIN_TIME_BUDGET] = 0
+
+    return ids
+
+
+def _get_min_travel_times(an, centroids):
+    """ min travel times from each of centroids to all centroids """
+    min_travel_times = np.empty((len(centroids), len(an.get_centroids())))
+    centroid_nos = [c.get_node_no() for c in an.get_centroids()]
+
+    for i, c in enumerate(centroids):
+        single_source_shortest_path(an, c.get_node_id())
+        label_costs = np.ctypeslib.as_array(an.get_node_label_costs())
+        min_travel_times[i] = label_costs[centroid_nos]
+
+    return min_travel_times
+
+
+def _update_min_travel_time(an, at, skim, worker_num=1):
+    """ fill skim with min travel times between centroids under mode at
+
+    Shortest paths from centroids are calculated by worker_num threads, each
+    of which takes a contiguous block of centroids. Return the maximum finite
+    min travel time.
+    """
     # _update_generalized_link_cost_a(an, at)
     an.update_generalized_link_cost(at)
 
-    at_str = at.get_type()
-    max_min = 0
-    for c in an.get_centroids():
-        node_id = c.get_node_id()
-        zone_id = c.get_zone_id()
-        single_source_shortest_path(an, node_id)
-        for c_ in an.get_centroids():
-            if c_ == c:
-                continue
+    centroids = an.get_centroids()
+    worker_num = max(1, min(worker_num, len(centroids)))
 
-            node_no = c_.get_node_no()
-            to_zone_id = c_.get_zone_id()
-            min_tt = an.get_node_label_cost(node_no)
-            min_travel_times[(zone_id, to_zone_id, at_str)] = min_tt
+    if worker_num == 1:
+        skim[:] = _get_min_travel_times(an, centroids)
+    else:
+        block_size = (len(centroids) + worker_num - 1) // worker_num
+        starts = range(0, len(centroids), block_size)
+        with ThreadPoolExecutor(max_workers=worker_num) as executor:
+            futures = [
+                executor.submit(_get_min_travel_times,
+                                _get_worker_network(an),
+                                centroids[i:i+block_size])
+                for i in starts
+            ]
+            for i, f in zip(starts, futures):
+                skim[i:i+block_size] = f.result()
+
+    # there is no trip within the same zone
+    np.fill_diagonal(skim, np.nan)
+
+    finite = skim[skim < MAX_LABEL_COST]
+    if not finite.size:
+        return 0
 
-            if min_tt < MAX_LABEL_COST and max_min < min_tt:
-                max_min = min_tt
+    return max(0, finite.max())
 
-    return max_min
 
+def _output_accessibility(skim, zones, output_dir='.'):
+    """ output accessibility for each OD pair (i.e., travel time)
 
-def _output_accessibility(min_travel_times, output_dir='.'):
-    """ output accessibility for each OD pair (i.e., travel time) """
+    skim is the min travel times between zones under mode 'p' (i.e., auto)
+    """
     with open(output_dir+'/accessibility.csv', 'w',  newline='') as f:
         headers = ['o_zone_id', 'o_zone_name',
                    'd_zone_id', 'd_zone_name',
@@ -65,14 +106,12 @@ def _output_accessibility(min_travel_times, output_dir='.'):
 
         # for multimodal case, find the minimum travel time
         # under mode 'p' (i.e., auto)
-        for k, v in min_travel_times.items():
-            # k = (from_zone_id, to_zone_id, at_type_str)
-            if k[2] != 'p':
-                continue
-
+        for oz, min_tts in zip(zones, skim.tolist()):
             # output assessiblity
-            line = [k[0], '', k[1], '', v, '']
-            writer.writerow(line)
+            writer.writerows(
+                [oz, '', dz, '', v, '']
+                for dz, v in zip(zones, min_tts) if dz != oz
+            )
 
         if output_dir == '.':
             print('\ncheck accessibility.csv in '
@@ -83,8 +122,8 @@ def _output_accessibility(min_travel_times, output_dir='.'):
                   +' for accessibility matrix')
 
 
-def _output_accessibility_aggregated(min_travel_times, interval_num,
-                                     zones, ats, output_dir='.'):
+def _output_accessibility_aggregated(skims, interval_num, zones, ats,
+                                     output_dir='.'):
     """ output aggregated accessibility matrix for each agent type """
 
     with open(output_dir+'/accessibility_aggregated.csv', 'w',  newline='') as f:
@@ -98,30 +137,25 @@ def _output_accessibility_aggregated(min_travel_times, interval_num,
         writer = csv.writer(f)
         writer.writerow(headers)
 
-        # calculate accessibility
-        for oz in zones:
-            if oz == -1:
-                continue
-
-            for atype in ats:
-                at_str = atype.get_type()
-                # number of accessible zones from oz for each agent type
-                counts = [0] * interval_num
-                for dz in zones:
-                    if (oz, dz, at_str) not in min_travel_times.keys():
-                        continue
-
-                    min_tt = min_travel_times[(oz, dz, at_str)]
-                    if min_tt >= MAX_LABEL_COST:
-                        continue
-
-                    id = _get_interval_id(min_tt)
-                    while id < interval_num:
-                        counts[id] += 1
-                        id += 1
+        # calculate accessibility, i.e., number of accessible zones from each
+        # zone for each agent type within each time budget
+        mode_num, zone_num, _ = skims.shape
+        counts = np.zeros((mode_num, zone_num, interval_num + 1),
+                          dtype=np.int64)
+
+        # unreachable and intra-zone OD pairs are excluded
+        m, oz, dz = np.nonzero(skims < MAX_LABEL_COST)
+        ids = np.minimum(_get_interval_ids(skims[m, oz, dz]), interval_num)
+        np.add.at(counts, (m, oz, ids), 1)
+        # a zone accessible within a time budget is accessible within any
+        # larger time budget
+        counts = np.cumsum(counts[:, :, :interval_num], axis=2).tolist()
+
+        for i, oz in enumerate(zones):
+            for j, atype in enumerate(ats):
                 # output assessiblity
                 line = [oz, '', atype.get_type()]
-                line.extend(counts)
+                line.extend(counts[j][i])
                 writer.writerow(line)
 
         if output_dir == '.':
@@ -133,34 +167,49 @@ def _output_accessibility_aggregated(min_travel_times, interval_num,
                   +' for aggregated accessibility matrix')
 
 
-def evaluate_accessibility(ui, multimodal=True, output_dir='.'):
+def evaluate_accessibility(ui, multimodal=True, output_dir='.',
+                           worker_num=None):
+    """ evaluate accessibility between zones for each mode
+
+    Min travel times between zones are stored as skims, a dense array of
+    (mode, origin zone, destination zone) following the order of agent types
+    and zones (excluding virtual zone -1), where the ones not evaluated and
+    intra-zone ones are nan. worker_num is the number of threads to calculate
+    shortest paths, which is the number of CPU cores if it is None.
+    """
     base = ui._base_assignment
-    zones = base.get_zones()
     ats = base.get_agent_types()
 
     an = AccessNetwork(base.network)
+    # zones of centroids, i.e., zones excluding -1
+    zones = [c.get_zone_id() for c in an.get_centroids()]
+
+    if worker_num is None:
+        worker_num = os.cpu_count() or 1
+
+    skims = np.full((len(ats), len(zones), len(zones)), np.nan)
 
     max_min = 0
-    min_travel_times = {}
     if multimodal:
-        for at in ats:
+        for i, at in enumerate(ats):
             an.set_target_mode(at.get_type())
-            max_min_ = _update_min_travel_time(an, at, min_travel_times)
+            max_min_ = _update_min_travel_time(an, at, skims[i], worker_num)
             if max_min_ > max_min:
                 max_min = max_min_
     else:
         at = base.get_agent_type('p')
-        max_min = _update_min_travel_time(an, at, min_travel_times)
+        i = base.get_agent_type_id('p')
+        max_min = _update_min_travel_time(an, at, skims[i], worker_num)
 
     interval_num = _get_interval_id(min(max_min, MAX_TIME_BUDGET)) + 1
 
     t = threading.Thread(
         target=_output_accessibility,
-        args=(min_travel_times, output_dir,))
+        args=(skims[base.get_agent_type_id('p')], zones, output_dir,))
     t.start()
 
     t = threading.Thread(
         target=_output_accessibility_aggregated,
-        args=(min_travel_times, interval_num, zones, ats, output_dir)
+        args=(skims, interval_num, zones, ats, output_dir)
     )
-    t.start()
\ No newline at end of file
+    t.start()
@@ -0,0 +1,382 @@
+""" binary column pool and checkpoints of network assignment
+
+Column pool is stored as numpy arrays, where node and link sequences of columns
+are delta encoded and then stored as varints. A checkpoint further includes
+link volumes, the iteration to resume from, and other states of the
+assignment, which is written atomically on a background thread.
+"""
+
+
+import os
+import threading
+from itertools import chain
+
+import numpy as np
+
+from .classes import Column, ColumnVec
+from .consts import CHECKPOINT_VERSION
+
+
+def _encode_varints(values):
+    """ encode signed integers as zigzag LEB128 varints in a uint8 array """
+    v = np.asarray(values, dtype=np.int64)
+    z = ((v << 1) ^ (v >> 63)).astype(np.uint64)
+
+    # number of bytes taken by each value
+    nbytes = np.ones(z.size, dtype=np.int64)
+    t = z >> np.uint64(7)
+    while t.any():
+        nbytes += t > 0
+        t >>= np.uint64(7)
+
+    ends = np.cumsum(nbytes)
+    starts = ends - nbytes
+
+    buf = np.empty(ends[-1] if z.size else 0, dtype=np.uint8)
+    for k in range(nbytes.max(initial=0)):
+        m = nbytes > k
+        b = (z[m] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        # the most significant bit flags that more bytes follow
+        b |= (nbytes[m] > k + 1).astype(np.uint64) << np.uint64(7)
+        buf[starts[m] + k] = b
+
+    return buf
+
+
+def _decode_varints(buf):
+    """ decode a uint8 array from _encode_varints() """
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # value index and byte position of each byte
+    idx = np.repeat(np.arange(ends.size), ends - starts + 1)
+    pos = np.arange(buf.size) - starts[idx]
+
+    b = buf.astype(np.uint64) & np.uint64(0x7f)
+    z = np.zeros(ends.size, dtype=np.uint64)
+    for k in range(pos.max(initial=-1) + 1):
+        m = pos == k
+        z[idx[m]] |= b[m] << np.uint64(7 * k)
+
+    return (z >> np.uint64(1)).astype(np.int64) ^ -(z & np.uint64(1)).astype(
+        np.int64
+    )
+
+
+def _encode_sequences(seqs, counts):
+    """ delta encode concatenated sequences and then encode them as varints
+
+    The first element of each sequence is kept as it is.
+    """
+    seqs = np.asarray(seqs, dtype=np.int64)
+    deltas = np.diff(seqs, prepend=0)
+
+    starts = np.cumsum(counts) - counts
+    starts = starts[counts > 0]
+    deltas[starts] = seqs[starts]
+
+    return _encode_varints(deltas)
+
+
+def _decode_sequences(buf, counts):
+    """ decode sequences from _encode_sequences() to a concatenated array """
+    deltas = _decode_varints(buf)
+    if not deltas.size:
+        return deltas
+
+    sums = np.cumsum(deltas)
+    starts = np.cumsum(counts) - counts
+
+    return sums - np.repeat(sums[starts] - deltas[starts], counts)
+
+
+def _snapshot_column_pool(A):
+    """ take the states of column pool of assignment A as a dict
+
+    Everything is copied except node and link sequences of columns, which
+    are lists of references to them as they are never modified in place
+    once set up. See _flatten_column_sequences() for the rest.
+    """
+    column_pool = A.get_column_pool()
+
+    od_keys = []
+    od_vols = []
+    route_fixed = []
+    col_nums = []
+    cols = []
+    node_sums = []
+    for k, cv in column_pool.items():
+        od_keys.append(k)
+        od_vols.append(cv.get_od_volume())
+        route_fixed.append(cv.is_route_fixed())
+        col_nums.append(cv.get_column_num())
+        for node_sum, col in cv.get_columns().items():
+            cols.append(col)
+            node_sums.append(node_sum)
+
+    return {
+        'network_size': np.array([len(A.get_nodes()), len(A.get_links())]),
+        'od_keys': np.array(od_keys, dtype=np.int64).reshape(-1, 4),
+        'od_vols': np.array(od_vols, dtype=np.float64),
+        'route_fixed': np.array(route_fixed, dtype=bool),
+        'col_nums': np.array(col_nums, dtype=np.int64),
+        'seq_nos': np.array([col.get_seq_no() for col in cols],
+                            dtype=np.int64),
+        'node_sums': np.array(node_sums, dtype=np.int64),
+        'vols': np.array([col.get_volume() for col in cols],
+                         dtype=np.float64),
+        'tolls': np.array([col.get_toll() for col in cols], dtype=np.float64),
+        'travel_times': np.array([col.get_travel_time() for col in cols],
+                                 dtype=np.float64),
+        'dists': np.array([col.get_distance() for col in cols],
+                          dtype=np.float64),
+        'nodes': [col.nodes for col in cols],
+        'links': [col.links for col in cols]
+    }
+
+
+def _flatten_column_sequences(arrays, encode=True):
+    """ turn node and link sequences from _snapshot_column_pool() into arrays
+
+    They are concatenated into nodes and links, where the length of each
+    sequence goes to node_nums and link_nums. If encode is True, nodes and
+    links will be further encoded by _encode_sequences().
+
+    arrays is updated in place and returned.
+    """
+    for name, num_name in [('nodes', 'node_nums'), ('links', 'link_nums')]:
+        seqs = arrays[name]
+        nums = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+        seqs = np.fromiter(chain.from_iterable(seqs), dtype=np.int64,
+                           count=nums.sum())
+        arrays[num_name] = nums
+        arrays[name] = _encode_sequences(seqs, nums) if encode else seqs
+
+    return arrays
+
+
+def get_column_pool_arrays(A, encode=True):
+    """ return column pool of assignment A as a dict of numpy arrays
+
+    If encode is False, nodes and links will be the concatenated node and
+    link sequences of all columns rather than the encoded ones.
+    """
+    return _flatten_column_sequences(_snapshot_column_pool(A), encode)
+
+
+def restore_column_pool(A, data):
+    """ restore column pool of assignment A from get_column_pool_arrays()
+
+    Each OD pair in data, along with its OD volume and columns, will replace
+    the existing one in column pool.
+
+    Return the concatenated link sequences of all columns.
+    """
+    if data['network_size'].tolist() != [len(A.get_nodes()),
+                                         len(A.get_links())]:
+        raise Exception(
+            'Invalid column pool!! '
+            'Did you save it from a different network?'
+        )
+
+    column_pool = A.get_column_pool()
+
+    col_nums = data['col_nums']
+    node_nums = data['node_nums']
+    link_nums = data['link_nums']
+
+    node_offsets = np.concatenate(([0], np.cumsum(node_nums))).tolist()
+    link_offsets = np.concatenate(([0], np.cumsum(link_nums))).tolist()
+    nodes = _decode_sequences(data['nodes'], node_nums).tolist()
+    link_arr = _decode_sequences(data['links'], link_nums)
+    links = link_arr.tolist()
+
+    seq_nos = data['seq_nos'].tolist()
+    node_sums = data['node_sums'].tolist()
+    vols = data['vols'].tolist()
+    tolls = data['tolls'].tolist()
+    travel_times = data['travel_times'].tolist()
+    dists = data['dists'].tolist()
+
+    col_offsets = np.concatenate(([0], np.cumsum(col_nums))).tolist()
+    for i, (k, od_vol, route_fixed) in enumerate(
+        zip(map(tuple, data['od_keys'].tolist()),
+            data['od_vols'].tolist(),
+            data['route_fixed'].tolist())
+    ):
+        cv = ColumnVec()
+        cv.od_vol = od_vol
+        cv.route_fixed = route_fixed
+        column_pool[k] = cv
+
+        for j in range(col_offsets[i], col_offsets[i+1]):
+            col = Column(seq_nos[j])
+            col.nodes = nodes[node_offsets[j]:node_offsets[j+1]]
+            col.links = links[link_offsets[j]:link_offsets[j+1]]
+            col.set_volume(vols[j])
+            col.set_toll(tolls[j])
+            col.set_travel_time(travel_times[j])
+            col.set_distance(dists[j])
+            cv.add_new_column(node_sums[j], col)
+
+    return link_arr
+
+
+def get_checkpoint_arrays(A, assignment_mode, next_iter,
+                          orig_gaps=None, history=None, incidence=None):
+    """ return the states of assignment A as a dict of numpy arrays
+
+    next_iter is the iteration to resume from. orig_gaps is the gap of each
+    origin (at, dp, oz) used in selective origin processing, and history is
+    the list of total gaps from previous ODME iterations. incidence is the
+    PathIncidence in ODME, whose order of columns is kept as the OD no (in
+    column pool) of each column so that ODME can be resumed with columns
+    indexed in the same order, see PathIncidence.update().
+
+    Only cheap copies are taken here so that the assignment can go on while
+    CheckpointWriter writes them. Node and link sequences of columns are
+    concatenated and encoded by CheckpointWriter on its own thread, see
+    _snapshot_column_pool().
+    """
+    links = A.get_links()
+    zones = A.get_network().zone_id_to_zone_dict
+
+    path_od_nos = []
+    if incidence is not None:
+        od_nos = {k: i for i, k in enumerate(A.get_column_pool().keys())}
+        path_od_nos = [od_nos[k] for k in incidence.get_path_od_keys()]
+
+    arrays = _snapshot_column_pool(A)
+    arrays.update({
+        'version': np.array(CHECKPOINT_VERSION),
+        'assignment_mode': np.array(assignment_mode),
+        'next_iter': np.array(next_iter),
+        'link_vols': np.array([link.flow_vol_by_period for link in links],
+                              dtype=np.float64),
+        'link_count_devs': np.array(
+            [link.est_count_dev_by_period for link in links], dtype=np.float64
+        ),
+        'zone_ids': np.array(list(zones.keys()), dtype=np.int64),
+        'zone_states': np.array(
+            [[z.est_production, z.est_attraction,
+              z.est_production_dev, z.est_attraction_dev]
+             for z in zones.values()],
+            dtype=np.float64
+        ).reshape(-1, 4),
+        'has_orig_gaps': np.array(orig_gaps is not None),
+        'orig_gap_keys': np.array(
+            list(orig_gaps.keys()) if orig_gaps else [], dtype=np.int64
+        ).reshape(-1, 3),
+        'orig_gaps': np.array(
+            list(orig_gaps.values()) if orig_gaps else [], dtype=np.float64
+        ),
+        'history': np.array(history if history else [], dtype=np.float64),
+        'has_incidence': np.array(incidence is not None),
+        'path_od_nos': np.array(path_od_nos, dtype=np.int64)
+    })
+
+    return arrays
+
+
+def restore_checkpoint(A, checkpoint_file, assignment_mode):
+    """ restore the states of assignment A from checkpoint_file
+
+    Return (next_iter, orig_gaps, history, path_od_keys), see
+    get_checkpoint_arrays(), where path_od_keys is the OD key of each column
+    in the order indexed by PathIncidence (None if it is not saved).
+    """
+    with np.load(checkpoint_file) as data:
+        print(f'resume from {checkpoint_file}')
+
+        # checkpoints before versioning do not have it
+        version = data['version'].item() if 'version' in data else 1
+        if version != CHECKPOINT_VERSION:
+            raise Exception(
+                f'checkpoint is of format version {version} rather than '
+                f'{CHECKPOINT_VERSION}!! Please restart the assignment.'
+            )
+
+        if data['assignment_mode'].item() != assignment_mode:
+            raise Exception(
+                f'checkpoint is from assignment mode '
+                f'{data["assignment_mode"].item()} rather than '
+                f'{assignment_mode}!!'
+            )
+
+        restore_column_pool(A, data)
+
+        for link, vols, devs in zip(A.get_links(),
+                                    data['link_vols'].tolist(),
+                                    data['link_count_devs'].tolist()):
+            link.flow_vol_by_period[:] = vols
+            link.est_count_dev_by_period[:] = devs
+
+        A.get_network().get_link_arrays().update_travel_times()
+
+        zones = A.get_network().zone_id_to_zone_dict
+        for zone_id, states in zip(data['zone_ids'].tolist(),
+                                   data['zone_states'].tolist()):
+            z = zones[zone_id]
+            z.est_production, z.est_attraction, \
+                z.est_production_dev, z.est_attraction_dev = states
+
+        orig_gaps = None
+        if data['has_orig_gaps'].item():
+            orig_gaps = {
+                tuple(k): v for k, v in zip(data['orig_gap_keys'].tolist(),
+                                            data['orig_gaps'].tolist())
+            }
+
+        path_od_keys = None
+        if data['has_incidence'].item():
+            od_keys = list(map(tuple, data['od_keys'].tolist()))
+            path_od_keys = [od_keys[i] for i in data['path_od_nos'].tolist()]
+
+        return (data['next_iter'].item(), orig_gaps,
+                data['history'].tolist(), path_od_keys)
+
+
+class CheckpointWriter:
+    """ write checkpoints atomically on a background thread
+
+    A checkpoint is first written to a temporary file and then renamed to
+    checkpoint.npz in checkpoint_dir. Therefore, checkpoint.npz is always a
+    complete one even if the process is killed in the middle of writing.
+    """
+    def __init__(self, checkpoint_dir):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.checkpoint_file = os.path.join(checkpoint_dir, 'checkpoint.npz')
+        self.thread = None
+        self.error = None
+
+    def _write(self, arrays):
+        try:
+            _flatten_column_sequences(arrays)
+
+            tmp_file = self.checkpoint_file + '.tmp'
+            with open(tmp_file, 'wb') as fp:
+                np.savez_compressed(fp, **arrays)
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            os.replace(tmp_file, self.checkpoint_file)
+        except Exception as e:
+            self.error = e
+
+    def write(self, arrays):
+        """ start writing arrays from get_checkpoint_arrays() once the
+        previous write is done
+        """
+        self.wait()
+        self.thread = threading.Thread(target=self._write, args=(arrays,))
+        self.thread.start()
+
+    def wait(self):
+        """ wait for the pending write and raise its exception if any """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.error is not None:
+            e, self.error = self.error, None
+            raise e
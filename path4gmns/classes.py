@@ -1,18 +1,55 @@
 import ctypes
-from copy import deepcopy
-from random import choice
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
 
-from .path import find_path_for_agents, find_shortest_path, \
-                  single_source_shortest_path
+import numpy as np
+
+from .path import bounded_shortest_path, find_path_for_agents, \
+                  find_shortest_path, _get_worker_network
 from .consts import MAX_LABEL_COST
 
 
 __all__ = ['UI']
 
 
+def _get_physical_memory():
+    """ return the size of physical memory in bytes or 0 if it is unknown """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def _build_topology(from_node_nos, to_node_nos, node_size):
+    """ build the network topology used by the path engine from link arrays
+
+    It is the same as Network.get_topology() but in numpy arrays, which will
+    be wrapped by Network.allocate_for_CAPI() directly.
+    """
+    from_node_nos = np.asarray(from_node_nos, dtype=np.int64)
+
+    # outgoing links of each node are in the same order as link seq nos
+    sorted_link_nos = np.argsort(from_node_nos, kind='stable')
+    link_nums = np.bincount(from_node_nos, minlength=node_size)
+    last_links = np.cumsum(link_nums)
+    first_links = last_links - link_nums
+    first_links[link_nums == 0] = -1
+    last_links[link_nums == 0] = -1
+
+    return {
+        'from_node_no': np.ascontiguousarray(from_node_nos, dtype=np.int32),
+        'to_node_no': np.ascontiguousarray(to_node_nos, dtype=np.int32),
+        'first_link_from': first_links.astype(np.int32),
+        'last_link_from': last_links.astype(np.int32),
+        'sorted_link_no': sorted_link_nos.astype(np.int32)
+    }
+
+
 class Node:
 
-    def __init__(self, node_seq_no, external_node_id, zone_id,production,attraction,x='', y=''):
+    def __init__(self, node_seq_no, external_node_id, zone_id,
+                 production=0, attraction=0, x='', y=''):
         """ the attributes of node  """
         # external_node_id: user defined node id from input
         self.node_seq_no = node_seq_no
@@ -95,7 +132,9 @@ class Link:
         self.free_flow_travel_time_in_min = (
             length / max(0.001, free_speed) * 60
         )
+        self.free_speed = free_speed
         # capacity is lane capacity per hour
+        self.lane_capacity = capacity
         self.link_capacity = capacity * lanes
         self.allowed_uses = allowed_uses
         self.geometry = geometry
@@ -119,8 +158,8 @@ class Link:
         # ]
 
         #for odme
-        self.obs_count=0
-        self.est_count_dev=0
+        self.obs_count_by_period = [0] * demand_period_size
+        self.est_count_dev_by_period = [0] * demand_period_size
 
     def get_link_id(self):
         return self.id
@@ -161,6 +200,9 @@ class Link:
     def get_period_avg_travel_time(self, tau):
         return self.vdfperiods[tau].get_avg_travel_time()
 
+    def get_period_travel_time_derivative(self, tau):
+        return self.vdfperiods[tau].get_derivative()
+
     def get_generalized_cost(self, tau, value_of_time):
         return (
             self.travel_time_by_period[tau]
@@ -192,64 +234,176 @@ class Link:
     #     )
 
 
-class Agent:
-    """ individual agent derived from aggragted demand between an OD pair
+class LinkArrays:
+    """ link attributes used in assignment as arrays indexed by link seq no
+
+    Tolls, route choice costs, and BPR parameters (i.e., fftt, alpha, beta,
+    and capacity) do not change once the network is read. Travel times are
+    calculated from link volumes by update_travel_times(), along with volume
+    over capacity ratios. Arrays of BPR parameters, travel times, and volume
+    over capacity ratios are indexed by demand period first and then link seq
+    no. They supersede the states of VDFPeriods, which are only updated by
+    VDFPeriod.run_bpr().
+
+    BPR parameters can be given as bpr_params, e.g., memory-mapped from the
+    network snapshot, which will be used directly, see get_bpr_params().
+    """
+    def __init__(self, links, demand_period_size, bpr_params=None):
+        link_size = len(links)
+
+        self.tolls = np.fromiter(
+            (link.toll for link in links), float, link_size
+        )
+        self.route_choice_costs = np.fromiter(
+            (link.route_choice_cost for link in links), float, link_size
+        )
+
+        if bpr_params is None:
+            bpr_params = LinkArrays.get_bpr_params(links, demand_period_size)
+
+        self.fftt, self.alpha, self.beta, self.capacity = bpr_params
+
+        # they are updated in place by links and here, respectively
+        self.link_vols = [link.flow_vol_by_period for link in links]
+        self.link_travel_times = [link.travel_time_by_period for link in links]
+
+        self.travel_times = np.zeros((demand_period_size, link_size))
+        self.vocs = np.zeros((demand_period_size, link_size))
+
+    @staticmethod
+    def get_bpr_params(links, demand_period_size):
+        """ return fftt, alpha, beta, and capacity as one array
+
+        Its shape is (4, demand_period_size, len(links)), where capacity is
+        at least 0.00001 as in VDFPeriod.run_bpr().
+        """
+        bpr_params = np.array(
+            [[[getattr(link.vdfperiods[tau], name) for link in links]
+              for tau in range(demand_period_size)]
+             for name in ['fftt', 'alpha', 'beta', 'capacity']],
+            dtype=float
+        ).reshape(4, demand_period_size, len(links))
+        bpr_params[3] = np.maximum(0.00001, bpr_params[3])
+
+        return bpr_params
+
+    def get_vdf_arrays(self):
+        """ return BPR parameters as (fftt, alpha, beta, capacity) """
+        return self.fftt, self.alpha, self.beta, self.capacity
+
+    def get_travel_times(self):
+        """ travel times as of the last update_travel_times() """
+        return self.travel_times
+
+    def get_vocs(self):
+        """ volume over capacity ratios as of the last update_travel_times()
+        """
+        return self.vocs
+
+    def get_generalized_costs(self, tau, value_of_time):
+        """ generalized link costs of demand period tau """
+        return (
+            self.travel_times[tau]
+            + self.route_choice_costs
+            + self.tolls / max(0.001, value_of_time) * 60
+        )
+
+    def get_derivatives(self):
+        """ derivatives of travel times with respect to volumes
+
+        They are as of the last update_travel_times(), see
+        VDFPeriod.get_derivative().
+        """
+        return (
+            self.fftt * self.alpha * self.beta * self.vocs ** (self.beta - 1)
+            / self.capacity
+        )
+
+    def update_travel_times(self):
+        """ run BPR functions on current link volumes
+
+        It is the vectorized Link.calculate_td_vdfunction() on all links. Only
+        travel times are written back to links, which are read link by link in
+        column updates, while volume over capacity ratios and derivatives stay
+        here.
+        """
+        vols = np.array(self.link_vols, dtype=float).reshape(
+            len(self.link_vols), -1
+        ).T
+        self.vocs = np.maximum(0, vols) / self.capacity
+        self.travel_times = (
+            self.fftt + self.fftt * self.alpha * self.vocs ** self.beta
+        )
 
-    agent_id: integer starts from 1
-    agent_seq_no: internal agent index starting from 0 used for calculation
+        for link_tts, tts in zip(self.link_travel_times,
+                                 self.travel_times.T.tolist()):
+            link_tts[:] = tts
+
+
+class AgentTable:
+    """ individual agents derived from aggragted demand between OD pairs
+
+    Agents are stored column-wise in numpy arrays indexed by agent_seq_no,
+    which is an internal agent index starting from 0. agent_id is an integer
+    starting from 1, i.e., agent_seq_no + 1.
+
+    Paths are stored once in a path store shared by all agents, where agents
+    with the same path refer to it by path_nos (-1 if there is no path). Node
+    and link sequences in the path store are from destination to origin.
     """
-    def __init__(self, agent_id, agent_seq_no, agent_type,
-                 o_zone_id, d_zone_id):
-        """ the attribute of agent """
-        self.agent_id = agent_id
-        self.agent_seq_no = agent_seq_no
+    def __init__(self, o_zone_ids, d_zone_ids, o_node_ids, d_node_ids,
+                 agent_types):
+        """ the attributes of agents """
+        self.o_zone_ids = o_zone_ids
+        self.d_zone_ids = d_zone_ids
+        self.o_node_ids = o_node_ids
+        self.d_node_ids = d_node_ids
         # vehicle
-        self.agent_type = agent_type
-        self.o_zone_id = o_zone_id
-        self.d_zone_id = d_zone_id
-        self.o_node_id = 0
-        self.d_node_id = 0
-        self.node_path = None
-        self.link_path = None
-        self.current_link_seq_no_in_path = 0
-        self.departure_time_in_min = 0
-        # Passenger Car Equivalent (PCE) of the agent
-        self.PCE_factor = 1
-        self.path_cost = 0
-        # self.departure_time_in_simu_interval = int(
-        #     self.departure_time_in_min
-        #     * 60 /_NUM_OF_SECS_PER_SIMU_INTERVAL
-        #     + 0.5)
-        self.b_generated = False
-        self.b_complete_trip = False
-        self.feasible_path_exist_flag = False
-
-    def get_orig_node_id(self):
-        return self.o_node_id
-
-    def get_dest_node_id(self):
-        return self.d_node_id
+        self.agent_types = agent_types
+        self.departure_times = np.zeros(len(o_zone_ids))
+        self.path_costs = np.zeros(len(o_zone_ids))
+        self.path_nos = np.full(len(o_zone_ids), -1, dtype=np.int32)
+        # the path store
+        self.node_paths = []
+        self.link_paths = []
 
-    def get_seq_no(self):
-        return self.agent_seq_no
+    def __len__(self):
+        return len(self.o_zone_ids)
 
-    def get_id(self):
-        return self.agent_id
+    def add_path(self, node_path, link_path):
+        """ add path to the path store and return its path no """
+        self.node_paths.append(tuple(node_path))
+        self.link_paths.append(tuple(link_path))
+        return len(self.node_paths) - 1
 
-    def get_orig_zone_id(self):
-        return self.o_zone_id
+    def get_orig_node_id(self, agent_no):
+        return int(self.o_node_ids[agent_no])
 
-    def get_dest_zone_id(self):
-        return self.d_zone_id
+    def get_dest_node_id(self, agent_no):
+        return int(self.d_node_ids[agent_no])
 
-    def get_path_cost(self):
-        return self.path_cost
+    def get_orig_zone_id(self, agent_no):
+        return int(self.o_zone_ids[agent_no])
 
-    def get_node_path(self):
-        return self.node_path
+    def get_dest_zone_id(self, agent_no):
+        return int(self.d_zone_ids[agent_no])
 
-    # def get_dep_simu_intvl(self):
-    #     return self.departure_time_in_simu_interval
+    def get_path_cost(self, agent_no):
+        return float(self.path_costs[agent_no])
+
+    def get_node_path(self, agent_no):
+        path_no = self.path_nos[agent_no]
+        if path_no < 0:
+            return None
+
+        return self.node_paths[path_no]
+
+    def get_link_path(self, agent_no):
+        path_no = self.path_nos[agent_no]
+        if path_no < 0:
+            return None
+
+        return self.link_paths[path_no]
 
 
 class Network:
@@ -257,7 +411,7 @@ class Network:
     def __init__(self):
         self.node_list = []
         self.link_list = []
-        self.agent_list = []
+        self.agent_table = None
         self.node_size = 0
         self.link_size = 0
         self.agent_size = 0
@@ -279,6 +433,14 @@ class Network:
         # added for CG
         self.zones = None
         self.has_capi_allocated = False
+        # read-only memory-mapped topology from the network snapshot,
+        # see get_topology() for its members
+        self.topology_arrays = None
+        # see get_link_arrays()
+        self.link_arrays = None
+        # read-only memory-mapped BPR parameters from the network snapshot,
+        # see LinkArrays.get_bpr_params()
+        self.bpr_params = None
         # the following two are IDs rather than objects
         self._agent_type_size = 1
         self._demand_period_size = 1
@@ -286,12 +448,20 @@ class Network:
     def update(self, agent_type_size, demand_period_size):
         self.node_size = len(self.node_list)
         self.link_size = len(self.link_list)
-        self.agent_size = len(self.agent_list)
         # it is needed for setup_spnetwork() and setup_spnetwork_a()
         self.zones = sorted(self.zone_to_nodes_dict.keys())
         self._agent_type_size = agent_type_size
         self._demand_period_size = demand_period_size
 
+    def get_link_arrays(self):
+        """ return LinkArrays of links, which is set up on the first call """
+        if self.link_arrays is None:
+            self.link_arrays = LinkArrays(self.link_list,
+                                          self._demand_period_size,
+                                          self.bpr_params)
+
+        return self.link_arrays
+
     @staticmethod
     def convert_allowed_use(au):
         if au.lower().startswith('auto'):
@@ -315,26 +485,18 @@ class Network:
                 Network.convert_allowed_use(m) for m in modes
             )
 
-    def allocate_for_CAPI(self):
-        # execute only on the first call
-        if self.has_capi_allocated:
-            return
-
-        node_size = self.node_size
-        link_size = self.link_size
+    def get_topology(self):
+        """ return the network topology used by the path engine
 
-        # initialization for predecessors and label costs
-        node_predecessor = [-1] * node_size
-        link_predecessor = [-1] * node_size
-        node_label_cost = [MAX_LABEL_COST] * node_size
+        They are from_node_no_array, to_node_no_array, first_link_from,
+        last_link_from, and sorted_link_no_array, where the outgoing links
+        of node i are sorted_link_no_array[first_link_from[i]:last_link_from[i]].
+        """
+        node_size = len(self.node_list)
+        link_size = len(self.link_list)
 
-        # initialize from_node_no_array, to_node_no_array, and link_cost_array
         from_node_no_array = [link.from_node_seq_no for link in self.link_list]
         to_node_no_array = [link.to_node_seq_no for link in self.link_list]
-        link_cost_array = [link.cost for link in self.link_list]
-
-        # initialize others as numpy arrays directly
-        queue_next = [0] * node_size
         first_link_from = [-1] * node_size
         last_link_from = [-1] * node_size
         sorted_link_no_array = [-1] * link_size
@@ -351,6 +513,28 @@ class Network:
                 j += 1
             last_link_from[i] = j
 
+        return (from_node_no_array, to_node_no_array, first_link_from,
+                last_link_from, sorted_link_no_array)
+
+    def allocate_for_CAPI(self):
+        # execute only on the first call
+        if self.has_capi_allocated:
+            return
+
+        node_size = self.node_size
+        link_size = self.link_size
+
+        # initialization for predecessors and label costs
+        node_predecessor = [-1] * node_size
+        link_predecessor = [-1] * node_size
+        node_label_cost = [MAX_LABEL_COST] * node_size
+
+        # initialize link_cost_array
+        link_cost_array = [link.cost for link in self.link_list]
+
+        # initialize others as numpy arrays directly
+        queue_next = [0] * node_size
+
         # setup allowed uses
         allowed_uses = [''] * link_size
         self._setup_allowed_use(allowed_uses)
@@ -363,11 +547,33 @@ class Network:
         # for allowed_uses
         char_arr_link = ctypes.c_wchar_p * link_size
 
-        self.from_node_no_array = int_arr_link(*from_node_no_array)
-        self.to_node_no_array = int_arr_link(*to_node_no_array)
-        self.first_link_from = int_arr_node(*first_link_from)
-        self.last_link_from = int_arr_node(*last_link_from)
-        self.sorted_link_no_array = int_arr_link(*sorted_link_no_array)
+        if self.topology_arrays is not None:
+            # wrap the memory-mapped arrays rather than copying them
+            int_ptr = ctypes.POINTER(ctypes.c_int)
+            arrs = self.topology_arrays
+            self.from_node_no_array = (
+                arrs['from_node_no'].ctypes.data_as(int_ptr)
+            )
+            self.to_node_no_array = arrs['to_node_no'].ctypes.data_as(int_ptr)
+            self.first_link_from = (
+                arrs['first_link_from'].ctypes.data_as(int_ptr)
+            )
+            self.last_link_from = (
+                arrs['last_link_from'].ctypes.data_as(int_ptr)
+            )
+            self.sorted_link_no_array = (
+                arrs['sorted_link_no'].ctypes.data_as(int_ptr)
+            )
+        else:
+            from_node_no_array, to_node_no_array, first_link_from, \
+                last_link_from, sorted_link_no_array = self.get_topology()
+
+            self.from_node_no_array = int_arr_link(*from_node_no_array)
+            self.to_node_no_array = int_arr_link(*to_node_no_array)
+            self.first_link_from = int_arr_node(*first_link_from)
+            self.last_link_from = int_arr_node(*last_link_from)
+            self.sorted_link_no_array = int_arr_link(*sorted_link_no_array)
+
         self.link_cost_array = double_arr_link(*link_cost_array)
         self.node_label_cost = double_arr_node(*node_label_cost)
         self.node_predecessor = int_arr_node(*node_predecessor)
@@ -377,80 +583,80 @@ class Network:
 
         self.has_capi_allocated = True
 
-    def setup_agents(self, column_pool):
-        agent_id = 1
-        agent_no = 0
-
-        for orig in self.zones:
-            for dest in self.zones:
-                for at in range(self._agent_type_size):
-                    for dp in range(self._demand_period_size):
-                        if (at, dp, orig, dest) not in column_pool.keys():
-                                continue
-
-                        cv = column_pool[(at, dp, orig, dest)]
-
-                        if cv.get_od_volume() <= 0:
-                            continue
-
-                        vol = int(cv.get_od_volume()+1)
-
-                        for _ in range(vol):
-                            # construct agent using valid record
-                            agent = Agent(agent_id,
-                                          agent_no,
-                                          at,
-                                          orig,
-                                          dest)
-
-                            # step 1 generate o_node_id and d_node_id randomly
-                            # according to o_zone_id and d_zone_id
-                            agent.o_node_id = choice(
-                                self.zone_to_nodes_dict[orig]
-                            )
-                            agent.d_node_id = choice(
-                                self.zone_to_nodes_dict[dest]
-                            )
-
-                            # step 2 update agent_id and agent_seq_no
-                            agent_id += 1
-                            agent_no += 1
-
-                            # step 3: update the g_simulation_start_time_in_min and
-                            # g_simulation_end_time_in_min
-                            # if agent.departure_time_in_min < g_simulation_start_time_in_min:
-                            #     g_simulation_start_time_in_min = agent.departure_time_in_min
-                            # if agent.departure_time_in_min > g_simulation_end_time_in_min:
-                            #     g_simulation_end_time_in_min = agent.departure_time_in_min
-
-                            #step 4: add the agent to the time dependent agent list
-                            # departure_time = agent.get_dep_simu_intvl()
-                            # if departure_time not in self.agent_td_list_dict.keys():
-                            #     self.agent_td_list_dict[departure_time] = []
-                            # self.agent_td_list_dict[departure_time].append(
-                            #     agent.get_seq_no()
-                            # )
-
-                            self.agent_list.append(agent)
+    def setup_agents(self, column_pool, seed=None):
+        """ set up agent table from OD volumes in column pool
+
+        The number of agents between each OD pair is int(OD volume + 1), and
+        their origin nodes and destination nodes are randomly drawn from the
+        origin zone and the destination zone using a random generator seeded
+        by seed.
+        """
+        # agents are ordered by (orig, dest, at, dp)
+        od_keys = sorted(
+            (orig, dest, at, dp)
+            for (at, dp, orig, dest), cv in column_pool.items()
+            if cv.get_od_volume() > 0
+            and orig in self.zone_to_nodes_dict
+            and dest in self.zone_to_nodes_dict
+        )
+        vols = [
+            int(column_pool[(at, dp, orig, dest)].get_od_volume()+1)
+            for orig, dest, at, dp in od_keys
+        ]
+
+        od_arr = np.array(od_keys, dtype=np.int64).reshape(-1, 4)
+        o_zone_ids = np.repeat(od_arr[:, 0], vols)
+        d_zone_ids = np.repeat(od_arr[:, 1], vols)
+        agent_types = np.repeat(od_arr[:, 2], vols)
+
+        # nodes of each zone in the flat array zone_nodes
+        zone_nos = {z: i for i, z in enumerate(self.zone_to_nodes_dict)}
+        zone_node_nums = np.array(
+            [len(v) for v in self.zone_to_nodes_dict.values()], dtype=np.int64
+        )
+        zone_offsets = np.cumsum(zone_node_nums) - zone_node_nums
+        zone_nodes = np.array(
+            [x for v in self.zone_to_nodes_dict.values() for x in v],
+            dtype=np.int64
+        )
+
+        # generate o_node_id and d_node_id randomly according to o_zone_id
+        # and d_zone_id
+        rng = np.random.default_rng(seed)
+        o_zone_nos = np.repeat([zone_nos[z] for z in od_arr[:, 0].tolist()],
+                               vols).astype(np.int64)
+        d_zone_nos = np.repeat([zone_nos[z] for z in od_arr[:, 1].tolist()],
+                               vols).astype(np.int64)
+        o_node_ids = zone_nodes[
+            zone_offsets[o_zone_nos]
+            + rng.integers(zone_node_nums[o_zone_nos])
+        ]
+        d_node_ids = zone_nodes[
+            zone_offsets[d_zone_nos]
+            + rng.integers(zone_node_nums[d_zone_nos])
+        ]
+
+        self.agent_table = AgentTable(o_zone_ids,
+                                      d_zone_ids,
+                                      o_node_ids,
+                                      d_node_ids,
+                                      agent_types)
 
         # 03/22/21, comment out until departure time is enabled
         # in the future release
+        # agents shall be sorted by departure time
 
-        #step 3.6:sort agents by the departure time
-        # agents.sort(key=lambda agent: agent.departure_time_in_min)
-        # for i, agent in enumerate(agents):
-        #     agent.agent_seq_no = i
-
-        self.agent_size = len(self.agent_list)
+        self.agent_size = len(self.agent_table)
         print(f"the number of agents is {self.agent_size}")
 
-    def _get_agent(self, agent_no):
-        """ retrieve agent using agent_no """
-        try:
-            return self.agent_list[agent_no]
-        except KeyError:
-            print('Please provide a valid agent id, which shall be a\
-                  positive integer!')
+    def _get_agent_no(self, agent_id):
+        """ retrieve agent_no using agent_id """
+        agent_no = agent_id - 1
+        if agent_no < 0 or agent_no >= self.agent_size:
+            raise Exception('Please provide a valid agent id, which shall be '
+                            f'an integer within [1, {self.agent_size}]!')
+
+        return agent_no
 
     def get_agent_node_path(self, agent_id, path_only):
         """ return the sequence of node IDs along the agent path
@@ -458,17 +664,17 @@ class Network:
         developer's note: consider changing its name to
         get_agent_node_path_str()
         """
-        agent_no = agent_id - 1
-        agent = self._get_agent(agent_no)
+        agent_no = self._get_agent_no(agent_id)
 
-        path_cost = agent.get_path_cost()
+        path_cost = self.agent_table.get_path_cost(agent_no)
         if path_cost >= MAX_LABEL_COST:
             return f'distance: infinitity | path: '
 
         path = ''
-        if agent.node_path:
+        node_path = self.agent_table.get_node_path(agent_no)
+        if node_path:
             path = ';'.join(
-                str(self.external_node_id_dict[x]) for x in reversed(agent.node_path)
+                str(self.external_node_id_dict[x]) for x in reversed(node_path)
             )
 
         if path_only:
@@ -482,18 +688,18 @@ class Network:
         developer's note: consider changing its name to
         get_agent_link_path_str()
         """
-        agent_no = agent_id - 1
-        agent = self._get_agent(agent_no)
+        agent_no = self._get_agent_no(agent_id)
 
-        path_cost = agent.get_path_cost()
+        path_cost = self.agent_table.get_path_cost(agent_no)
         if path_cost >= MAX_LABEL_COST:
             return f'distance: infinitity | path: '
-        
+
         path = ''
-        if agent.link_path:
+        link_path = self.agent_table.get_link_path(agent_no)
+        if link_path:
             path = ';'.join(
-            self.link_list[x].get_link_id() for x in reversed(agent.link_path)
-        )
+                self.link_list[x].get_link_id() for x in reversed(link_path)
+            )
 
         if path_only:
             return path
@@ -502,17 +708,15 @@ class Network:
 
     def get_agent_orig_node_id(self, agent_id):
         """ return the origin node id of agent """
-        agent_no = agent_id - 1
-        agent = self._get_agent(agent_no)
+        agent_no = self._get_agent_no(agent_id)
 
-        return agent.get_orig_node_id()
+        return self.agent_table.get_orig_node_id(agent_no)
 
     def get_agent_dest_node_id(self, agent_id):
         """ return the origin node id of agent """
-        agent_no = agent_id - 1
-        agent = self._get_agent(agent_no)
+        agent_no = self._get_agent_no(agent_id)
 
-        return agent.get_dest_node_id()
+        return self.agent_table.get_dest_node_id(agent_no)
 
     def get_agent_count(self):
         return self.agent_size
@@ -586,7 +790,7 @@ class Network:
         return self.link_id_dict[id]
 
     def get_agents(self):
-        return self.agent_list
+        return self.agent_table
 
     def get_last_thru_node(self):
         """ node no of the first potential centroid """
@@ -799,6 +1003,10 @@ class VDFPeriod:
     def get_voc(self):
         return self.voc
 
+    def get_derivative(self):
+        """ derivative of travel time with respect to volume """
+        return self.marginal_base / max(0.00001, self.capacity)
+
     def run_bpr(self, vol):
         vol = max(0, vol)
         self.voc = vol / max(0.00001, self.capacity)
@@ -822,12 +1030,15 @@ class VDFPeriod:
 
 class SPNetwork(Network):
     """ attributes related to outputs from shortest path calculations """
-    def __init__(self, base, at, dp):
+    def __init__(self, base, at, dp, link_cost_array=None):
         self.base = base
         # AgentType object
         self.agent_type = at
         # DemandPeriod object
         self.demand_period = dp
+        # SPNetworks with the same demand period, VOT, and mode share the same
+        # link cost array, see Assignment.get_link_cost_array()
+        self.link_cost_key = (dp.get_id(), at.get_vot(), at.get_type())
 
         # this is necessary for each instance of SPNetwork
         # to retrieve network topoloy
@@ -839,7 +1050,6 @@ class SPNetwork(Network):
         link_preds = [-1] * base.node_size
         node_lables = [MAX_LABEL_COST] * base.node_size
         queue_next = [0] * base.node_size
-        link_cost_array = [link.cost for link in base.link_list]
 
         int_arr_node = ctypes.c_int * base.node_size
         double_arr_node = ctypes.c_double * base.node_size
@@ -848,9 +1058,14 @@ class SPNetwork(Network):
         self.node_predecessor = int_arr_node(*node_preds)
         self.link_predecessor = int_arr_node(*link_preds)
         self.node_label_cost = double_arr_node(*node_lables)
-        self.link_cost_array = double_arr_link(*link_cost_array)
         self.queue_next = int_arr_node(*queue_next)
 
+        if link_cost_array is None:
+            link_cost_array = double_arr_link(
+                *(link.cost for link in base.link_list)
+            )
+        self.link_cost_array = link_cost_array
+
         # node id
         self.orig_nodes = []
         # zone sequence no
@@ -880,10 +1095,21 @@ class SPNetwork(Network):
     def get_demand_period(self):
         return self.demand_period
 
+    def get_link_cost_key(self):
+        """ return (demand period id, vot, mode) """
+        return self.link_cost_key
+
     def get_orig_nodes(self):
         for i in self.orig_nodes:
             yield i
 
+    def get_orig_zones(self):
+        return self.orig_zones
+
+    def get_orig_nodes_from_zone(self, zone_id):
+        """ return node ids of an origin zone """
+        return self.base.get_nodes_from_zone(zone_id)
+
     # the following ten are shared by all SPNetworks
     # network topology
     def get_node_size(self):
@@ -944,7 +1170,13 @@ class SPNetwork(Network):
 
 
 class AccessNetwork(Network):
-    """ network for accessibility evaluation """
+    """ network for accessibility evaluation
+
+    Centroids and connectors are overlaid on base, i.e., they only exist in
+    the arrays used by the path engine, where centroids come after all nodes
+    of base and connectors come after all links of base. Node and link
+    objects and the node id mappings of base are shared and never modified.
+    """
 
     def __init__(self, base, add_cc=True):
         self.base = base
@@ -955,20 +1187,20 @@ class AccessNetwork(Network):
         self.node_size = base.get_node_size()
         self.link_size = base.get_link_size()
         self.centroids = []
+        # key: centroid id, value: node no
+        self.centroid_id_to_no = {}
+        # from node nos and to node nos of connectors
+        self.connector_from_nos = []
+        self.connector_to_nos = []
         self.agent_type_str = 'a'
-        self.pre_source_node_id = -1
         if add_cc:
             self._add_centroids_connectors()
+        self.topology_arrays = None
         self.has_capi_allocated = False
-        super().allocate_for_CAPI()
+        self._allocate_overlay_for_CAPI()
 
     def _add_centroids_connectors(self):
-        # deep copy
-        self.node_list = deepcopy(self.node_list)
-        self.link_list = deepcopy(self.link_list)
-
         node_seq_no = self.node_size
-        link_seq_no = self.link_size
         # get zones
         for z in self.get_zones():
             if z == -1:
@@ -977,55 +1209,57 @@ class AccessNetwork(Network):
             # create a centroid
             node_id = 'c_' + str(z)
             centroid = Node(node_seq_no, node_id, z)
-            self.node_list.append(centroid)
             self.centroids.append(centroid)
-
-            self.map_id_to_no[node_id] = node_seq_no
-            self.map_no_to_id[node_seq_no] = node_id
+            self.centroid_id_to_no[node_id] = node_seq_no
 
             # build connectors
-
             for i in self.get_nodes_from_zone(z):
-                link_id_f = 'conn_' + str(link_seq_no)
-                from_node_no = node_seq_no
-                to_node_id = i
-
                 try:
-                    to_node_no = self.map_id_to_no[i]
+                    node_no = self.map_id_to_no[i]
                 except KeyError:
                     continue
 
                 # connector from centroid to activity nodes in this zone
-                c_forward = Link(link_id_f,
-                                 link_seq_no,
-                                 from_node_no,
-                                 to_node_no,
-                                 node_id,
-                                 to_node_id,
-                                 0)
-
+                self.connector_from_nos.append(node_seq_no)
+                self.connector_to_nos.append(node_no)
                 # connector from activity nodes in this zone to centroid
-                link_id_b = 'conn_' + str(link_seq_no+1)
-                c_backward = Link(link_id_b,
-                                  link_seq_no+1,
-                                  to_node_no,
-                                  from_node_no,
-                                  to_node_id,
-                                  node_id,
-                                  0)
+                self.connector_from_nos.append(node_no)
+                self.connector_to_nos.append(node_seq_no)
 
-                self.node_list[from_node_no].add_outgoing_link(c_forward)
-                self.node_list[to_node_no].add_outgoing_link(c_backward)
+            node_seq_no += 1
 
-                self.link_list.append(c_forward)
-                self.link_list.append(c_backward)
+        self.node_size = node_seq_no
+        self.link_size += len(self.connector_from_nos)
 
-                link_seq_no += 2
+    def _allocate_overlay_for_CAPI(self):
+        """ set up arrays for the path engine with connectors appended """
+        base = self.base
+        if base.topology_arrays is not None:
+            from_node_nos = base.topology_arrays['from_node_no']
+            to_node_nos = base.topology_arrays['to_node_no']
+        else:
+            from_node_nos, to_node_nos = base.get_topology()[:2]
 
-            node_seq_no += 1
+        if self.connector_from_nos:
+            from_node_nos = np.concatenate(
+                (from_node_nos, self.connector_from_nos)
+            )
+            to_node_nos = np.concatenate((to_node_nos, self.connector_to_nos))
 
-        self.node_size = len(self.node_list)
-        self.link_size = len(self.link_list)
+        # outgoing links of each node are in the same order as link seq nos,
+        # which is the same as the outgoing links of nodes of base followed
+        # by connectors
+        self.topology_arrays = _build_topology(from_node_nos,
+                                               to_node_nos,
+                                               self.node_size)
+
+        # costs of connectors are 0 and their allowed uses are all modes
+        super().allocate_for_CAPI()
+        for i in range(base.get_link_size(), self.link_size):
+            self.allowed_uses[i] = 'a'
+
+    def allocate_for_CAPI(self):
+        pass
 
     def get_zones(self):
         return self.base.get_zones()
@@ -1044,9 +1278,6 @@ class AccessNetwork(Network):
         assert(mode in ['p', 'w', 'b', 'a'])
         self.agent_type_str = mode
 
-    def set_source_node_id(self, node_id):
-        self.pre_source_node_id = node_id
-
     def get_agent_type_str(self):
         return self.agent_type_str.encode()
 
@@ -1054,7 +1285,10 @@ class AccessNetwork(Network):
         return self.centroids
 
     def get_node_no(self, node_id):
-        return self.map_id_to_no[node_id]
+        try:
+            return self.map_id_to_no[node_id]
+        except KeyError:
+            return self.centroid_id_to_no[node_id]
 
     def get_node_size(self):
         return self.node_size
@@ -1138,8 +1372,15 @@ class Assignment:
         self.column_pool = {}
         self.network = None
         self.spnetworks = []
+        # key: (demand period id, vot, mode), value: link cost array
+        self.link_cost_arrays = {}
         self.accessnetwork = None
-        self.memory_blocks = 4
+        # 0 means it will be determined by the number of CPU cores and
+        # memory_budget in setup_spnetwork()
+        self.memory_blocks = 0
+        # memory budget in bytes for SPNetworks. None means a quarter of the
+        # physical memory
+        self.memory_budget = None
         self.map_at_id = {}
         self.map_dp_id = {}
 
@@ -1252,9 +1493,10 @@ class Assignment:
         """
         return self.network.get_agent_link_path(agent_id, path_only)
 
-    def find_path_for_agents(self):
+    def find_path_for_agents(self, seed=None, worker_num=None):
         """ find and set up shortest path for each agent """
-        find_path_for_agents(self.network, self.column_pool)
+        find_path_for_agents(self.network, self.column_pool,
+                             seed=seed, worker_num=worker_num)
 
     def find_shortest_path(self, from_node_id, to_node_id, seq_type='node'):
         """ call find_shortest_path() from path.py
@@ -1277,31 +1519,97 @@ class Assignment:
         #                                    column_update_num)
         pass
 
-    def setup_spnetwork(self):
-        spvec = {}
+    def get_link_cost_array(self, at, dp):
+        """ return the link cost array shared by all SPNetworks with the same
+        demand period, VOT, and mode
+        """
+        k = (dp.get_id(), at.get_vot(), at.get_type())
+        if k not in self.link_cost_arrays:
+            double_arr_link = ctypes.c_double * self.network.get_link_size()
+            self.link_cost_arrays[k] = double_arr_link(
+                *(link.cost for link in self.network.get_links())
+            )
+
+        return self.link_cost_arrays[k]
+
+    def get_memory_blocks(self):
+        return self.memory_blocks
+
+    def _get_memory_block_num(self, zone_num):
+        """ determine the number of memory blocks
+
+        It is the number of CPU cores capped by memory_budget, where each
+        memory block takes one SPNetwork per demand.
+        """
+        cpu_num = os.cpu_count() or 1
 
+        budget = self.memory_budget
+        if budget is None:
+            budget = _get_physical_memory() // 4
+
+        # node_predecessor, link_predecessor, queue_next, and node_label_cost
+        block_size = (
+            self.network.get_node_size()
+            * (3 * ctypes.sizeof(ctypes.c_int) + ctypes.sizeof(ctypes.c_double))
+            * max(1, len(self.demands))
+        )
+
+        block_num = min(cpu_num, zone_num)
+        # budget is 0 if the physical memory is unknown
+        if budget > 0:
+            block_num = min(block_num, budget // max(1, block_size))
+
+        return max(1, block_num)
+
+    def _schedule_memory_blocks(self, zones):
+        """ assign zones to memory blocks with balanced workloads
+
+        The workload of a zone is estimated by its number of origin nodes, each
+        of which requires a shortest path tree and a backtrace over all nodes,
+        and its number of demand rows (i.e., OD pairs to set up columns). Zones
+        are assigned in descending order of workload to the memory block with
+        the least workload so far (i.e., longest processing time first).
+        """
+        od_rows = {}
+        for k in self.column_pool.keys():
+            # k = (at, dp, oz, dz)
+            od_rows[k[2]] = od_rows.get(k[2], 0) + 1
+
+        node_size = self.network.get_node_size()
+        workloads = sorted(
+            (
+                -len(self.network.get_nodes_from_zone(z))
+                * (node_size + od_rows.get(z, 0)),
+                z
+            )
+            for z in zones
+        )
+
+        blocks = [[] for _ in range(self.memory_blocks)]
+        heap = [(0, i) for i in range(self.memory_blocks)]
+        for w, z in workloads:
+            load, i = heapq.heappop(heap)
+            blocks[i].append(z)
+            heapq.heappush(heap, (load - w, i))
+
+        return [sorted(b) for b in blocks if b]
+
+    def setup_spnetwork(self):
         # z is zone id starting from 1
-        for z in self.network.zones:
-            if z == -1:
-                continue
+        zones = [z for z in self.network.zones if z != -1]
+
+        if self.memory_blocks <= 0:
+            self.memory_blocks = self._get_memory_block_num(len(zones))
 
+        for block in self._schedule_memory_blocks(zones):
             for d in self.demands:
                 at = self.get_agent_type(d.get_agent_type())
                 dp = self.get_demand_period(d.get_period())
-              
-                if z - 1 < self.memory_blocks:
-                    sp = SPNetwork(self.network, at, dp)
-                    spvec[(at.get_id(), dp.get_id(), z-1)] = sp
-                    sp.orig_zones.append(z)
-                    sp.add_orig_nodes(self.network.get_nodes_from_zone(z))
-                    for node_id in self.network.get_nodes_from_zone(z):
-                        sp.node_id_to_no[node_id] = (
-                            self.network.get_node_no(node_id)
-                        )
-                    self.spnetworks.append(sp)
-                else:
-                    m = (z - 1) % self.memory_blocks
-                    sp = spvec[(at.get_id(), dp.get_id(), m)]
+
+                sp = SPNetwork(self.network, at, dp,
+                               self.get_link_cost_array(at, dp))
+
+                for z in block:
                     sp.orig_zones.append(z)
                     sp.add_orig_nodes(self.network.get_nodes_from_zone(z))
                     for node_id in self.network.get_nodes_from_zone(z):
@@ -1309,6 +1617,8 @@ class Assignment:
                             self.network.get_node_no(node_id)
                         )
 
+                self.spnetworks.append(sp)
+
     def get_link(self, seq_no):
         """ return link object corresponding to link seq no """
         return self.network.get_link(seq_no)
@@ -1327,53 +1637,109 @@ class Assignment:
     def get_node_label_cost(self, node_no):
         return self.accessnetwork.get_node_label_cost(node_no)
 
-    def get_accessible_nodes(self, source_node_id, time_budget, mode):
+    def _get_accessnetwork(self, mode):
+        """ return AccessNetwork with generalized link costs under mode """
+        if not self.accessnetwork:
+            self.accessnetwork = AccessNetwork(self.network, False)
+
+        if self.accessnetwork.agent_type_str != mode:
+            self.accessnetwork.set_target_mode(mode)
+            at = self.get_agent_type(mode)
+            self.accessnetwork.update_generalized_link_cost(at)
+
+        return self.accessnetwork
+
+    def _check_accessible_source(self, source_node_id, time_budget):
         if source_node_id not in self.network.internal_node_seq_no_dict.keys():
             raise Exception(f"Node ID: {source_node_id} not in the network")
 
         assert(time_budget>=0)
 
+    @staticmethod
+    def _get_accessible_node_nos(an, source_node_id, time_budget):
+        """ return node nos and predecessor link nos of accessible nodes
+
+        The source node itself is not included.
+        """
         if time_budget == 0:
-            return []
+            return [], []
 
-        if not self.accessnetwork:
-            self.accessnetwork = AccessNetwork(self.network, False)
+        node_nos, _, link_preds = bounded_shortest_path(an,
+                                                        source_node_id,
+                                                        time_budget)
 
-        # simple caching to avoid duplicate shortest path calculation
-        run_sp = False
-        if self.accessnetwork.pre_source_node_id != source_node_id:
-            self.accessnetwork.set_source_node_id(source_node_id)
-            run_sp = True
+        # do not include the source node itself
+        is_source = node_nos == an.get_node_no(source_node_id)
+        return node_nos[~is_source].tolist(), link_preds[~is_source].tolist()
 
-        if self.accessnetwork.agent_type_str != mode:
-            self.accessnetwork.set_target_mode(mode)
-            at = self.get_agent_type(mode)
-            self.accessnetwork.update_generalized_link_cost(at)
-            run_sp = True
-
-        if run_sp:
-            single_source_shortest_path(self.accessnetwork, source_node_id)
-
-        # if max min travel time is less than or equal to time_budget,
-        # output the entire node set directly without the following check?
-        nodes = []
-        for node in self.accessnetwork.get_nodes():
-            node_no = node.get_node_no()
-            # do not include the source node itself
-            if node.get_node_id() == source_node_id:
-                continue
-            if self.accessnetwork.get_node_label_cost(node_no) <= time_budget:
-                nodes.append(node.get_node_id())
+    def _get_accessible_node_ids(self, an, sources):
+        """ return accessible node ids for each (source node id, time budget)
+        """
+        return [
+            [self.network.external_node_id_dict[x]
+             for x in self._get_accessible_node_nos(an, *source)[0]]
+            for source in sources
+        ]
+
+    def get_accessible_nodes(self, source_node_id, time_budget, mode):
+        self._check_accessible_source(source_node_id, time_budget)
+        an = self._get_accessnetwork(mode)
 
-        return nodes
+        return self._get_accessible_node_ids(
+            an, [(source_node_id, time_budget)]
+        )[0]
 
     def get_accessible_links(self, source_node_id, time_budget, mode):
-        # node id's
-        nodes = self.get_accessible_nodes(source_node_id, time_budget, mode)
-        # convert to link id's
-        return [
-            self.accessnetwork.get_pred_link_id(x) for x in nodes
-        ]
+        self._check_accessible_source(source_node_id, time_budget)
+        an = self._get_accessnetwork(mode)
+
+        _, link_nos = self._get_accessible_node_nos(an,
+                                                    source_node_id,
+                                                    time_budget)
+
+        return [self.network.link_list[x].get_link_id() for x in link_nos]
+
+    def get_accessible_nodes_batch(self, source_node_ids, time_budgets, mode,
+                                   worker_num=None):
+        """ get_accessible_nodes() for a batch of source nodes
+
+        time_budgets can be either a single time budget for all source nodes
+        or one time budget for each source node.
+
+        Source nodes are split into worker_num contiguous blocks. Each block is
+        searched by its own thread on a copy of the access network with its own
+        labels, where the C++ path engine releases the GIL. worker_num is the
+        number of CPU cores if it is None.
+        """
+        if not isinstance(time_budgets, (list, tuple)):
+            time_budgets = [time_budgets] * len(source_node_ids)
+
+        if len(time_budgets) != len(source_node_ids):
+            raise Exception('the number of time budgets shall be one or the '
+                            'same as the number of source nodes')
+
+        sources = list(zip(source_node_ids, time_budgets))
+        for source in sources:
+            self._check_accessible_source(*source)
+
+        an = self._get_accessnetwork(mode)
+
+        if worker_num is None:
+            worker_num = os.cpu_count() or 1
+        worker_num = max(1, min(worker_num, len(sources)))
+
+        if worker_num == 1:
+            return self._get_accessible_node_ids(an, sources)
+
+        block_size = (len(sources) + worker_num - 1) // worker_num
+        with ThreadPoolExecutor(max_workers=worker_num) as executor:
+            futures = [
+                executor.submit(self._get_accessible_node_ids,
+                                _get_worker_network(an),
+                                sources[i:i+block_size])
+                for i in range(0, len(sources), block_size)
+            ]
+            return [x for f in futures for x in f.result()]
 
 
 class UI:
@@ -1408,9 +1774,17 @@ class UI:
         """ return the sequence of link IDs along the agent path """
         return self._base_assignment.get_agent_link_path(agent_id)
 
-    def find_path_for_agents(self):
-        """ find and set up shortest path for each agent """
-        return self._base_assignment.find_path_for_agents()
+    def find_path_for_agents(self, seed=None, worker_num=None):
+        """ find and set up shortest path for each agent
+
+        seed is for the random generator to set up origin nodes and
+        destination nodes of agents on the first call, which makes agents
+        reproducible.
+
+        Shortest paths from different origin nodes are calculated by
+        worker_num threads, which is the number of CPU cores if it is None.
+        """
+        return self._base_assignment.find_path_for_agents(seed, worker_num)
 
     def find_shortest_path(self, from_node_id, to_node_id, seq_type='node'):
         """ return shortest path between from_node_id and to_node_id
@@ -1483,4 +1857,31 @@ class UI:
         link_strs = ';'.join(str(x) for x in links)
 
         print(f'number of accessible links is {len(links)}')
-        print(f'accessible links are: {link_strs}')
\ No newline at end of file
+        print(f'accessible links are: {link_strs}')
+
+    def get_accessible_nodes_batch(self, source_node_ids, time_budgets,
+                                   mode='a', worker_num=None):
+        """ get the accessible nodes from each of multiple source nodes
+
+        Parameters
+        ----------
+        source_node_ids: the starting node ids for evaluation
+        time_budgets: the amount of time to travel in minutes, which can be \
+                      either a single one for all source nodes or a list with \
+                      one for each source node
+        mode: transportation mode, please choose one of the following three, \
+              'p', 'w', and 'b', which are in settings.yml.
+        worker_num: the number of threads to search from the source nodes \
+                    concurrently, which is the number of CPU cores if it is \
+                    None.
+
+        Outputs
+        -------
+        a list of accessible node ids for each source node
+        """
+        return self._base_assignment.get_accessible_nodes_batch(
+            source_node_ids,
+            time_budgets,
+            mode,
+            worker_num
+        )
\ No newline at end of file
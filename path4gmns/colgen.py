@@ -1,46 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
 from time import time
+
+import numpy as np
+
 from .path import single_source_shortest_path
+from .checkpoint import CheckpointWriter, get_checkpoint_arrays, \
+                        restore_checkpoint
 from .classes import Column
-from .consts import MIN_OD_VOL
+from .consts import CONGESTED_VOC, MAX_LABEL_COST, MIN_OD_VOL
+from .odme import PathIncidence, _get_measurements, _get_scipy, \
+                  _load_link_volumes, _od_adjust, \
+                  _od_adjust_with_line_search, _od_adjust_with_lsq, \
+                  _update_odme_estimates
 
 
 __all__ = ['perform_network_assignment']
 
 
-def _update_generalized_link_cost(spnetworks):
+def _update_generalized_link_cost(spnetworks, link_arrays):
     """ update generalized link costs for each SPNetwork
 
-    warning: there would be duplicate updates for SPNetworks with the same tau
-    and vot belonging to different memory blocks. It could be resolved by
-    creating a shared network among them??
+    SPNetworks with the same demand period, VOT, and mode (i.e., belonging to
+    different memory blocks) share one link cost array. Each shared array is
+    only updated once from link_arrays (see LinkArrays) using array
+    operations.
     """
+    updated_keys = set()
+
     for sp in spnetworks:
+        k = sp.get_link_cost_key()
+        if k in updated_keys:
+            continue
+
+        updated_keys.add(k)
+
         tau = sp.get_demand_period().get_id()
         vot = sp.get_agent_type().get_vot()
 
-        for link in sp.get_links():
-            sp.link_cost_array[link.get_seq_no()] = (
-            link.get_period_travel_time(tau)
-            + link.get_route_choice_cost()
-            + link.get_toll() / min(0.001, vot) * 60
-        )
+        # write through to the underlying ctypes array
+        link_costs = np.ctypeslib.as_array(sp.get_link_costs())
+        link_costs[:] = link_arrays.get_generalized_costs(tau, vot)
 
 
-def _update_link_travel_time_and_cost(links):
-    for link in links:
-        link.calculate_td_vdfunction()
-        # Peiheng, 04/05/21, not needed for the current implementation
-        # for dp in demand_periods:
-        #     tau = dp.get_id()
-        #     for at in agent_types:
-        #         link.calculate_agent_marginal_cost(tau, at)
+def _update_link_travel_time_and_cost(link_arrays):
+    link_arrays.update_travel_times()
+    # Peiheng, 04/05/21, not needed for the current implementation
+    # for dp in demand_periods:
+    #     tau = dp.get_id()
+    #     for at in agent_types:
+    #         link.calculate_agent_marginal_cost(tau, at)
 
 
 def _reset_and_update_link_vol_based_on_columns(column_pool,
                                                 links,
                                                 demand_periods,
                                                 iter_num,
-                                                is_path_vol_self_reducing):
+                                                is_path_vol_self_reducing,
+                                                active_origs=None):
+    """ reset and update link volumes using column volumes
+
+    If is_path_vol_self_reducing is True, column volumes will be reduced by a
+    factor of iter_num / (iter_num + 1) to make room for the new shortest paths
+    except for those from origins not in active_origs, which will not be
+    processed in this iteration. active_origs as None stands for all origins.
+    """
 
     # the original implementation is iter_num < 0, which does not make sense
     if iter_num == 0:
@@ -79,26 +102,331 @@ def _reset_and_update_link_vol_based_on_columns(column_pool,
                 # )
 
             if not cv.is_route_fixed() and is_path_vol_self_reducing:
-                col.vol *= iter_num / (iter_num + 1)
+                if active_origs is None or k[:3] in active_origs:
+                    col.vol *= iter_num / (iter_num + 1)
+
+
+
+def _get_link_flows(links, demand_periods):
+    """ return link volumes by demand period as a 2-d array """
+    return np.array(
+        [[link.get_period_flow_vol(dp.get_id()) for link in links]
+         for dp in demand_periods],
+        dtype=float
+    )
+
+
+def _get_link_derivatives(link_arrays):
+    """ derivatives of link travel times with respect to link volumes
+
+    They are indexed by demand period first and then link seq no.
+    """
+    return link_arrays.get_derivatives().tolist()
+
+
+def _get_beckmann_obj(flows, vdf_arrays):
+    """ the Beckmann objective, i.e., the sum of integrals of BPR functions """
+    fftt, alpha, beta, cap = vdf_arrays
+    flows = np.maximum(flows, 0)
+
+    return np.sum(
+        fftt * (flows + alpha * cap / (beta + 1) * (flows / cap) ** (beta + 1))
+    )
+
+
+def _armijo_line_search(flows, dirs, vdf_arrays, sigma=0.0001, min_step=1/64):
+    """ find the step length along link volume changes dirs using Armijo rule
+
+    The step length starts from 1 and is halved until the Beckmann objective
+    decreases sufficiently. The step is rejected (i.e., 0 is returned) if dirs
+    is not a descent direction or the objective does not decrease
+    sufficiently even at min_step.
+    """
+    fftt, alpha, beta, cap = vdf_arrays
+    travel_times = fftt * (1 + alpha * (np.maximum(flows, 0) / cap) ** beta)
+
+    slope = np.sum(travel_times * dirs)
+    if slope >= 0:
+        return 0
+
+    obj = _get_beckmann_obj(flows, vdf_arrays)
+
+    step = 1
+    while step >= min_step:
+        if _get_beckmann_obj(flows + step * dirs, vdf_arrays) <= (
+            obj + sigma * step * slope
+        ):
+            return step
+
+        step /= 2
+
+    return 0
+
+
+def _apply_column_shifts(col_shifts, links, demand_periods, flow_deltas,
+                         vdf_arrays):
+    """ apply the proposed column volume shifts using Armijo line search
+
+    col_shifts is a list of (col, least_col, vol), where vol is the volume to
+    be shifted from col to least_col under the full step. The volume changes
+    on links under the full step are given by flow_deltas.
+
+    Return the step length.
+    """
+    step = _armijo_line_search(_get_link_flows(links, demand_periods),
+                               np.array(flow_deltas, dtype=float),
+                               vdf_arrays)
+
+    for col, least_col, vol in col_shifts:
+        col.set_switch_volume(vol * step)
+        col.vol = max(0, col.vol - col.get_switch_volume())
+        least_col.increase_volume(col.get_switch_volume())
+
+    return step
+
+
+def _apply_newton_shifts(shifts, least_col, links, tau, derivatives,
+                         vdf_arrays=None):
+    """ apply the projected Newton shifts of an OD pair
+
+    shifts is a list of (col, vol), where vol is the volume to be shifted from
+    col to least_col under the full step. If vdf_arrays is not None, the step
+    length is found by Armijo line search over links whose volumes change (see
+    _armijo_line_search()), and the shifts are dropped if the Beckmann
+    objective cannot be decreased.
+
+    Volumes, travel times, and derivatives of these links are updated right
+    away so that the step of the next OD pair is calculated using the link
+    costs after the shifts of this one (i.e., Gauss-Seidel rather than Jacobi).
+    """
+    # link volume changes under the full step
+    deltas = {}
+    for col, vol in shifts:
+        for i in col.links:
+            deltas[i] = deltas.get(i, 0) - vol
+
+    total_vol = sum(vol for _, vol in shifts)
+    for i in least_col.links:
+        deltas[i] = deltas.get(i, 0) + total_vol
+
+    step = 1 if total_vol else 0
+    if step and vdf_arrays is not None:
+        link_nos = list(deltas.keys())
+        step = _armijo_line_search(
+            np.array([links[i].flow_vol_by_period[tau] for i in link_nos]),
+            np.array(list(deltas.values())),
+            tuple(x[tau, link_nos] for x in vdf_arrays)
+        )
+
+    for col, vol in shifts:
+        col.set_switch_volume(vol * step)
+        col.vol = max(0, col.vol - col.get_switch_volume())
+
+    if not step:
+        return
+
+    least_col.increase_volume(total_vol * step)
+
+    for i, v in deltas.items():
+        if not v:
+            continue
+
+        link = links[i]
+        link.increase_period_flow_vol(tau, v * step)
+        link.travel_time_by_period[tau] = (
+            link.vdfperiods[tau].run_bpr(link.flow_vol_by_period[tau])
+        )
+        derivatives[tau][i] = link.get_period_travel_time_derivative(tau)
+
+
+def _get_newton_path_vol(col, least_col_links, derivatives):
+    """ column volume after the projected Newton step
+
+    The Hessian is approximated by the sum of derivatives of travel times on
+    links not shared by col and the column with the least gradient cost. If
+    it is zero, all volume on col is shifted.
+    """
+    hessian = sum(derivatives[i] for i in set(col.links) ^ least_col_links)
+    if hessian <= 0:
+        return 0
+
+    return max(
+        0, col.get_volume() - col.get_gradient_cost_abs_diff() / hessian
+    )
+
 
+def _update_od_gradient_cost_and_flow(cv, links, vot, tau, iter_num,
+                                      flow_deltas=None,
+                                      derivatives=None,
+                                      col_shifts=None,
+                                      vdf_arrays=None):
+    """ update gradient costs and volumes of columns between an OD pair
+
+    Return the gap of this OD pair and its least gradient cost.
+
+    Column volumes are shifted to the column with the least gradient cost
+    using a step size of 1 / (iter_num + 2) scaled by the relative cost
+    differences. If derivatives of link travel times (by demand period) are
+    given, the projected Newton step will be used instead, which updates link
+    volumes on its own (see _apply_newton_shifts() for vdf_arrays).
+
+    If flow_deltas is not None, the link volume changes caused by the column
+    volume changes will be accumulated to flow_deltas[tau].
+
+    If col_shifts is not None, column volumes will not be updated. Instead,
+    the proposed shifts will be appended to it for _apply_column_shifts().
+
+    flow_deltas and col_shifts only apply to the gradient step.
+    """
+    od_gap = 0
+
+    column_num = cv.get_column_num()
+    least_gradient_cost = 999999
+    least_gradient_cost_path_seq_no = -1
+    least_gradient_cost_path_node_sum = -1
+
+    for node_sum, col in cv.get_columns().items():
+        path_toll = 0
+        path_gradient_cost = 0
+        path_travel_time = 0
+        # i is link sequence no
+        for i in col.get_links():
+            path_toll += links[i].get_toll()
+            path_travel_time += (
+                links[i].travel_time_by_period[tau]
+            )
+            path_gradient_cost += (
+                links[i].get_generalized_cost(tau, vot)
+            )
+
+        col.set_toll(path_toll)
+        col.set_travel_time(path_travel_time)
+        col.set_gradient_cost(path_gradient_cost)
+
+        if column_num == 1:
+            least_gradient_cost = path_gradient_cost
+            break
+
+        if path_gradient_cost < least_gradient_cost:
+            least_gradient_cost = path_gradient_cost
+            least_gradient_cost_path_seq_no = col.get_seq_no()
+            least_gradient_cost_path_node_sum = node_sum
+
+    if column_num >= 2:
+        total_switched_out_path_vol = 0
+
+        least_col = cv.get_column(least_gradient_cost_path_node_sum)
+        # the projected Newton shifts, see _apply_newton_shifts()
+        newton_shifts = None
+        if derivatives is not None:
+            least_col_links = set(least_col.links)
+            newton_shifts = []
+
+        for col in cv.get_columns().values():
+            if col.get_seq_no() == least_gradient_cost_path_seq_no:
+                continue
+
+            col.set_gradient_cost_abs_diff(
+                col.get_gradient_cost() - least_gradient_cost
+            )
+            col.set_gradient_cost_rel_diff(
+                col.get_gradient_cost_abs_diff()
+                / max(0.0001, least_gradient_cost)
+            )
+
+            od_gap += (
+                col.get_gradient_cost_abs_diff() * col.get_volume()
+            )
+
+            previous_path_vol = col.get_volume()
+            if derivatives is None:
+                step_size = 1 / (iter_num + 2) * cv.get_od_volume()
+
+                path_vol = max(
+                    0,
+                    (previous_path_vol
+                     - step_size
+                     * col.get_gradient_cost_rel_diff())
+                )
+            else:
+                path_vol = _get_newton_path_vol(col,
+                                                least_col_links,
+                                                derivatives[tau])
+                newton_shifts.append((col, previous_path_vol - path_vol))
+                continue
+
+            if col_shifts is None:
+                col.vol = path_vol
+                col.set_switch_volume(previous_path_vol - col.get_volume())
+                switch_vol = col.get_switch_volume()
+            else:
+                switch_vol = previous_path_vol - path_vol
+                col_shifts.append((col, least_col, switch_vol))
+
+            total_switched_out_path_vol += switch_vol
+
+            if flow_deltas is not None and switch_vol:
+                for i in col.links:
+                    flow_deltas[tau][i] -= switch_vol
+
+        if newton_shifts is not None:
+            _apply_newton_shifts(newton_shifts, least_col, links, tau,
+                                 derivatives, vdf_arrays)
+            return od_gap, least_gradient_cost
+
+        if col_shifts is None:
+            least_col.increase_volume(total_switched_out_path_vol)
+
+        if flow_deltas is not None and total_switched_out_path_vol:
+            for i in least_col.links:
+                flow_deltas[tau][i] += total_switched_out_path_vol
+
+    return od_gap, least_gradient_cost
 
 
 def _update_column_gradient_cost_and_flow(column_pool,
                                           links,
+                                          link_arrays,
                                           agent_types,
                                           demand_periods,
-                                          iter_num):
+                                          iter_num,
+                                          newton=False,
+                                          vdf_arrays=None):
+    """ update gradient costs and volumes of all columns
+
+    If newton is True, column volumes will be updated using the projected
+    Newton step. If vdf_arrays is not None, the step will be further scaled
+    using Armijo line search, which is over all OD pairs for the gradient step
+    and over each OD pair for the projected Newton step.
+
+    Link volumes are not reloaded from column volumes on iteration 0 for the
+    plain gradient step. Both the projected Newton step and line search
+    update link volumes from the current ones, which must be consistent with
+    column volumes. Therefore, they are always reloaded for them.
+    """
+    reload_iter_num = iter_num
+    if newton or vdf_arrays is not None:
+        reload_iter_num = max(1, iter_num)
 
     _reset_and_update_link_vol_based_on_columns(column_pool,
                                                 links,
                                                 demand_periods,
-                                                iter_num,
+                                                reload_iter_num,
                                                 False)
 
-    _update_link_travel_time_and_cost(links)
+    _update_link_travel_time_and_cost(link_arrays)
+
+    derivatives = None
+    if newton:
+        derivatives = _get_link_derivatives(link_arrays)
+
+    flow_deltas = None
+    col_shifts = None
+    if vdf_arrays is not None and not newton:
+        flow_deltas = [[0] * len(links) for _ in demand_periods]
+        col_shifts = []
 
     total_gap = 0
-    # total_gap_count = 0
 
     for k, cv in column_pool.items():
         if cv.get_od_volume() <= 0:
@@ -108,100 +436,226 @@ def _update_column_gradient_cost_and_flow(column_pool,
         vot = agent_types[k[0]].get_vot()
         tau = k[1]
 
-        column_num = cv.get_column_num()
-        least_gradient_cost = 999999
-        least_gradient_cost_path_seq_no = -1
-        least_gradient_cost_path_node_sum = -1
-
-        for node_sum, col in cv.get_columns().items():
-            path_toll = 0
-            path_gradient_cost = 0
-            path_travel_time = 0
-            # i is link sequence no
-            for i in col.get_links():
-                path_toll += links[i].get_toll()
-                path_travel_time += (
-                    links[i].travel_time_by_period[tau]
-                )
-                path_gradient_cost += (
-                    links[i].get_generalized_cost(tau, vot)
-                )
+        od_gap, _ = _update_od_gradient_cost_and_flow(cv, links, vot, tau,
+                                                      iter_num,
+                                                      flow_deltas,
+                                                      derivatives,
+                                                      col_shifts,
+                                                      vdf_arrays)
+        total_gap += od_gap
 
-            col.set_toll(path_toll)
-            col.set_travel_time(path_travel_time)
-            col.set_gradient_cost(path_gradient_cost)
+    if col_shifts is not None:
+        step = _apply_column_shifts(col_shifts, links, demand_periods,
+                                    flow_deltas, vdf_arrays)
+        print(f'step length from line search: {step}')
 
-            if column_num == 1:
-                # total_gap_count += (
-                #     path_gradient_cost * col.get_volume()
-                # )
-                break
+    print(f'total gap: {total_gap:.2f}')
 
-            if path_gradient_cost < least_gradient_cost:
-                least_gradient_cost = path_gradient_cost
-                least_gradient_cost_path_seq_no = col.get_seq_no()
-                least_gradient_cost_path_node_sum = node_sum
 
-        if column_num >= 2:
-            total_switched_out_path_vol = 0
+def _is_od_converged(cv, od_gap, least_gradient_cost, tol, is_congested):
+    """ check if an OD pair can be dropped from the active set
 
-            for col in cv.get_columns().values():
-                if col.get_seq_no() == least_gradient_cost_path_seq_no:
-                    continue
+    It requires that the relative gap of this OD pair is no greater than tol,
+    and none of its columns goes through any congested link (i.e.,
+    is_congested is False).
+    """
+    if is_congested:
+        return False
 
-                col.set_gradient_cost_abs_diff(
-                    col.get_gradient_cost() - least_gradient_cost
-                )
-                col.set_gradient_cost_rel_diff(
-                    col.get_gradient_cost_abs_diff()
-                    / max(0.0001, least_gradient_cost)
-                )
+    rel_gap = od_gap / max(0.0001, least_gradient_cost * cv.get_od_volume())
+    return rel_gap <= tol
 
-                total_gap += (
-                    col.get_gradient_cost_abs_diff() * col.get_volume()
-                )
 
-                # total_gap_count += (
-                #     col.get_gradient_cost() * col.get_volume()
-                # )
+def _optimize_column_pool_with_active_set(column_pool,
+                                          links,
+                                          link_arrays,
+                                          agent_types,
+                                          demand_periods,
+                                          colum_update_num,
+                                          tol,
+                                          newton=False,
+                                          vdf_arrays=None):
+    """ optimize column pool only over OD pairs in the active set
+
+    An OD pair is dropped from the active set once it converges (see
+    _is_od_converged()), and its columns are frozen. It re-enters the active
+    set if the travel time of any link on its columns changes by more than tol
+    (relatively) since it was dropped. Both are checked for all OD pairs at
+    once in each iteration using link travel times and volume over capacity
+    ratios as arrays.
+
+    Link volumes are updated incrementally using volume changes from active OD
+    pairs only. Therefore, the cost of each iteration scales with the number
+    of active OD pairs rather than all OD pairs.
+
+    See _update_column_gradient_cost_and_flow() for newton and vdf_arrays.
+    """
+    link_size = len(links)
+    # ordered set of active OD pairs, i.e., k = (at, dp, oz, dz)
+    active = {k: None for k, cv in column_pool.items() if cv.get_od_volume() > 0}
+    od_keys = list(active.keys())
+    od_nos = {k: i for i, k in enumerate(od_keys)}
+    od_gaps = {}
+
+    # (tau, link no) on columns of each OD pair flattened by OD no, which do
+    # not change as no column is added here
+    od_links = [
+        np.unique(np.fromiter(
+            (j for col in column_pool[k].get_columns().values()
+             for j in col.links),
+            dtype=np.int64
+        ))
+        for k in od_keys
+    ]
+    link_starts = np.cumsum([0] + [len(x) for x in od_links])
+    link_od_nos = np.repeat(np.arange(len(od_keys)), np.diff(link_starts))
+    link_taus = np.array([k[1] for k in od_keys], dtype=np.int64)[link_od_nos]
+    link_nos = np.concatenate(od_links + [np.zeros(0, dtype=np.int64)])
+
+    # OD pairs dropped from the active set and the travel times of the above
+    # links when they were dropped
+    dropped = np.zeros(len(od_keys), dtype=bool)
+    ref_travel_times = np.zeros(len(link_nos))
 
-                step_size = 1 / (iter_num + 2) * cv.get_od_volume()
+    for i in range(colum_update_num):
+        print(f"current iteration number in column generation: {i}")
 
-                previous_path_vol = col.get_volume()
-                col.vol = max(
-                    0,
-                    (previous_path_vol
-                     - step_size
-                     * col.get_gradient_cost_rel_diff())
-                )
+        # be consistent with _update_column_gradient_cost_and_flow(), which
+        # does not reload link volumes on iteration 0 for the plain gradient
+        # step
+        if i == 0 and (newton or vdf_arrays is not None):
+            _reset_and_update_link_vol_based_on_columns(column_pool,
+                                                        links,
+                                                        demand_periods,
+                                                        1,
+                                                        False)
+        elif i <= 1:
+            _reset_and_update_link_vol_based_on_columns(column_pool,
+                                                        links,
+                                                        demand_periods,
+                                                        i,
+                                                        False)
+
+        _update_link_travel_time_and_cost(link_arrays)
+
+        # both of the following are evaluated once in this iteration for all
+        # OD pairs using link travel times and volume over capacity ratios
+        # from above
+        travel_times = link_arrays.get_travel_times()[link_taus, link_nos]
+
+        # bring back OD pairs with significant travel time changes on any
+        # link of their columns since they were dropped
+        changed = (np.abs(travel_times - ref_travel_times)
+                   > tol * np.maximum(0.0001, ref_travel_times))
+        reentered = dropped & (
+            np.bincount(link_od_nos, weights=changed,
+                        minlength=len(od_keys)) > 0
+        )
+        for od_no in np.flatnonzero(reentered).tolist():
+            active[od_keys[od_no]] = None
+        dropped &= ~reentered
+
+        # whether any column of each OD pair goes through congested links
+        congested = np.bincount(
+            link_od_nos,
+            weights=link_arrays.get_vocs()[link_taus, link_nos] > CONGESTED_VOC,
+            minlength=len(od_keys)
+        ) > 0
+
+        derivatives = None
+        if newton:
+            derivatives = _get_link_derivatives(link_arrays)
+
+        # the projected Newton step updates link volumes on its own, see
+        # _update_od_gradient_cost_and_flow()
+        flow_deltas = None
+        col_shifts = None
+        if not newton:
+            flow_deltas = [[0] * link_size for _ in demand_periods]
+            if vdf_arrays is not None:
+                col_shifts = []
+
+        for k in list(active.keys()):
+            cv = column_pool[k]
+            vot = agent_types[k[0]].get_vot()
+            tau = k[1]
+
+            od_gap, least_cost = _update_od_gradient_cost_and_flow(
+                cv, links, vot, tau, i, flow_deltas, derivatives, col_shifts,
+                vdf_arrays
+            )
+            od_gaps[k] = od_gap
 
-                col.set_switch_volume(previous_path_vol - col.get_volume())
-                total_switched_out_path_vol += col.get_switch_volume()
+            od_no = od_nos[k]
+            if not _is_od_converged(cv, od_gap, least_cost, tol,
+                                    congested[od_no]):
+                continue
 
-        if least_gradient_cost_path_seq_no != -1:
-            col = cv.get_column(least_gradient_cost_path_node_sum)
-            col.increase_volume(total_switched_out_path_vol)
-            # total_gap_count += (
-            #     col.get_gradient_cost() * col.get_volume()
-            # )
+            del active[k]
+            dropped[od_no] = True
+            j, j_ = link_starts[od_no], link_starts[od_no+1]
+            ref_travel_times[j:j_] = travel_times[j:j_]
 
-    print(f'total gap: {total_gap:.2f}')
-    # print(f'total gap count is: {total_gap_count:.2f}')
+        step = 1
+        if col_shifts is not None:
+            step = _apply_column_shifts(col_shifts, links, demand_periods,
+                                        flow_deltas, vdf_arrays)
+            print(f'step length from line search: {step}')
+
+        if flow_deltas is not None:
+            for dp in demand_periods:
+                tau = dp.get_id()
+                for j, v in enumerate(flow_deltas[tau]):
+                    if v:
+                        links[j].increase_period_flow_vol(tau, v * step)
+
+        print(f'total gap: {sum(od_gaps.values()):.2f} '
+              f'(active OD pairs: {len(active)} out of {len(od_gaps)})')
 
 
 def _optimize_column_pool(column_pool,
                           links,
+                          link_arrays,
                           agent_types,
                           demand_periods,
-                          colum_update_num):
+                          colum_update_num,
+                          active_set=False,
+                          active_set_tol=0.001,
+                          flow_update='gradient',
+                          line_search=False):
+
+    if flow_update not in ['gradient', 'newton']:
+        raise Exception('Please choose correct flow update method: '
+                        +'gradient or newton')
+
+    newton = flow_update == 'newton'
+
+    vdf_arrays = None
+    if line_search:
+        vdf_arrays = link_arrays.get_vdf_arrays()
+
+    if active_set:
+        _optimize_column_pool_with_active_set(column_pool,
+                                              links,
+                                              link_arrays,
+                                              agent_types,
+                                              demand_periods,
+                                              colum_update_num,
+                                              active_set_tol,
+                                              newton,
+                                              vdf_arrays)
+        return
 
     for i in range(colum_update_num):
         print(f"current iteration number in column generation: {i}")
         _update_column_gradient_cost_and_flow(column_pool,
                                               links,
+                                              link_arrays,
                                               agent_types,
                                               demand_periods,
-                                              i)
+                                              i,
+                                              newton,
+                                              vdf_arrays)
 
 
 def _backtrace_shortest_path_tree(orig_node_no,
@@ -213,8 +667,13 @@ def _backtrace_shortest_path_tree(orig_node_no,
                                   agent_type,
                                   demand_period,
                                   column_pool,
-                                  iter_num):
+                                  iter_num,
+                                  min_costs=None):
+    """ set up columns from the shortest path tree rooted at orig_node_no
 
+    If min_costs is not None, it will be updated with the minimum label cost
+    to each destination zone, which is needed to calculate the origin gap.
+    """
     if not nodes[orig_node_no].has_outgoing_links():
         return
 
@@ -241,6 +700,10 @@ def _backtrace_shortest_path_tree(orig_node_no,
         if od_vol <= MIN_OD_VOL:
             continue
 
+        if min_costs is not None:
+            if node_label_costs[i] < min_costs.get(dz_id, MAX_LABEL_COST):
+                min_costs[dz_id] = node_label_costs[i]
+
         vol = od_vol * k_path_prob
 
         node_path = []
@@ -292,29 +755,117 @@ def _update_column_travel_time(column_pool, links):
             )
             col.set_travel_time(travel_time)
 
-def _assignment_core(spn, column_pool, iter_num):
-
-    for node_id in spn.get_orig_nodes():
-        single_source_shortest_path(spn, node_id)
-
-        _backtrace_shortest_path_tree(spn.get_node_no(node_id),
-                                      spn.get_nodes(),
-                                      spn.get_links(),
-                                      spn.get_node_preds(),
-                                      spn.get_link_preds(),
-                                      spn.get_node_label_costs(),
-                                      spn.get_agent_type().get_id(),
-                                      spn.get_demand_period().get_id(),
-                                      column_pool,
-                                      iter_num)
-
-def _assignment(spnetworks, column_pool, iter_num):
-    # single processing
-    # it could be multiprocessing
-    for spn in spnetworks:
-        _assignment_core(spn, column_pool, iter_num)
-
-def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui):
+def _update_orig_gap(orig, min_costs, link_costs, column_pool, orig_gaps):
+    """ update the gap of an origin given orig = (at, dp, oz)
+
+    It is the sum of volume-weighted differences between each column and the
+    shortest path to the same destination zone under the current generalized
+    link costs, i.e., the contribution of this origin to the total gap.
+    """
+    gap = 0
+    for dz_id, min_cost in min_costs.items():
+        cv = column_pool[orig + (dz_id,)]
+        for col in cv.get_columns().values():
+            path_cost = sum(link_costs[j] for j in col.links)
+            gap += col.get_volume() * max(0, path_cost - min_cost)
+
+    orig_gaps[orig] = gap
+
+
+def _get_active_origs(orig_gaps, gap_threshold, iter_num, full_sweep_freq):
+    """ return origins (at, dp, oz) to be processed in the current iteration
+
+    They are origins whose shares of the total gap are no less than
+    gap_threshold. None is returned for a full sweep over all origins, which
+    is performed on every full_sweep_freq iterations or if origin gaps are not
+    available yet.
+    """
+    if not orig_gaps:
+        return None
+
+    if full_sweep_freq <= 1 or iter_num % full_sweep_freq == 0:
+        return None
+
+    total_gap = sum(orig_gaps.values())
+
+    return {
+        k for k, v in orig_gaps.items()
+        if v > 0 and v >= gap_threshold * total_gap
+    }
+
+
+def _assignment_core(spn, column_pool, iter_num,
+                     orig_gaps=None, active_origs=None):
+
+    at_id = spn.get_agent_type().get_id()
+    dp_id = spn.get_demand_period().get_id()
+
+    for oz_id in spn.get_orig_zones():
+        orig = (at_id, dp_id, oz_id)
+        if active_origs is not None and orig not in active_origs:
+            continue
+
+        min_costs = {} if orig_gaps is not None else None
+
+        for node_id in spn.get_orig_nodes_from_zone(oz_id):
+            single_source_shortest_path(spn, node_id)
+
+            _backtrace_shortest_path_tree(spn.get_node_no(node_id),
+                                          spn.get_nodes(),
+                                          spn.get_links(),
+                                          spn.get_node_preds(),
+                                          spn.get_link_preds(),
+                                          spn.get_node_label_costs(),
+                                          at_id,
+                                          dp_id,
+                                          column_pool,
+                                          iter_num,
+                                          min_costs)
+
+        if orig_gaps is not None:
+            _update_orig_gap(orig, min_costs, spn.get_link_costs(),
+                             column_pool, orig_gaps)
+
+
+def _assignment(spnetworks, column_pool, iter_num, worker_num=1,
+                orig_gaps=None, active_origs=None):
+    """ generate columns from each SPNetwork
+
+    SPNetworks never share any ColumnVec as their origin zones are disjoint.
+    Therefore, they can be processed concurrently by worker_num threads. Note
+    that only shortest path calculations in the C++ path engine, which
+    releases the GIL, overlap with each other. Backtracking shortest path trees
+    into columns is Python code holding the GIL, which bounds the speedup by
+    the share of time spent in the path engine.
+
+    If orig_gaps is not None, it will be updated with the gap of each processed
+    origin. Only origins in active_origs will be processed unless it is None.
+    """
+    if worker_num <= 1:
+        for spn in spnetworks:
+            _assignment_core(spn, column_pool, iter_num,
+                             orig_gaps, active_origs)
+        return
+
+    with ThreadPoolExecutor(max_workers=worker_num) as executor:
+        futures = [
+            executor.submit(_assignment_core, spn, column_pool, iter_num,
+                            orig_gaps, active_origs)
+            for spn in spnetworks
+        ]
+        # propagate exceptions if any
+        for f in futures:
+            f.result()
+
+def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui,
+                                orig_gap_threshold=0, full_sweep_freq=5,
+                                active_set=False, active_set_tol=0.001,
+                                flow_update='gradient', line_search=False,
+                                checkpoint_dir=None, checkpoint_freq=1,
+                                resume_from=None, odme_tol=0,
+                                odme_line_search=False,
+                                odme_solver='gradient',
+                                odme_seed_weight=0.01):
     """ perform network assignemnt using the selected assignment mode
 
     WARNING
@@ -337,10 +888,80 @@ def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui
         number of iterations to be performed on optimizing column pool
     ui
         network object generated by pg.read_demand()
+    orig_gap_threshold
+        if it is positive, shortest path trees in assignment iterations
+        will be only rebuilt for origins whose shares of the total gap are no
+        less than orig_gap_threshold, while column volumes from the other
+        origins stay unchanged. The default is 0, i.e., all origins are
+        processed in every assignment iteration.
+    full_sweep_freq
+        the frequency (in number of assignment iterations) to process all
+        origins if orig_gap_threshold is positive
+    active_set
+        if it is True, only OD pairs which are not converged (i.e., relative
+        gap greater than active_set_tol) or have congested links on their
+        columns will be updated in optimizing column pool. A converged OD pair
+        will be updated again once the travel time of any link on its columns
+        changes by more than active_set_tol (relatively).
+    active_set_tol
+        the tolerance used in the active set strategy
+    flow_update
+        the method to shift column volumes in optimizing column pool.
+        'gradient': the step size of 1 / (k + 2) scaled by the relative cost
+                    difference, where k is the iteration number. It is the
+                    default.
+        'newton': the projected Newton step using derivatives of BPR
+                  functions. As all OD pairs are updated simultaneously,
+                  it shall be used along with line_search to avoid
+                  oscillation.
+    line_search
+        if it is True, the column volume shifts in each iteration of
+        optimizing column pool will be scaled using Armijo line search on the
+        Beckmann objective
+    checkpoint_dir
+        if it is not None, a checkpoint (i.e., checkpoint.npz) will be written
+        to checkpoint_dir on a background thread after every checkpoint_freq
+        assignment iterations (assignment_mode 1) or ODME iterations
+        (assignment_mode 3)
+    checkpoint_freq
+        the frequency (in number of iterations) to write checkpoints
+    resume_from
+        the path to a checkpoint from the same assignment mode and network.
+        The assignment will continue from where the checkpoint was taken and
+        reproduce the uninterrupted run as long as the other arguments are
+        unchanged.
+    odme_tol
+        ODME (assignment_mode 3) stops once the relative gap, i.e., the total
+        absolute deviation over the total observation on all measurements,
+        is no greater than odme_tol. The default is 0, i.e., all iter_num
+        iterations will be performed.
+    odme_line_search
+        if it is True, column volumes in each ODME iteration will be updated
+        along their gradients with the step length from line search on the
+        sum of squared deviations on all measurements. Otherwise, the step
+        size is fixed at 0.01 and the change of each column volume is bounded
+        by 5% of its current volume. It only applies to the gradient solver.
+    odme_solver
+        the method to update column volumes in each ODME iteration.
+        'gradient': gradient steps (see odme_line_search). It is the default.
+        'lsq': solve the bounded least-squares problem of deviations on all
+               measurements and from the seed demand (see odme_seed_weight)
+               over OD volumes using L-BFGS-B from scipy, where the volume
+               of each OD pair is split among its columns as they are. It is
+               followed by column_update_num iterations of column updates to
+               re-equilibrate column volumes of each OD pair. Column
+               generation between ODME iterations is the same as
+               odme_line_search. It falls back to gradient steps with line
+               search if scipy is not installed.
+    odme_seed_weight
+        the weight of the sum of squared deviations of OD volumes from the
+        seed demand relative to that on all measurements in the lsq solver.
+        The seed demand is not used if it is 0.
 
     Outputs
     -------
-    None
+    None for assignment_mode 1, and the total absolute deviation of each ODME
+    iteration for assignment_mode 3
 
         You will need to call output_columns() and output_link_performance() to
         get the assignment results, i.e., paths/columns (in agent.csv) and
@@ -356,6 +977,7 @@ def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui
     A = ui._base_assignment
     network=A.get_network()
     links = A.get_links()
+    link_arrays = network.get_link_arrays()
     nodes =A.get_nodes()
     zones=A.get_zones()
 
@@ -365,26 +987,62 @@ def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui
 
     st = time()
 
+    writer = None
+    if checkpoint_dir is not None:
+        writer = CheckpointWriter(checkpoint_dir)
+
     if assignment_mode == 1:    #path-based ue 
-        for i in range(iter_num):
+        # key: (at, dp, oz), value: gap of this origin
+        orig_gaps = {} if orig_gap_threshold > 0 else None
+
+        start_iter = 0
+        if resume_from is not None:
+            start_iter, saved_orig_gaps, _, _ = restore_checkpoint(
+                A, resume_from, assignment_mode
+            )
+            if orig_gaps is not None and saved_orig_gaps is not None:
+                orig_gaps.update(saved_orig_gaps)
+
+        for i in range(start_iter, iter_num):
             print(f"current iteration number in assignment: {i}")
-            _update_link_travel_time_and_cost(links)
+            _update_link_travel_time_and_cost(link_arrays)
+
+            active_origs = _get_active_origs(orig_gaps,
+                                             orig_gap_threshold,
+                                             i,
+                                             full_sweep_freq)
+            if active_origs is not None:
+                print(f'origins to be processed: {len(active_origs)} '
+                      f'out of {len(orig_gaps)}')
 
             _reset_and_update_link_vol_based_on_columns(column_pool,
                                                         links,
                                                         dps,
                                                         i,
-                                                        True)
+                                                        True,
+                                                        active_origs)
 
             # update generalized link cost before assignment
-            _update_generalized_link_cost(A.get_spnetworks())
+            _update_generalized_link_cost(A.get_spnetworks(), link_arrays)
 
             # loop through all nodes on the base network
-            _assignment(A.get_spnetworks(), column_pool, i)
+            _assignment(A.get_spnetworks(), column_pool, i,
+                        A.get_memory_blocks(), orig_gaps, active_origs)
+
+            if writer is not None and (i + 1) % checkpoint_freq == 0:
+                writer.write(
+                    get_checkpoint_arrays(A, assignment_mode, i + 1, orig_gaps)
+                )
+
+        if writer is not None:
+            writer.wait()
 
         print(f'\nprocessing time of assignment: {time()-st:.2f} s')
 
-        _optimize_column_pool(column_pool, links, ats, dps, column_update_num)
+        _optimize_column_pool(column_pool, links, link_arrays, ats, dps,
+                              column_update_num,
+                              active_set, active_set_tol,
+                              flow_update, line_search)
 
         _reset_and_update_link_vol_based_on_columns(column_pool,
                                                     links,
@@ -392,30 +1050,102 @@ def  perform_network_assignment(assignment_mode, iter_num, column_update_num, ui
                                                     iter_num,
                                                     False)
 
-        _update_link_travel_time_and_cost(links)
+        _update_link_travel_time_and_cost(link_arrays)
 
         _update_column_travel_time(column_pool, links)
 
     elif assignment_mode == 3:  #ODEM
-        #read measurement and perform traffic assignment
-        perform_network_assignment(1, 1, column_update_num, ui)
-        #loop for adjusting OD demand
-        for s in range(iter_num):
-            total_gap = 0
-            total_relative_gap = 0
-            total_gap_count = 0
+        if odme_solver not in ['gradient', 'lsq']:
+            raise Exception('Please choose correct ODME solver: '
+                            +'gradient or lsq')
+
+        sp = opt = None
+        if odme_solver == 'lsq':
+            sp, opt = _get_scipy()
+            odme_line_search = True
+
+        # total gap of each ODME iteration
+        history = []
+
+        start_iter = 0
+        path_od_keys = None
+        if resume_from is not None:
+            start_iter, _, history, path_od_keys = restore_checkpoint(
+                A, resume_from, assignment_mode
+            )
+        else:
+            #read measurement and perform traffic assignment
+            perform_network_assignment(1, 1, column_update_num, ui)
+
+        measurements = _get_measurements(links, zones,
+                                         network.zone_id_to_zone_dict)
+        incidence = PathIncidence(zones, len(links), len(dps),
+                                  measurements[0] > 0)
+        if path_od_keys is not None:
+            # index columns in the same order as before the interruption
+            incidence.update(column_pool, path_od_keys)
+        incidence.update(column_pool)
 
+        #loop for adjusting OD demand
+        for s in range(start_iter, iter_num):
             #we can have a recursive formulat to reupdate the current link volume by a factor of k/(k+1),
             #and use the newly generated path flow to add the additional 1/(k+1)
-            _reset_and_update_link_volume_based_on_ODME_columns(column_pool,nodes,links,zones,network.zone_to_nodes_dict,
-                                                dps,ats,s,network.zone_id_to_zone_dict)
+            total_gap, rel_gap, devs = _update_odme_estimates(
+                incidence, measurements, links, network.zone_id_to_zone_dict, s
+            )
+            history.append(total_gap)
+            if rel_gap <= odme_tol:
+                print(f'ODME converged at iter {s}')
+                break
+
             #based on newly calculated path volumn, update volume based travel time, and update volume based measurement error/deviation
-            _update_link_travel_time_and_cost(links)
+            _update_link_travel_time_and_cost(link_arrays)
+            if odme_line_search:
+                _update_generalized_link_cost(A.get_spnetworks(), link_arrays)
+                col_vols = incidence.get_volumes()
             #calculate shortest path at inner iteration of column flow updating
-            _assignment(A.get_spnetworks(), column_pool, 1)
- 
-            _od_adjust(column_pool,nodes,links,network.zone_to_nodes_dict,s,network.zone_id_to_zone_dict)
+            _assignment(A.get_spnetworks(), column_pool, 1,
+                        A.get_memory_blocks())
+
+            # index new columns from column generation above
+            incidence.update(column_pool)
+            if odme_line_search:
+                # column generation only adds new columns with zero volume,
+                # and column volumes are left to line search
+                incidence.set_volumes(
+                    np.concatenate((col_vols,
+                                    np.zeros(incidence.get_path_num()
+                                             - len(col_vols))))
+                )
+                if sp is not None:
+                    res = _od_adjust_with_lsq(incidence, measurements, sp, opt,
+                                              odme_seed_weight)
+                    print(f'least-squares solver: {res.message}')
+                    # re-equilibrate under the new OD volumes, whose link
+                    # volumes are loaded first as the first column update
+                    # takes travel times from the current link volumes
+                    _load_link_volumes(incidence, links,
+                                       incidence.get_volumes())
+                    _optimize_column_pool(column_pool, links, link_arrays,
+                                          ats, dps, column_update_num)
+                else:
+                    steps = _od_adjust_with_line_search(incidence,
+                                                        measurements)
+                    print(f'gradient steps with line search: {len(steps)}')
+            else:
+                _od_adjust(incidence, devs)
+
+            if writer is not None and (s + 1) % checkpoint_freq == 0:
+                writer.write(
+                    get_checkpoint_arrays(A, assignment_mode, s + 1,
+                                          history=history,
+                                          incidence=incidence)
+                )
 
+        if writer is not None:
+            writer.wait()
+
+        return history
 
     else:
         raise Exception("not implemented yet")
@@ -426,6 +1156,7 @@ def update_links_using_columns(network):
 
     column_pool = A.get_column_pool()
     links = A.get_links()
+    link_arrays = A.get_network().get_link_arrays()
     dps = A.get_demand_periods()
 
     # do not update column volume
@@ -435,115 +1166,4 @@ def update_links_using_columns(network):
                                                 1,
                                                 False)
 
-    _update_link_travel_time_and_cost(links)
-
-def _reset_and_update_link_volume_based_on_ODME_columns(column_pool,nodes,links,zones,zone_to_node_dict,
-                                                       demand_periods,agent_types,iter_num,zone_id_to_zone_dict):
-    total_gap = 0
-    sub_total_gap_link_count = 0
-    sub_total_gap_P_count = 0
-    sub_total_gap_A_count = 0
-
-    link_size=len(links)
-    #reset the link volume
-    for link in links:
-        for dperiod in demand_periods:
-            tau = dperiod.get_id()
-            link.reset_period_flow_vol(tau)
-
-    #reset the estimated production and attraction
-    for zone in zones:
-        zone_id_to_zone_dict[zone].est_attraction = 0
-        zone_id_to_zone_dict[zone].est_production = 0
-
-
-    for k, cv in column_pool.items():
-        if cv.get_od_volume() <= 0:
-            continue
-        # k= (at, tau, oz_id, dz_id)
-        tau = k[1]
-        o_zone= k[2]
-        d_zone= k[3]
-
-        for col in cv.get_columns().values():
-            link_vol_contributed_by_path_vol = col.get_volume()
-            zone_id_to_zone_dict[o_zone].est_production+=link_vol_contributed_by_path_vol
-            zone_id_to_zone_dict[d_zone].est_attraction+=link_vol_contributed_by_path_vol
-
-            for i in col.links:
-                pce_ratio = 1
-                links[i].increase_period_flow_vol(
-                    tau,
-                    link_vol_contributed_by_path_vol * pce_ratio
-                )
-
-    #calcualte deviation for each measurement type
-    for link in links:
-        link.calculate_td_vdfunction()
-        if link.obs_count>0:  #with data
-            tau = 0
-            link.est_count_dev = link.flow_vol_by_period[tau] - link.obs_count
-            total_gap += abs(link.est_count_dev)
-            sub_total_gap_link_count += link.est_count_dev / link.obs_count
-
-    for zone in zones:
-        if zone_id_to_zone_dict[zone].obs_attraction >0:
-            zone_id_to_zone_dict[zone].est_attraction_dev=zone_id_to_zone_dict[zone].obs_attraction-zone_id_to_zone_dict[zone].est_attraction
-            total_gap+=abs(zone_id_to_zone_dict[zone].est_attraction_dev)
-            sub_total_gap_A_count+=zone_id_to_zone_dict[zone].est_attraction_dev/zone_id_to_zone_dict[zone].obs_attraction
-        if zone_id_to_zone_dict[zone].obs_production >0:
-            zone_id_to_zone_dict[zone].est_production_dev=zone_id_to_zone_dict[zone].obs_production-zone_id_to_zone_dict[zone].est_production
-            total_gap+=abs(zone_id_to_zone_dict[zone].est_production_dev)
-            sub_total_gap_P_count+=zone_id_to_zone_dict[zone].est_production_dev/zone_id_to_zone_dict[zone].obs_production
-
-    print("ODME adjust iter {0}: total abs gap= {1}, sub link gap= {2}, sub production gap= {3}, sub attraction gap= {4}".format(iter_num,
-                  total_gap,sub_total_gap_link_count*100,sub_total_gap_P_count*100,sub_total_gap_A_count*100))
-
-def _od_adjust(column_pool,nodes,links,zone_to_node_dict,iter_num,zone_id_to_zone_dict):
-
-    for k, cv in column_pool.items():
-        if cv.get_od_volume() <= 0:
-            continue
-        # k= (at, tau, oz_id, dz_id)
-        tau = k[1]
-        o_zone= k[2]
-        d_zone= k[3]
-
-        for col in cv.get_columns().values():
-            path_gradient_cost = 0
-            path_distance = 0
-            path_travel_time = 0
-
-            #origin production flow gradient
-            if zone_id_to_zone_dict[o_zone].obs_production >0:
-                path_gradient_cost += zone_id_to_zone_dict[o_zone].est_production_dev
-
-            #destination attraction flow gradient
-            if zone_id_to_zone_dict[d_zone].obs_attraction >0:
-                path_gradient_cost += zone_id_to_zone_dict[d_zone].est_attraction_dev
-           
-            #link flow gradient
-            for i in col.links:
-                if links[i].obs_count>0:
-                    path_gradient_cost+=links[i].est_count_dev
-
-            col.path_gradient_cost=path_gradient_cost
-            step_size = 0.01
-            prev_path_volume = col.vol
-            change = step_size * col.path_gradient_cost
-            change_lower_bound = col.vol * 0.05 * (-1)
-            change_upper_bound = col.vol * 0.05 
-
-            #reset
-            if (change < change_lower_bound):
-                change = change_lower_bound
-            #reset
-            if (change > change_upper_bound):
-                change = change_upper_bound
-
-            col.vol = max(1, col.vol - change);
-
-
-
-
-
+    _update_link_travel_time_and_cost(link_arrays)
@@ -3,6 +3,12 @@
 MAX_LABEL_COST = 99999
 # for column generation
 MIN_OD_VOL = 0.000001
+# volume over capacity ratio above which a link is regarded as congested
+CONGESTED_VOC = 1
+# for network snapshot, bump it whenever the snapshot format changes
+SNAPSHOT_VERSION = 4
+# for checkpoints, bump it whenever the checkpoint format changes
+CHECKPOINT_VERSION = 3
 # for accessibility evaluation
 MIN_TIME_BUDGET = 10
 MAX_TIME_BUDGET = 240
@@ -6,21 +6,35 @@ from sys import platform
 __all__ = ['perform_network_assignment_DTALite']
 
 
-if platform.startswith('win32'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/DTALite.dll')
-elif platform.startswith('linux'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/DTALite.so')
-elif platform.startswith('darwin'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/DTALite.dylib')
-else:
-    raise Exception('Please build the shared library compatible to your OS\
-                    using source files')
+# DTALite will be loaded on first use, see _get_dtalite_engine()
+_dtalite_engine = None
 
-_dtalite_engine = ctypes.cdll.LoadLibrary(_dll_file)
 
-_dtalite_engine.network_assignment.argtypes = [ctypes.c_int,
-                                               ctypes.c_int,
-                                               ctypes.c_int]
+def _get_dtalite_engine():
+    """ return DTALite and load it if it has not been loaded """
+    global _dtalite_engine
+
+    if _dtalite_engine is not None:
+        return _dtalite_engine
+
+    if platform.startswith('win32'):
+        dll_file = os.path.join(os.path.dirname(__file__), 'bin/DTALite.dll')
+    elif platform.startswith('linux'):
+        dll_file = os.path.join(os.path.dirname(__file__), 'bin/DTALite.so')
+    elif platform.startswith('darwin'):
+        dll_file = os.path.join(os.path.dirname(__file__),
+                                'bin/DTALite.dylib')
+    else:
+        raise Exception('Please build the shared library compatible to your OS\
+                        using source files')
+
+    _dtalite_engine = ctypes.cdll.LoadLibrary(dll_file)
+
+    _dtalite_engine.network_assignment.argtypes = [ctypes.c_int,
+                                                   ctypes.c_int,
+                                                   ctypes.c_int]
+
+    return _dtalite_engine
 
 
 def perform_network_assignment_DTALite(assignment_mode,
@@ -67,8 +81,8 @@ def perform_network_assignment_DTALite(assignment_mode,
 
     print('\nDTALite run starts')
 
-    _dtalite_engine.network_assignment(assignment_mode,
-                                       iter_num,
-                                       column_update_num)
+    _get_dtalite_engine().network_assignment(assignment_mode,
+                                             iter_num,
+                                             column_update_num)
 
     print('\nDTALite run completes')
\ No newline at end of file
@@ -0,0 +1,747 @@
+""" origin-destination matrix estimation (ODME)
+
+Column volumes are adjusted to reduce the deviations between the estimated and
+the observed link counts, zonal productions, and zonal attractions. Columns are
+indexed by PathIncidence so that link volumes, productions, and attractions can
+be loaded from column volumes, and gradients of column volumes can be
+calculated from deviations, using array operations.
+
+Link counts are observed by demand period, and their deviations are kept as
+arrays indexed by demand period and link no so that all demand periods are
+adjusted together in one run.
+
+ODME on different seed demands and measurements of the same network can be
+performed in batch by perform_odme_batch(), which loads the network only once.
+"""
+
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+__all__ = ['perform_odme_batch']
+
+
+# the network shared by worker processes of perform_odme_batch()
+_batch_ui = None
+
+
+class PathIncidence:
+    """ path-link incidence and path-OD mappings of columns in column pool
+
+    Columns are indexed by path no in the order they are indexed. Links of
+    each column are stored in CSR format, i.e., links of path no i are
+    link_nos[link_ptr[i]:link_ptr[i+1]]. Columns are only indexed once, and
+    update() shall be called to index new columns after column generation.
+
+    The gradient of each column only involves links on it observed in its
+    demand period as well as its origin and destination zones. They are kept
+    in a separate index, where the entries of each column are its origin zone,
+    its destination zone and then its observed links in sequence. grad_dev_idx
+    is the index of each entry in the concatenation of flattened link count
+    deviations (by demand period and link no), production deviations, and
+    attraction deviations (see get_path_gradients()), and grad_path_nos is its
+    path no.
+    """
+    def __init__(self, zone_ids, link_size, demand_period_size,
+                 obs_link_mask):
+        # sorted zone ids, where zone no is the index of zone id
+        self.zone_ids = np.array(sorted(zone_ids), dtype=np.int64)
+        self.link_size = link_size
+        self.demand_period_size = demand_period_size
+        self.cols = []
+        # demand period, origin zone no and destination zone no of each path
+        self.taus = np.empty(0, dtype=np.int64)
+        self.orig_zone_nos = np.empty(0, dtype=np.int64)
+        self.dest_zone_nos = np.empty(0, dtype=np.int64)
+        self.link_ptr = np.zeros(1, dtype=np.int64)
+        self.link_nos = np.empty(0, dtype=np.int64)
+        # path no of each entry in link_nos
+        self.entry_path_nos = np.empty(0, dtype=np.int64)
+        # index of each entry in link volumes flattened from (tau, link no)
+        self.entry_vol_idx = np.empty(0, dtype=np.int64)
+        # links with observed counts indexed the same as link volumes
+        self.obs_link_mask = obs_link_mask
+        self.grad_path_nos = np.empty(0, dtype=np.int64)
+        self.grad_dev_idx = np.empty(0, dtype=np.int64)
+        # key: (at, dp, oz, dz), value: number of its columns indexed
+        self.col_nums = {}
+        # key: (at, dp, oz, dz), value: OD no in the order it is indexed
+        self.od_nos = {}
+        # OD no of each path
+        self.path_od_nos = np.empty(0, dtype=np.int64)
+        # OD volume of each OD pair indexed by OD no, i.e., the seed demand
+        # as ODME only adjusts column volumes
+        self.od_vols = np.empty(0, dtype=np.float64)
+
+    def get_path_num(self):
+        return len(self.cols)
+
+    def get_path_od_keys(self):
+        """ OD key (at, dp, oz, dz) of each column indexed by path no """
+        od_keys = list(self.od_nos.keys())
+        return [od_keys[i] for i in self.path_od_nos.tolist()]
+
+    def get_zone_size(self):
+        return len(self.zone_ids)
+
+    def update(self, column_pool, path_od_keys=None):
+        """ index columns which are not indexed yet
+
+        Columns from OD pairs without positive volumes are excluded. Return
+        the number of newly indexed columns.
+
+        If path_od_keys is given, which is the OD key (at, dp, oz, dz) of each
+        column to be indexed, columns will be indexed in its order instead,
+        where columns of each OD pair are taken in their order in column pool.
+        See get_path_od_keys().
+        """
+        if path_od_keys is None:
+            path_od_keys = [
+                k
+                for k, cv in column_pool.items() if cv.get_od_volume() > 0
+                for _ in range(cv.get_column_num() - self.col_nums.get(k, 0))
+            ]
+
+        new_cols = []
+        taus = []
+        oz_ids = []
+        dz_ids = []
+        link_nums = []
+        link_nos = []
+        path_od_nos = []
+        od_vols = []
+
+        # columns of each OD pair to be indexed
+        od_cols = {}
+        for k in path_od_keys:
+            if k not in od_cols:
+                cv = column_pool[k]
+                n = self.col_nums.get(k, 0)
+                od_cols[k] = iter(list(cv.get_columns().values())[n:])
+
+            if k not in self.od_nos:
+                self.od_nos[k] = len(self.od_nos)
+                od_vols.append(column_pool[k].get_od_volume())
+
+            col = next(od_cols[k])
+            self.col_nums[k] = self.col_nums.get(k, 0) + 1
+            new_cols.append(col)
+            path_od_nos.append(self.od_nos[k])
+            # k = (at, dp, oz, dz)
+            taus.append(k[1])
+            oz_ids.append(k[2])
+            dz_ids.append(k[3])
+            link_nums.append(len(col.links))
+            link_nos.extend(col.links)
+
+        if not new_cols:
+            return 0
+
+        path_no = len(self.cols)
+        self.cols.extend(new_cols)
+
+        path_nos = np.arange(path_no, path_no + len(new_cols))
+        taus = np.array(taus, dtype=np.int64)
+        orig_zone_nos = np.searchsorted(self.zone_ids, oz_ids)
+        dest_zone_nos = np.searchsorted(self.zone_ids, dz_ids)
+        link_nums = np.array(link_nums, dtype=np.int64)
+        link_nos = np.array(link_nos, dtype=np.int64)
+        entry_path_nos = np.repeat(path_nos, link_nums)
+
+        self.taus = np.concatenate((self.taus, taus))
+        self.path_od_nos = np.concatenate((self.path_od_nos, path_od_nos))
+        self.od_vols = np.concatenate((self.od_vols, od_vols))
+        self.orig_zone_nos = np.concatenate(
+            (self.orig_zone_nos, orig_zone_nos)
+        )
+        self.dest_zone_nos = np.concatenate(
+            (self.dest_zone_nos, dest_zone_nos)
+        )
+        self.link_ptr = np.concatenate(
+            (self.link_ptr, self.link_ptr[-1] + np.cumsum(link_nums))
+        )
+        self.link_nos = np.concatenate((self.link_nos, link_nos))
+        self.entry_path_nos = np.concatenate(
+            (self.entry_path_nos, entry_path_nos)
+        )
+        entry_vol_idx = taus[entry_path_nos - path_no] * self.link_size \
+                        + link_nos
+        self.entry_vol_idx = np.concatenate(
+            (self.entry_vol_idx, entry_vol_idx)
+        )
+
+        # the stable sort keeps the order of entries of each column
+        vol_size = self.demand_period_size * self.link_size
+        is_obs = self.obs_link_mask.ravel()[entry_vol_idx]
+        grad_path_nos = np.concatenate(
+            (path_nos, path_nos, entry_path_nos[is_obs])
+        )
+        grad_dev_idx = np.concatenate(
+            (vol_size + orig_zone_nos,
+             vol_size + len(self.zone_ids) + dest_zone_nos,
+             entry_vol_idx[is_obs])
+        )
+        order = np.argsort(grad_path_nos, kind='stable')
+        self.grad_path_nos = np.concatenate(
+            (self.grad_path_nos, grad_path_nos[order])
+        )
+        self.grad_dev_idx = np.concatenate(
+            (self.grad_dev_idx, grad_dev_idx[order])
+        )
+
+        return len(new_cols)
+
+    def get_volumes(self):
+        """ column volumes indexed by path no """
+        return np.fromiter((col.vol for col in self.cols), float,
+                           len(self.cols))
+
+    def set_volumes(self, vols):
+        for col, v in zip(self.cols, vols.tolist()):
+            col.vol = v
+
+    def get_link_volumes(self, vols):
+        """ link volumes indexed by demand period first and then link no """
+        return np.bincount(
+            self.entry_vol_idx,
+            weights=vols[self.entry_path_nos],
+            minlength=self.demand_period_size * self.link_size
+        ).reshape(self.demand_period_size, self.link_size)
+
+    def get_productions(self, vols):
+        """ zonal productions indexed by zone no """
+        return np.bincount(self.orig_zone_nos, weights=vols,
+                           minlength=len(self.zone_ids))
+
+    def get_attractions(self, vols):
+        """ zonal attractions indexed by zone no """
+        return np.bincount(self.dest_zone_nos, weights=vols,
+                           minlength=len(self.zone_ids))
+
+    def get_path_gradients(self, count_devs, prod_devs, attr_devs):
+        """ gradients of column volumes indexed by path no
+
+        count_devs is indexed by demand period first and then link no, and
+        prod_devs and attr_devs are indexed by zone no, where unobserved ones
+        are 0.
+        """
+        devs = np.concatenate((count_devs.ravel(), prod_devs, attr_devs))
+        return np.bincount(self.grad_path_nos,
+                           weights=devs[self.grad_dev_idx],
+                           minlength=len(self.cols))
+
+
+def _get_measurements(links, zone_ids, zone_id_to_zone_dict):
+    """ return observed link counts, productions, and attractions as arrays
+
+    Link counts are indexed by demand period first and then link no, while
+    productions and attractions are indexed by zone no (see PathIncidence). 0
+    stands for no observation.
+    """
+    obs_counts = np.array([link.obs_count_by_period for link in links],
+                          dtype=float).T
+
+    zones = [zone_id_to_zone_dict[z] for z in sorted(zone_ids)]
+    obs_productions = np.array([z.obs_production for z in zones], dtype=float)
+    obs_attractions = np.array([z.obs_attraction for z in zones], dtype=float)
+
+    return obs_counts, obs_productions, obs_attractions
+
+
+def _get_deviations(incidence, measurements, vols):
+    """ deviations of estimates from observations under column volumes vols
+
+    Return the deviations (i.e., estimated minus observed) of link counts,
+    productions, and attractions as arrays, where unobserved ones are 0.
+    """
+    obs_counts, obs_productions, obs_attractions = measurements
+
+    count_devs = incidence.get_link_volumes(vols) - obs_counts
+    prod_devs = incidence.get_productions(vols) - obs_productions
+    attr_devs = incidence.get_attractions(vols) - obs_attractions
+
+    count_devs[obs_counts <= 0] = 0
+    prod_devs[obs_productions <= 0] = 0
+    attr_devs[obs_attractions <= 0] = 0
+
+    return count_devs, prod_devs, attr_devs
+
+
+def _get_objective(devs):
+    """ half of the sum of squared deviations on all measurements """
+    return 0.5 * sum(np.vdot(x, x) for x in devs)
+
+
+def _load_link_volumes(incidence, links, vols):
+    """ load column volumes vols to links and return the link volumes """
+    link_vols = incidence.get_link_volumes(vols)
+
+    for link, v in zip(links, link_vols.T.tolist()):
+        link.flow_vol_by_period[:] = v
+
+    return link_vols
+
+
+def _update_odme_estimates(incidence, measurements, links,
+                          zone_id_to_zone_dict, iter_num):
+    """ load column volumes and update the estimates and their deviations
+
+    Link volumes, estimated productions and attractions, and deviations on
+    observed measurements are calculated from column volumes using incidence
+    and written back to links and zones.
+
+    Return the total absolute deviation, the relative deviation (i.e., the
+    total absolute deviation over the total observation), and the deviations
+    of link counts, productions, and attractions as arrays, where unobserved
+    ones are 0.
+    """
+    obs_counts, obs_productions, obs_attractions = measurements
+
+    vols = incidence.get_volumes()
+    link_vols = _load_link_volumes(incidence, links, vols)
+    productions = incidence.get_productions(vols)
+    attractions = incidence.get_attractions(vols)
+
+    zones = [zone_id_to_zone_dict[z] for z in incidence.zone_ids.tolist()]
+    for z, p, a in zip(zones, productions.tolist(), attractions.tolist()):
+        z.est_production = p
+        z.est_attraction = a
+
+    # calcualte deviation for each measurement type
+    link_mask = obs_counts > 0
+    prod_mask = obs_productions > 0
+    attr_mask = obs_attractions > 0
+
+    count_devs = link_vols[link_mask] - obs_counts[link_mask]
+    prod_devs = productions[prod_mask] - obs_productions[prod_mask]
+    attr_devs = attractions[attr_mask] - obs_attractions[attr_mask]
+
+    taus, link_nos = np.nonzero(link_mask)
+    for tau, i, dev in zip(taus.tolist(), link_nos.tolist(),
+                           count_devs.tolist()):
+        links[i].est_count_dev_by_period[tau] = dev
+
+    for i, dev in zip(np.flatnonzero(prod_mask).tolist(), prod_devs.tolist()):
+        zones[i].est_production_dev = dev
+
+    for i, dev in zip(np.flatnonzero(attr_mask).tolist(), attr_devs.tolist()):
+        zones[i].est_attraction_dev = dev
+
+    total_gap = (
+        np.abs(count_devs).sum()
+        + np.abs(prod_devs).sum()
+        + np.abs(attr_devs).sum()
+    )
+    total_obs = (
+        obs_counts[link_mask].sum()
+        + obs_productions[prod_mask].sum()
+        + obs_attractions[attr_mask].sum()
+    )
+    rel_gap = total_gap / max(0.0001, total_obs)
+
+    sub_gap_link_count = np.sum(count_devs / obs_counts[link_mask])
+    sub_gap_production = np.sum(prod_devs / obs_productions[prod_mask])
+    sub_gap_attraction = np.sum(attr_devs / obs_attractions[attr_mask])
+
+    print(f'ODME adjust iter {iter_num}: total abs gap= {total_gap}, '
+          f'relative gap= {rel_gap:.4%}, '
+          f'sub link gap= {sub_gap_link_count*100}, '
+          f'sub production gap= {sub_gap_production*100}, '
+          f'sub attraction gap= {sub_gap_attraction*100}')
+
+    devs = (np.zeros(link_vols.shape),
+            np.zeros(len(zones)),
+            np.zeros(len(zones)))
+    devs[0][link_mask] = count_devs
+    devs[1][prod_mask] = prod_devs
+    devs[2][attr_mask] = attr_devs
+
+    return float(total_gap), float(rel_gap), devs
+
+
+def _od_adjust(incidence, devs, step_size=0.01, max_change_ratio=0.05):
+    """ update column volumes along their gradients
+
+    devs are the deviations of link counts, productions, and attractions from
+    _update_odme_estimates(). The change of each column volume is bounded by
+    max_change_ratio of its current volume, and column volumes are kept no
+    less than 1.
+    """
+    vols = incidence.get_volumes()
+    grads = incidence.get_path_gradients(*devs)
+
+    changes = np.clip(step_size * grads,
+                      vols * max_change_ratio * (-1),
+                      vols * max_change_ratio)
+
+    for col, g in zip(incidence.cols, grads.tolist()):
+        col.path_gradient_cost = g
+
+    incidence.set_volumes(np.maximum(1, vols - changes))
+
+
+def _get_line_search_step(incidence, measurements, vols, devs, min_step):
+    """ take one gradient step from column volumes vols using line search
+
+    devs are the deviations under vols, see _get_deviations().
+
+    The objective is half of the sum of squared deviations on all measurements
+    (see _get_objective()), which is quadratic in column volumes as long as
+    columns are fixed. Therefore, the step length is first set as the exact
+    minimizer along the negative gradient, where columns without volume and
+    with positive gradients stay unchanged. It is then halved until the
+    objective decreases after column volumes are projected to be nonnegative,
+    or it reaches min_step times the exact one.
+
+    Return (step length, new column volumes, deviations under them, objective
+    before, objective after). The step length is 0 if the objective cannot be
+    decreased.
+    """
+    grads = incidence.get_path_gradients(*devs)
+    obj = _get_objective(devs)
+
+    dirs = -grads
+    dirs[(vols <= 0) & (dirs < 0)] = 0
+
+    # deviations change linearly along dirs, i.e., devs + step * dir_devs
+    obs_counts, obs_productions, obs_attractions = measurements
+    dir_devs = (
+        np.where(obs_counts > 0, incidence.get_link_volumes(dirs), 0),
+        np.where(obs_productions > 0, incidence.get_productions(dirs), 0),
+        np.where(obs_attractions > 0, incidence.get_attractions(dirs), 0)
+    )
+
+    slope = sum(np.vdot(x, y) for x, y in zip(devs, dir_devs))
+    curvature = 2 * _get_objective(dir_devs)
+    if slope >= 0 or curvature <= 0:
+        return 0, vols, devs, obj, obj
+
+    step = -slope / curvature
+    min_step *= step
+    while True:
+        new_vols = np.maximum(0, vols + step * dirs)
+        new_devs = _get_deviations(incidence, measurements, new_vols)
+        new_obj = _get_objective(new_devs)
+        if new_obj < obj:
+            return step, new_vols, new_devs, obj, new_obj
+
+        if step <= min_step:
+            return 0, vols, devs, obj, obj
+
+        step /= 2
+
+
+def _od_adjust_with_line_search(incidence, measurements, max_step_num=20,
+                                tol=1e-06, min_step=1/64):
+    """ update column volumes using gradient steps with line search
+
+    As no shortest path is needed, up to max_step_num steps are taken (see
+    _get_line_search_step()) until the objective decreases by no more than
+    tol (relatively) in a step.
+
+    Deviations are recalculated from the current column volumes as columns
+    and their volumes have been updated by column generation after the last
+    _update_odme_estimates(). Return the step lengths.
+    """
+    vols = incidence.get_volumes()
+    devs = _get_deviations(incidence, measurements, vols)
+    steps = []
+
+    for _ in range(max_step_num):
+        step, vols, devs, obj, new_obj = _get_line_search_step(
+            incidence, measurements, vols, devs, min_step
+        )
+        if not step:
+            break
+
+        steps.append(step)
+        if obj - new_obj <= tol * obj:
+            break
+
+    grads = incidence.get_path_gradients(*devs)
+    for col, g in zip(incidence.cols, grads.tolist()):
+        col.path_gradient_cost = g
+
+    incidence.set_volumes(vols)
+
+    return steps
+
+
+def _get_scipy():
+    """ return scipy.sparse and scipy.optimize, or None's if not installed """
+    try:
+        import scipy.sparse as sp
+        import scipy.optimize as opt
+
+        return sp, opt
+    except ImportError:
+        # just in case user does not have scipy installed
+        print('Please intall scipy for the least-squares ODME solver!')
+        print('Gradient steps with line search will be used instead.\n')
+        return None, None
+
+
+def _od_adjust_with_lsq(incidence, measurements, sp, opt, seed_weight=0.01,
+                        max_iter=15000):
+    """ update OD volumes by solving a bounded least-squares problem
+
+    OD volumes are set as the nonnegative solution to minimize the sum of
+    squared deviations on all measurements plus seed_weight times the sum of
+    squared deviations from the seed demand, where the volume of each OD pair
+    is split among its columns in proportion to their current volumes (evenly
+    if it has no volume). The seed demand keeps OD volumes from drifting away
+    where measurements do not tell them apart, and it is not used if
+    seed_weight is 0.
+
+    The coefficient matrix of measurements over OD volumes is the sparse one
+    over column volumes, whose nonzeros are exactly the entries of the
+    gradient index of incidence, times the path shares. It is solved by
+    scipy.optimize.minimize() using L-BFGS-B from the current OD volumes.
+    Column volumes are left unchanged if it fails. Path shares are not
+    adjusted here, which is left to the column updates afterwards.
+
+    sp and opt are scipy.sparse and scipy.optimize. Return the result of
+    minimize().
+    """
+    path_num = incidence.get_path_num()
+    od_num = len(incidence.od_vols)
+    od_nos = incidence.path_od_nos
+
+    vols = incidence.get_volumes()
+    od_vols = np.bincount(od_nos, weights=vols, minlength=od_num)
+    shares = np.divide(vols, od_vols[od_nos],
+                       out=1 / np.bincount(od_nos, minlength=od_num)[od_nos],
+                       where=od_vols[od_nos] > 0)
+
+    obs = np.concatenate([x.ravel() for x in measurements])
+    mat = sp.csr_matrix(
+        (np.ones(len(incidence.grad_dev_idx)),
+         (incidence.grad_dev_idx, incidence.grad_path_nos)),
+        shape=(len(obs), path_num)
+    )[obs > 0] @ sp.csr_matrix((shares, (np.arange(path_num), od_nos)),
+                               shape=(path_num, od_num))
+    obs = obs[obs > 0]
+
+    if seed_weight > 0:
+        w = np.sqrt(seed_weight)
+        mat = sp.vstack((mat, w * sp.identity(od_num)), format='csr')
+        obs = np.concatenate((obs, w * incidence.od_vols))
+
+    mat_t = mat.T.tocsr()
+
+    def get_objective_and_gradient(x):
+        devs = mat @ x - obs
+        return 0.5 * np.vdot(devs, devs), mat_t @ devs
+
+    res = opt.minimize(get_objective_and_gradient, od_vols, jac=True,
+                       method='L-BFGS-B', bounds=opt.Bounds(0, np.inf),
+                       options={'maxiter': max_iter})
+    # 1 is for reaching max_iter, where it is still better than the start
+    if res.status not in [0, 1]:
+        return res
+
+    vols = shares * res.x[od_nos]
+    grads = incidence.get_path_gradients(
+        *_get_deviations(incidence, measurements, vols)
+    )
+    for col, g in zip(incidence.cols, grads.tolist()):
+        col.path_gradient_cost = g
+
+    incidence.set_volumes(vols)
+
+    return res
+
+
+def _get_odme_performance(A):
+    """ return the records of odme_performance.csv from assignment A
+
+    Each record is (measurement_type, o_zone_id, d_zone_id, from_node_id,
+    to_node_id, obs_count, est_count, demand_period), where demand_period is
+    empty for productions and attractions as they are over all demand periods.
+    """
+    records = []
+    zones = A.get_network().zone_id_to_zone_dict
+    dps = A.get_demand_periods()
+
+    for link in A.get_links():
+        for dp in dps:
+            tau = dp.get_id()
+            if link.obs_count_by_period[tau] > 0:
+                records.append(['link', '', '',
+                                link.external_from_node,
+                                link.external_to_node,
+                                link.obs_count_by_period[tau],
+                                link.flow_vol_by_period[tau],
+                                dp.get_period()])
+
+    for zone_id in A.get_zones():
+        z = zones[zone_id]
+        if z.obs_production > 0:
+            records.append(['production', zone_id, '', '', '',
+                            z.obs_production, z.est_production, ''])
+        if z.obs_attraction > 0:
+            records.append(['attraction', '', zone_id, '', '',
+                            z.obs_attraction, z.est_attraction, ''])
+
+    return records
+
+
+def _reset_odme_states(A):
+    """ reset assignment A to the state right after reading the network
+
+    Column pool, link volumes, measurements, and estimates are all cleared.
+    """
+    A.get_column_pool().clear()
+
+    for link in A.get_links():
+        link.flow_vol_by_period[:] = [0] * len(link.flow_vol_by_period)
+        link.travel_time_by_period[:] = [0] * len(link.travel_time_by_period)
+        link.obs_count_by_period[:] = [0] * len(link.obs_count_by_period)
+        link.est_count_dev_by_period[:] = \
+            [0] * len(link.est_count_dev_by_period)
+
+    for z in A.get_network().zone_id_to_zone_dict.values():
+        z.obs_production = 0
+        z.obs_attraction = 0
+        z.est_production = 0
+        z.est_attraction = 0
+        z.est_production_dev = 0
+        z.est_attraction_dev = 0
+
+
+def _run_odme_scenario(ui, seed_demand, measurement, iter_num,
+                       column_update_num, odme_tol, odme_line_search,
+                       odme_solver, odme_seed_weight):
+    """ perform ODME on ui from seed_demand and measurement
+
+    Return the records of odme_performance.csv, see _get_odme_performance().
+    """
+    # they import this module
+    from .colgen import perform_network_assignment
+    from .utils import read_demand, read_measurement, _setup_zone_degrees
+
+    A = ui._base_assignment
+    network = A.get_network()
+
+    _reset_odme_states(A)
+    # zone degrees are global and not set up if ui is read without demand
+    _setup_zone_degrees(network)
+
+    demand_dir, demand_file = os.path.split(seed_demand)
+    for d in A.get_demands():
+        read_demand(demand_dir or '.',
+                    demand_file,
+                    A.get_agent_type_id(d.get_agent_type()),
+                    A.get_demand_period_id(d.get_period()),
+                    network.zone_to_nodes_dict,
+                    A.get_column_pool(),
+                    (d.get_agent_type(), d.get_period()))
+
+    measurement_dir, measurement_file = os.path.split(measurement)
+    read_measurement(measurement_dir or '.',
+                     network.node_list,
+                     network.link_list,
+                     network.get_zones(),
+                     network.internal_node_seq_no_dict,
+                     network.zone_to_nodes_dict,
+                     network.zone_id_to_zone_dict,
+                     measurement_file,
+                     A.map_dp_id)
+
+    perform_network_assignment(3, iter_num, column_update_num, ui,
+                               odme_tol=odme_tol,
+                               odme_line_search=odme_line_search,
+                               odme_solver=odme_solver,
+                               odme_seed_weight=odme_seed_weight)
+
+    return _get_odme_performance(A)
+
+
+def _run_odme_scenario_in_worker(*args):
+    return _run_odme_scenario(_batch_ui, *args)
+
+
+def perform_odme_batch(ui, scenarios, iter_num, column_update_num,
+                       worker_num=None, odme_tol=0, odme_line_search=False,
+                       odme_solver='gradient', odme_seed_weight=0.01):
+    """ perform ODME on each scenario using the same network
+
+    Parameters
+    ----------
+    ui
+        network object generated by pg.read_network(), where demand and
+        measurements are not needed, i.e., it can be read with load_demand
+        set to False
+    scenarios
+        a list of (seed demand file, measurement file). A seed demand file is
+        either a csv file like demand.csv or an OD matrix file (.npz) by
+        save_demand_matrices(). It applies to every demand in settings.yml,
+        and the OD table of each (agent type, demand period) will be picked
+        from an OD matrix file.
+    iter_num
+        number of ODME iterations
+    column_update_num
+        number of iterations to be performed on optimizing column pool in the
+        initial assignment and, for the lsq solver, after each solve
+    worker_num
+        number of worker processes. The default is the number of CPU cores.
+    odme_tol
+        see perform_network_assignment()
+    odme_line_search
+        see perform_network_assignment()
+    odme_solver
+        see perform_network_assignment()
+    odme_seed_weight
+        see perform_network_assignment()
+
+    Outputs
+    -------
+    a list of records of odme_performance.csv for each scenario
+
+        Each record is (measurement_type, o_zone_id, d_zone_id, from_node_id,
+        to_node_id, obs_count, est_count, demand_period).
+
+    Note
+    ----
+        Worker processes are forked from the current process, and share the
+        network topology and other read-only states with it. Each of them
+        resets the states of its copy of ui before taking a new scenario, and
+        ui in the current process is left intact. If fork is not supported
+        (e.g., on Windows) or worker_num is 1, scenarios will be processed
+        one by one on ui itself, which ends up with the states of the last
+        scenario.
+    """
+    global _batch_ui
+
+    if worker_num is None:
+        worker_num = os.cpu_count() or 1
+    worker_num = max(1, min(worker_num, len(scenarios)))
+
+    if worker_num == 1 or (
+        'fork' not in multiprocessing.get_all_start_methods()
+    ):
+        return [
+            _run_odme_scenario(ui, d, m, iter_num, column_update_num,
+                               odme_tol, odme_line_search, odme_solver,
+                               odme_seed_weight)
+            for d, m in scenarios
+        ]
+
+    _batch_ui = ui
+    try:
+        with ProcessPoolExecutor(
+            worker_num, mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            futures = [
+                executor.submit(_run_odme_scenario_in_worker, d, m, iter_num,
+                                column_update_num, odme_tol, odme_line_search,
+                                odme_solver, odme_seed_weight)
+                for d, m in scenarios
+            ]
+            return [f.result() for f in futures]
+    finally:
+        _batch_ui = None
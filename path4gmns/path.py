@@ -11,9 +11,14 @@ Two path engines are provided:
 import ctypes
 import collections
 import heapq
-import os.path
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 from sys import platform
 
+import numpy as np
+
 from .consts import MAX_LABEL_COST
 
 
@@ -25,37 +30,61 @@ __all__ = [
 ]
 
 
-if platform.startswith('win32'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/path_engine.dll')
-elif platform.startswith('linux'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/path_engine.so')
-elif platform.startswith('darwin'):
-    _dll_file = os.path.join(os.path.dirname(__file__), 'bin/path_engine.dylib')
-else:
-    raise Exception('Please build the shared library compatible to your OS\
-                    using source files in engine_cpp!')
-
-_cdll = ctypes.cdll.LoadLibrary(_dll_file)
-
-# set up the argument types for the shortest path function in dll.
-_cdll.shortest_path.argtypes = [
-    ctypes.c_int,
-    ctypes.c_int,
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_wchar_p),
-    ctypes.POINTER(ctypes.c_double),
-    ctypes.POINTER(ctypes.c_double),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.POINTER(ctypes.c_int),
-    ctypes.c_char,
-    ctypes.c_int,
-    ctypes.c_int
-]
+# the path engine will be loaded on first use, see _get_cdll()
+_cdll = None
+_cdll_lock = threading.Lock()
+
+
+def _load_cdll():
+    if platform.startswith('win32'):
+        dll_file = os.path.join(os.path.dirname(__file__),
+                                'bin/path_engine.dll')
+    elif platform.startswith('linux'):
+        dll_file = os.path.join(os.path.dirname(__file__),
+                                'bin/path_engine.so')
+    elif platform.startswith('darwin'):
+        dll_file = os.path.join(os.path.dirname(__file__),
+                                'bin/path_engine.dylib')
+    else:
+        raise Exception('Please build the shared library compatible to your OS\
+                        using source files in engine_cpp!')
+
+    cdll = ctypes.cdll.LoadLibrary(dll_file)
+
+    # set up the argument types for the shortest path function in dll.
+    cdll.shortest_path.argtypes = [
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_wchar_p),
+        ctypes.POINTER(ctypes.c_double),
+        ctypes.POINTER(ctypes.c_double),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.c_char,
+        ctypes.c_int,
+        ctypes.c_int
+    ]
+
+    return cdll
+
+
+def _get_cdll():
+    """ return the path engine and load it if it has not been loaded """
+    global _cdll
+
+    if _cdll is None:
+        # column generation may call it from multiple threads
+        with _cdll_lock:
+            if _cdll is None:
+                _cdll = _load_cdll()
+
+    return _cdll
 
 
 def _optimal_label_correcting_CAPI(G,
@@ -66,22 +95,111 @@ def _optimal_label_correcting_CAPI(G,
     node_label_cost, node_predecessor, and link_predecessor are still
     initialized in shortest_path() even the source node has no outgoing links.
     """
-    _cdll.shortest_path_n(origin_node_no,
-                        G.get_node_size(),
-                        G.get_from_node_no_arr(),
-                        G.get_to_node_no_arr(),
-                        G.get_first_links(),
-                        G.get_last_links(),
-                        G.get_sorted_link_no_arr(),
-                        G.get_allowed_uses(),
-                        G.get_link_costs(),
-                        G.get_node_label_costs(),
-                        G.get_node_preds(),
-                        G.get_link_preds(),
-                        G.get_queue_next(),
-                        G.get_agent_type_str(),
-                        G.get_last_thru_node(),
-                        departure_time)
+    _get_cdll().shortest_path_n(origin_node_no,
+                                G.get_node_size(),
+                                G.get_from_node_no_arr(),
+                                G.get_to_node_no_arr(),
+                                G.get_first_links(),
+                                G.get_last_links(),
+                                G.get_sorted_link_no_arr(),
+                                G.get_allowed_uses(),
+                                G.get_link_costs(),
+                                G.get_node_label_costs(),
+                                G.get_node_preds(),
+                                G.get_link_preds(),
+                                G.get_queue_next(),
+                                G.get_agent_type_str(),
+                                G.get_last_thru_node(),
+                                departure_time)
+
+
+def _bounded_shortest_path_CAPI(G, origin_node_no, time_budget):
+    """ call the deque implementation of MLC written in cpp
+
+    The shipped path engines have no bounded search. The full shortest path
+    tree is built and only nodes within time_budget are kept.
+    """
+    _optimal_label_correcting_CAPI(G, origin_node_no)
+
+    label_costs = np.ctypeslib.as_array(G.get_node_label_costs())
+    link_preds = np.ctypeslib.as_array(G.get_link_preds())
+    node_nos = np.flatnonzero(label_costs <= time_budget)
+
+    return node_nos, label_costs[node_nos], link_preds[node_nos]
+
+
+def _bounded_shortest_path_dijkstra(G, origin_node_no, time_budget):
+    """ heap-Dijkstra's Algorithm bounded by time_budget
+
+    It is the Python counterpart of _bounded_shortest_path_CAPI() with the same
+    rules on allowed uses and centroids. Labels are kept in dicts so that only
+    the reached nodes are touched.
+    """
+    mode = G.get_agent_type_str().decode()
+    link_costs = G.get_link_costs()
+    allowed_uses = G.get_allowed_uses()
+    last_thru_node = G.get_last_thru_node()
+
+    label_costs = {origin_node_no: 0}
+    link_preds = {origin_node_no: -1}
+    # scan eligible list
+    SEList = [(0, origin_node_no)]
+
+    # label setting
+    while SEList:
+        (label_cost, from_node) = heapq.heappop(SEList)
+        # already scanned, pass it
+        if label_cost > label_costs[from_node]:
+            continue
+        # used to filter out the TAZ based centriods
+        if from_node > last_thru_node and from_node != origin_node_no:
+            continue
+        for link in G.node_list[from_node].outgoing_link_list:
+            link_no = link.get_seq_no()
+            au = allowed_uses[link_no]
+            if mode != 'a' and mode not in au and 'a' not in au:
+                continue
+
+            new_to_node_cost = label_cost + link_costs[link_no]
+            # stop expanding once labels exceed the budget
+            if new_to_node_cost > time_budget:
+                continue
+
+            to_node = link.to_node_seq_no
+            if new_to_node_cost < label_costs.get(to_node, MAX_LABEL_COST):
+                label_costs[to_node] = new_to_node_cost
+                link_preds[to_node] = link_no
+                heapq.heappush(SEList, (new_to_node_cost, to_node))
+
+    return (np.fromiter(label_costs.keys(), dtype=np.int32),
+            np.fromiter(label_costs.values(), dtype=np.float64),
+            np.fromiter(link_preds.values(), dtype=np.int32))
+
+
+def bounded_shortest_path(G, origin_node_id, time_budget, engine_type='c'):
+    """ find shortest paths from origin_node_id up to time_budget
+
+    The C++ engine builds the full shortest path tree as
+    single_source_shortest_path() does and keeps the nodes within time_budget,
+    so the results are exactly the same as the unbounded search. The Python
+    engine only expands nodes as long as their labels are within time_budget,
+    where predecessor links may differ between equal-cost alternatives.
+
+    Return node nos, label costs, and predecessor link nos of the reached
+    nodes (including the origin node) in ascending order of node no.
+    """
+    origin_node_no = G.get_node_no(origin_node_id)
+
+    if engine_type.lower() == 'c':
+        G.allocate_for_CAPI()
+        return _bounded_shortest_path_CAPI(G, origin_node_no, time_budget)
+
+    node_nos, label_costs, link_preds = _bounded_shortest_path_dijkstra(
+        G, origin_node_no, time_budget
+    )
+
+    order = np.argsort(node_nos)
+    return node_nos[order], label_costs[order], link_preds[order]
 
 
 def _single_source_shortest_path_fifo(G, origin_node_no):
@@ -294,59 +412,149 @@ def find_shortest_path(G, from_node_id, to_node_id, seq_type='node'):
     return f'distance: {path_cost:.2f} | path: {path}'
 
 
-def find_path_for_agents(G, column_pool, engine_type='c'):
-    """ find and set up shortest path for each agent
+def _get_worker_network(G):
+    """ return a shallow copy of G with its own label costs and predecessors
+
+    The copy shares the topology, link costs, and allowed uses with G so that
+    multiple copies can run single_source_shortest_path() concurrently, where
+    the C++ path engine releases the GIL.
+    """
+    G.allocate_for_CAPI()
+
+    H = copy(G)
+    # they will be initialized in shortest_path_n()
+    H.node_label_cost = (ctypes.c_double * G.node_size)()
+    H.node_predecessor = (ctypes.c_int * G.node_size)()
+    H.link_predecessor = (ctypes.c_int * G.node_size)()
+    H.queue_next = (ctypes.c_int * G.node_size)()
+
+    return H
 
-    the internal node and links will be used to set up the node sequence and
-    link sequence respectively
 
-    Note that we do not cache the predecessors and label cost even some agents
-    may share the same origin and each call of the single-source path algorithm
-    will calculate the shortest path tree from the source node.
+def _find_paths_from_origins(G, od_nodes, engine_type):
+    """ find shortest paths from each origin node to its destination nodes
+
+    od_nodes is a list of (origin node id, destination node ids). The shortest
+    path tree from each origin node is calculated only once.
+
+    Return a list of (path cost, node path, link path) for each destination
+    node, where node path and link path are None if there is no valid path.
     """
-    if G.get_agent_count() == 0:
-        print('setting up individual agents')
-        G.setup_agents(column_pool)
+    paths = []
+    for from_node_id, to_node_ids in od_nodes:
+        single_source_shortest_path(G, from_node_id, engine_type)
 
-    from_node_id_prev = -1
-    for agent in G.agent_list:
-        from_node_id = agent.o_node_id
-        to_node_id = agent.d_node_id
+        for to_node_id in to_node_ids:
+            current_node_seq_no = G.internal_node_seq_no_dict[to_node_id]
+            path_cost = G.node_label_cost[current_node_seq_no]
 
-        # just in case agent has the same origin and destination
-        if from_node_id == to_node_id:
-            continue
+            node_path = []
+            link_path = []
 
-        if from_node_id not in G.internal_node_seq_no_dict.keys():
-            raise Exception(f"Node ID: {from_node_id} not in the network")
-        if to_node_id not in G.internal_node_seq_no_dict.keys():
-            raise Exception(f"Node ID: {to_node_id} not in the network")
+            # retrieve the sequence backwards
+            while current_node_seq_no >= 0:
+                node_path.append(current_node_seq_no)
+                current_link_seq_no = G.link_predecessor[current_node_seq_no]
+                if current_link_seq_no >= 0:
+                    link_path.append(current_link_seq_no)
+                current_node_seq_no = G.node_predecessor[current_node_seq_no]
 
-        # simple caching strategy
-        # if the current from_node_id is the same as from_node_id_prev,
-        # then there is no need to redo shortest path calculation.
-        if from_node_id != from_node_id_prev:
-            from_node_id_prev = from_node_id
-            single_source_shortest_path(G, from_node_id, engine_type)
+            # make sure it is a valid path
+            if not link_path:
+                paths.append((path_cost, None, None))
+            else:
+                paths.append((path_cost, node_path, link_path))
 
-        node_path = []
-        link_path = []
+    return paths
 
-        current_node_seq_no = G.internal_node_seq_no_dict[to_node_id]
-        # set up the cost
-        agent.path_cost = G.node_label_cost[current_node_seq_no]
 
-        # retrieve the sequence backwards
-        while current_node_seq_no >= 0:
-            node_path.append(current_node_seq_no)
-            current_link_seq_no = G.link_predecessor[current_node_seq_no]
-            if current_link_seq_no >= 0:
-                link_path.append(current_link_seq_no)
-            current_node_seq_no = G.node_predecessor[current_node_seq_no]
+def find_path_for_agents(G, column_pool, engine_type='c', seed=None,
+                         worker_num=None):
+    """ find and set up shortest path for each agent
 
-        # make sure it is a valid path
-        if not link_path:
-            continue
+    the internal node and links will be used to set up the node sequence and
+    link sequence respectively
+
+    Agents are grouped by their origin nodes, and the shortest path tree from
+    each origin node is calculated only once. Origin nodes are split into
+    worker_num groups and processed concurrently using the C++ path engine,
+    where worker_num is the number of CPU cores if it is None.
+
+    All agents with the same origin node and destination node share the same
+    path in the path store of the agent table. seed is used to set up agents
+    on the first call, see Network.setup_agents().
+    """
+    if G.get_agent_count() == 0:
+        print('setting up individual agents')
+        G.setup_agents(column_pool, seed)
+
+    agents = G.get_agents()
+
+    for node_id in np.unique(
+        np.concatenate((agents.o_node_ids, agents.d_node_ids))
+    ).tolist():
+        if node_id not in G.internal_node_seq_no_dict.keys():
+            raise Exception(f"Node ID: {node_id} not in the network")
+
+    # just in case agent has the same origin and destination
+    agent_nos = np.flatnonzero(agents.o_node_ids != agents.d_node_ids)
+    if not len(agent_nos):
+        return
+
+    # group agents by (origin node, destination node)
+    agent_nos = agent_nos[
+        np.lexsort((agents.d_node_ids[agent_nos],
+                    agents.o_node_ids[agent_nos]))
+    ]
+    o_node_ids = agents.o_node_ids[agent_nos]
+    d_node_ids = agents.d_node_ids[agent_nos]
+
+    od_starts = np.flatnonzero(
+        np.r_[True,
+              (o_node_ids[1:] != o_node_ids[:-1])
+              | (d_node_ids[1:] != d_node_ids[:-1])]
+    )
+    od_agent_nums = np.diff(np.r_[od_starts, len(agent_nos)])
+
+    od_nodes = {}
+    for from_node_id, to_node_id in zip(o_node_ids[od_starts].tolist(),
+                                        d_node_ids[od_starts].tolist()):
+        if from_node_id not in od_nodes:
+            od_nodes[from_node_id] = []
+        od_nodes[from_node_id].append(to_node_id)
+    od_nodes = list(od_nodes.items())
+
+    if worker_num is None:
+        worker_num = os.cpu_count() or 1
+
+    # the python path engine is bounded by the GIL
+    if engine_type.lower() != 'c':
+        worker_num = 1
+    worker_num = max(1, min(worker_num, len(od_nodes)))
+
+    if worker_num == 1:
+        paths = _find_paths_from_origins(G, od_nodes, engine_type)
+    else:
+        # each worker takes a contiguous block of origin nodes
+        block_size = (len(od_nodes) + worker_num - 1) // worker_num
+        with ThreadPoolExecutor(max_workers=worker_num) as executor:
+            futures = [
+                executor.submit(_find_paths_from_origins,
+                                _get_worker_network(G),
+                                od_nodes[i:i+block_size],
+                                engine_type)
+                for i in range(0, len(od_nodes), block_size)
+            ]
+            paths = [x for f in futures for x in f.result()]
+
+    path_costs = []
+    path_nos = []
+    for path_cost, node_path, link_path in paths:
+        path_costs.append(path_cost)
+        if node_path is None:
+            path_nos.append(-1)
+        else:
+            path_nos.append(agents.add_path(node_path, link_path))
 
-        agent.node_path = [x for x in node_path]
-        agent.link_path = [x for x in link_path]
\ No newline at end of file
+    agents.path_costs[agent_nos] = np.repeat(path_costs, od_agent_nums)
+    agents.path_nos[agent_nos] = np.repeat(path_nos, od_agent_nums)
\ No newline at end of file
@@ -1,16 +1,32 @@
 import os
 import csv
+import gzip
+import hashlib
+import io
+import queue
+import shutil
+import tempfile
 import threading
 
+import numpy as np
+
 from .classes import Node, Link, Zone, Network, Column, ColumnVec, VDFPeriod, \
-                     AgentType, DemandPeriod, Demand, Assignment, UI
+                     AgentType, DemandPeriod, Demand, Assignment, UI, \
+                     LinkArrays, _build_topology
 
+from .checkpoint import get_column_pool_arrays, restore_column_pool
 from .colgen import update_links_using_columns
+from .odme import _get_odme_performance
+from .consts import SNAPSHOT_VERSION
 
 
 __all__ = [
     'read_network',
     'load_columns',
+    'save_column_pool',
+    'load_column_pool',
+    'save_demand_matrices',
+    'read_demand_matrices',
     'output_columns',
     'output_link_performance',
     'download_sample_data_sets',
@@ -18,7 +34,11 @@ __all__ = [
     'output_odme_performance',
     'output_path_link_propotion',
     'output_od_path_propotion',
-    'output_od_link_propotion'
+    'output_od_link_propotion',
+    'output_link_performance_parquet',
+    'output_columns_parquet',
+    'output_path_link_propotion_parquet',
+    'output_odme_performance_parquet'
 
 ]
 
@@ -56,6 +76,20 @@ def _update_dest_zone(dz_id):
         _zone_degrees[dz_id] = 3
 
 
+def _setup_zone_degrees(network):
+    """ set up zone degrees from links of network as read_links() does
+
+    It is needed by read_demand() on network read without demand, where zone
+    degrees are not set up.
+    """
+    _initialize_zone_degrees(network.get_zone_size())
+
+    nodes = network.node_list
+    for link in network.link_list:
+        _update_orig_zone(nodes[link.from_node_seq_no].get_zone_id())
+        _update_dest_zone(nodes[link.to_node_seq_no].get_zone_id())
+
+
 def _are_od_connected(oz_id, dz_id):
     connected = True
 
@@ -175,330 +209,524 @@ def download_sample_data_sets():
     print('check '+os.path.join(os.getcwd(), loc_data_dir)+' for downloaded data sets')
 
 
-def read_nodes(input_dir,
-               nodes,
-               id_to_no_dict,
-               no_to_id_dict,
-               zone_to_node_dict,
-               zone_id_to_zone_dict):
+def _read_csv_columns(filename, str_headers=()):
+    """ read a csv file as a dict of columns keyed by headers
 
-    """ step 1: read input_node """
-    with open(input_dir+'/node.csv', 'r', encoding='utf-8') as fp:
-        print('read node.csv')
+    If pyarrow is installed, the whole file will be parsed column by column
+    by its csv reader, where each numeric column is a float64 array with nan
+    for empty values, and the others are lists of strings. Columns in
+    str_headers are always lists of strings, which should be the ones taken
+    as they are rather than converted to numbers.
 
-        reader = csv.DictReader(fp)
-        node_seq_no = 0
-        for line in reader:
-            # set up node_id, which should be an integer
-            node_id = _convert_str_to_int(line['node_id'])
-            if node_id is None:
-                continue
+    Otherwise, or if pyarrow fails to parse it, it will be read row by row
+    by csv.reader, and each column is a list of strings. Rows shorter than
+    headers are padded with empty strings and empty rows are skipped as
+    csv.DictReader does.
+    """
+    cols = _read_csv_columns_with_pyarrow(filename, str_headers)
+    if cols is not None:
+        return cols
 
-            # set up zone_id, which should be an integer
-            zone_id = _convert_str_to_int(line['zone_id'])
-            if zone_id is None:
-                zone_id = -1
+    with open(filename, 'r', encoding='utf-8') as fp:
+        reader = csv.reader(fp)
+        headers = next(reader, [])
+        col_num = len(headers)
 
-            # treat them as string
-            coord_x = line['x_coord']
-            coord_y = line['y_coord']
+        rows = [
+            row if len(row) >= col_num else row + [''] * (col_num - len(row))
+            for row in reader if row
+        ]
 
-            # construct node object
-            node = Node(node_seq_no, node_id, zone_id, coord_x, coord_y)
-            nodes.append(node)
+    cols = list(zip(*rows)) if rows else [()] * col_num
 
-            # set up mapping between node_seq_no and node_id
-            id_to_no_dict[node_id] = node_seq_no
-            no_to_id_dict[node_seq_no] = node_id
+    return {h: list(c) for h, c in zip(headers, cols)}
 
-            # associate node_id to corresponding zone
-            if zone_id not in zone_to_node_dict.keys():
-                zone_to_node_dict[zone_id] = []
-            zone_to_node_dict[zone_id].append(node_id)
-            
-            if zone_id not in zone_id_to_zone_dict.keys():
-                zone_id_to_zone_dict[zone_id]=Zone(zone_id)
 
-            node_seq_no += 1
+def _read_csv_columns_with_pyarrow(filename, str_headers):
+    """ see _read_csv_columns(), and return None if it does not work """
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return None
 
-        print(f"the number of nodes is {node_seq_no}")
+    try:
+        table = pacsv.read_csv(
+            filename,
+            convert_options=pacsv.ConvertOptions(
+                column_types={h: pa.string() for h in str_headers},
+                strings_can_be_null=False
+            )
+        )
+    except (pa.ArrowException, OSError):
+        # e.g., rows longer than headers or duplicate headers
+        return None
 
-        zone_size = len(zone_to_node_dict)
-        assert(zone_size==len(zone_id_to_zone_dict))
-        # do not count virtual zone with id as -1
-        if -1 in zone_to_node_dict.keys():
-            zone_size -= 1
+    cols = {}
+    for h, col in zip(table.column_names, table.columns):
+        if pa.types.is_integer(col.type) or pa.types.is_floating(col.type):
+            cols[h] = col.to_numpy().astype(np.float64)
+        else:
+            # empty columns are typed as null
+            cols[h] = pc.fill_null(col.cast(pa.string()), '').to_pylist()
 
-        print(f"the number of zones is {zone_size}")
+    return cols
 
 
-def read_links(input_dir,
-               links,
-               nodes,
-               id_to_no_dict,
-               link_id_dict,
-               zone_size,
-               agent_type_size,
-               demand_period_size,
-               load_demand):
+def _convert_strs_to_floats(strs):
+    """ vectorized _convert_str_to_float() where None is replaced by nan
 
-    """ step 2: read input_link """
-    with open(input_dir+'/link.csv', 'r', encoding='utf-8') as fp:
-        print('read link.csv')
+    strs can also be a float array from _read_csv_columns(), which is
+    returned as it is.
+    """
+    if isinstance(strs, np.ndarray) and strs.dtype == np.float64:
+        return strs
 
-        if load_demand:
-            _initialize_zone_degrees(zone_size)
+    arr = np.array(strs, dtype=str)
+    try:
+        return np.where(arr == '', 'nan', arr).astype(np.float64)
+    except ValueError:
+        # some of them are not numbers
+        vals = (_convert_str_to_float(x) for x in strs)
+        return np.array([np.nan if v is None else v for v in vals],
+                        dtype=np.float64)
 
-        reader = csv.DictReader(fp)
-        link_seq_no = 0
-        for line in reader:
-            # it can be an empty string
-            link_id = line['link_id']
 
-            # check the validility
-            from_node_id = _convert_str_to_int(line['from_node_id'])
-            if from_node_id is None:
-                continue
+def _convert_strs_to_ints(strs, default=None):
+    """ vectorized _convert_str_to_int()
 
-            to_node_id =_convert_str_to_int(line['to_node_id'])
-            if to_node_id is None:
-                continue
+    Return the converted values along with a mask of the valid ones, where
+    the invalid ones are set to default if it is not None.
+    """
+    arr = _convert_strs_to_floats(strs)
+    valid = ~np.isnan(arr)
+    # the same as int(float(x)) in _convert_str_to_int()
+    vals = np.trunc(np.where(valid, arr, 0)).astype(np.int64)
+    if default is not None:
+        vals[~valid] = default
+
+    return vals, valid
+
+
+def _setup_nodes(node_ids,
+                 zone_ids,
+                 coords_x,
+                 coords_y,
+                 nodes,
+                 id_to_no_dict,
+                 no_to_id_dict,
+                 zone_to_node_dict,
+                 zone_id_to_zone_dict):
+    """ construct node objects and set up the mappings from node attributes """
+    for node_seq_no, (node_id, zone_id, coord_x, coord_y) in enumerate(
+        zip(node_ids, zone_ids, coords_x, coords_y)
+    ):
+        # construct node object
+        nodes.append(Node(node_seq_no, node_id, zone_id, x=coord_x, y=coord_y))
+
+        # set up mapping between node_seq_no and node_id
+        id_to_no_dict[node_id] = node_seq_no
+        no_to_id_dict[node_seq_no] = node_id
+
+        # associate node_id to corresponding zone
+        if zone_id not in zone_to_node_dict.keys():
+            zone_to_node_dict[zone_id] = []
+        zone_to_node_dict[zone_id].append(node_id)
+
+        if zone_id not in zone_id_to_zone_dict.keys():
+            zone_id_to_zone_dict[zone_id] = Zone(zone_id)
+
+
+def _setup_links(link_fields,
+                 vdf_params,
+                 links,
+                 nodes,
+                 link_id_dict,
+                 agent_type_size,
+                 demand_period_size,
+                 load_demand):
+    """ construct link objects from link attributes
+
+    link_fields is an iterable of (link_id, from_node_no, to_node_no, length,
+    lanes, link_type, free_speed, capacity, allowed_uses, geometry) and
+    vdf_params holds the VDF parameters of each link, i.e., a list of (alpha,
+    beta, mu, fftt, cap, phf) by demand period.
+    """
+    for link_seq_no, (fields, params) in enumerate(
+        zip(link_fields, vdf_params)
+    ):
+        link_id, from_node_no, to_node_no = fields[:3]
+        from_node = nodes[from_node_no]
+        to_node = nodes[to_node_no]
+
+        link_id_dict[link_id] = link_seq_no
+
+        # construct link ojbect
+        link = Link(link_id,
+                    link_seq_no,
+                    from_node_no,
+                    to_node_no,
+                    from_node.get_node_id(),
+                    to_node.get_node_id(),
+                    *fields[3:],
+                    agent_type_size,
+                    demand_period_size)
+
+        for i, p in enumerate(params):
+            link.vdfperiods.append(VDFPeriod(i, *p))
+
+        # set up outgoing links and incoming links
+        from_node.add_outgoing_link(link)
+        to_node.add_incoming_link(link)
+        from_node.to_node_2_link_seq_no_map[to_node_no] = link_seq_no
+        links.append(link)
+
+        # set up zone degrees
+        if load_demand:
+            _update_orig_zone(from_node.get_zone_id())
+            _update_dest_zone(to_node.get_zone_id())
 
-            length = _convert_str_to_float(line['length'])
-            if length is None:
-                continue
 
-            # pass validility check
+def read_nodes(input_dir,
+               nodes,
+               id_to_no_dict,
+               no_to_id_dict,
+               zone_to_node_dict,
+               zone_id_to_zone_dict):
 
-            try:
-                from_node_no = id_to_no_dict[from_node_id]
-                to_node_no = id_to_no_dict[to_node_id]
-            except KeyError:
-                print(f"EXCEPTION: Node ID {from_node_no} "
-                      f"or/and Node ID {to_node_id} NOT IN THE NETWORK!!")
-                continue
+    """ step 1: read input_node """
+    cols = _read_csv_columns(input_dir+'/node.csv', ['x_coord', 'y_coord'])
+    print('read node.csv')
 
-            # for the following attributes,
-            # if they are not None, convert them to the corresponding types
-            # if they are None's, set them using the default values
-            lanes = _convert_str_to_int(line['lanes'])
-            if lanes is None:
-                lanes = 1
-
-            link_type = _convert_str_to_int(line['link_type'])
-            if link_type is None:
-                link_type = 1
-
-            free_speed = _convert_str_to_int(line['free_speed'])
-            if free_speed is None:
-                free_speed = 60
-
-            # issue: int??
-            capacity = _convert_str_to_int(line['capacity'])
-            if capacity is None:
-                capacity = 49500
-
-            # if link.csv does not have no column 'allowed_uses',
-            # set allowed_uses to 'auto'
-            # developer's note:
-            # we may need to change this implemenation as we cannot deal with
-            # cases a link which is not open to any modes
-            try:
-                allowed_uses = line['allowed_uses']
-                if not allowed_uses:
-                    allowed_uses = 'all'
-            except KeyError:
-                allowed_uses = 'all'
-
-            # if link.csv does not have no column 'geometry',
-            # set geometry to ''
-            try:
-                geometry = line['geometry']
-            except KeyError:
-                geometry = ''
+    # set up node_id, which should be an integer
+    node_ids, valid = _convert_strs_to_ints(cols['node_id'])
+    # set up zone_id, which should be an integer
+    zone_ids, _ = _convert_strs_to_ints(cols['zone_id'], -1)
 
-            link_id_dict[link_id] = link_seq_no
-
-            # construct link ojbect
-            link = Link(link_id,
-                        link_seq_no,
-                        from_node_no,
-                        to_node_no,
-                        from_node_id,
-                        to_node_id,
-                        length,
-                        lanes,
-                        link_type,
-                        free_speed,
-                        capacity,
-                        allowed_uses,
-                        geometry,
-                        agent_type_size,
-                        demand_period_size)
-
-            # VDF Attributes
-            for i in range(demand_period_size):
-                header_vdf_alpha = 'VDF_alpha' + str(i+1)
-                header_vdf_beta = 'VDF_beta' + str(i+1)
-                header_vdf_mu = 'VDF_mu' + str(i+1)
-                header_vdf_fftt = 'VDF_fftt' + str(i+1)
-                header_vdf_cap = 'VDF_cap' + str(i+1)
-                header_vdf_phf = 'VDF_phf' + str(i+1)
-
-                # case i: link.csv does not VDF attributes at all
-                # case ii: link.csv only has partial VDF attributes
-                # under case i, we will set up only one VDFPeriod ojbect using
-                # default values
-                # under case ii, we will set up some VDFPeriod ojbects up to
-                # the number of complete set of VDF_alpha, VDF_beta, and VDF_mu
-                try:
-                    VDF_alpha = line[header_vdf_alpha]
-                    if VDF_alpha:
-                        VDF_alpha = float(VDF_alpha)
-                except (KeyError, TypeError):
-                    if i == 0:
-                        # default value will be applied in the constructor
-                        VDF_alpha = 0.15
-                    else:
-                        break
+    # treat them as string
+    coords_x = [x for x, v in zip(cols['x_coord'], valid) if v]
+    coords_y = [y for y, v in zip(cols['y_coord'], valid) if v]
 
-                try:
-                    VDF_beta = line[header_vdf_beta]
-                    if VDF_beta:
-                        VDF_beta = float(VDF_beta)
-                except (KeyError, TypeError):
-                    if i == 0:
-                        # default value will be applied in the constructor
-                        VDF_beta = 4
-                    else:
-                        break
+    _setup_nodes(node_ids[valid].tolist(),
+                 zone_ids[valid].tolist(),
+                 coords_x,
+                 coords_y,
+                 nodes,
+                 id_to_no_dict,
+                 no_to_id_dict,
+                 zone_to_node_dict,
+                 zone_id_to_zone_dict)
 
-                try:
-                    VDF_mu = line[header_vdf_mu]
-                    if VDF_mu:
-                        VDF_mu = float(VDF_mu)
-                except (KeyError, TypeError):
-                    if i == 0:
-                        # default value will be applied in the constructor
-                        VDF_mu = 1000
-                    else:
-                        break
+    print(f"the number of nodes is {len(nodes)}")
 
-                try:
-                    VDF_fftt = line[header_vdf_fftt]
-                    if VDF_fftt:
-                        VDF_fftt = float(VDF_fftt)
-                except (KeyError, TypeError):
-                    # set it up using length and free_speed from link
-                    VDF_fftt = length / max(0.001, free_speed) * 60
+    zone_size = len(zone_to_node_dict)
+    assert(zone_size==len(zone_id_to_zone_dict))
+    # do not count virtual zone with id as -1
+    if -1 in zone_to_node_dict.keys():
+        zone_size -= 1
 
-                try:
-                    VDF_cap = line[header_vdf_cap]
-                    if VDF_cap:
-                        VDF_cap = float(VDF_cap)
-                except (KeyError, TypeError):
-                    # set it up using capacity from link
-                    VDF_cap = capacity
-
-                # not a mandatory column
-                try:
-                    VDF_phf = line[header_vdf_phf]
-                    if VDF_phf:
-                        VDF_phf = float(VDF_phf)
-                except (KeyError, TypeError):
-                    # default value will be applied in the constructor
-                    VDF_phf = -1
+    print(f"the number of zones is {zone_size}")
 
-                # construct VDFPeriod object
-                vdf = VDFPeriod(i, VDF_alpha, VDF_beta, VDF_mu,
-                                VDF_fftt, VDF_cap, VDF_phf)
 
-                link.vdfperiods.append(vdf)
+def _get_vdf_values(cols, header, default, valid):
+    """ values of a VDF attribute for valid links
 
-            # set up outgoing links and incoming links
-            from_node = nodes[from_node_no]
-            to_node = nodes[to_node_no]
-            from_node.add_outgoing_link(link)
-            to_node.add_incoming_link(link)
-            from_node.to_node_2_link_seq_no_map[to_node.node_seq_no]=link.link_seq_no
-            links.append(link)
+    default is used if header is not in cols. Otherwise, the values will be
+    converted to floats at once, where empty ones are left as empty strings.
+    """
+    if header not in cols:
+        return default
 
-            # set up zone degrees
-            if load_demand:
-                oz_id = from_node.get_zone_id()
-                dz_id = to_node.get_zone_id()
-                _update_orig_zone(oz_id)
-                _update_dest_zone(dz_id)
+    vals = _convert_strs_to_floats(cols[header])[valid]
+    return ['' if x != x else x for x in vals.tolist()]
 
-            link_seq_no += 1
 
-        print(f"the number of links is {link_seq_no}")
+def read_links(input_dir,
+               links,
+               nodes,
+               id_to_no_dict,
+               link_id_dict,
+               zone_size,
+               agent_type_size,
+               demand_period_size,
+               load_demand):
 
+    """ step 2: read input_link
 
-def read_demand(input_dir,
-                file,
+    link.csv is parsed and converted column by column, see
+    _read_csv_columns(). Return the network topology built from valid links,
+    see _build_topology().
+    """
+    cols = _read_csv_columns(input_dir+'/link.csv',
+                             ['link_id', 'allowed_uses', 'geometry'])
+    print('read link.csv')
+
+    if load_demand:
+        _initialize_zone_degrees(zone_size)
+
+    # check the validility
+    from_node_ids, valid = _convert_strs_to_ints(cols['from_node_id'])
+    to_node_ids, valid_ = _convert_strs_to_ints(cols['to_node_id'])
+    valid &= valid_
+    lengths = _convert_strs_to_floats(cols['length'])
+    valid &= ~np.isnan(lengths)
+
+    # pass validility check
+    from_node_nos = np.array(
+        [id_to_no_dict.get(x, -1) for x in from_node_ids.tolist()],
+        dtype=np.int64
+    )
+    to_node_nos = np.array(
+        [id_to_no_dict.get(x, -1) for x in to_node_ids.tolist()],
+        dtype=np.int64
+    )
+    for i in np.flatnonzero(valid & ((from_node_nos < 0) | (to_node_nos < 0))):
+        print(f"EXCEPTION: Node ID {from_node_ids[i]} "
+              f"or/and Node ID {to_node_ids[i]} NOT IN THE NETWORK!!")
+        valid[i] = False
+
+    # for the following attributes,
+    # if they are not None, convert them to the corresponding types
+    # if they are None's, set them using the default values
+    lanes, _ = _convert_strs_to_ints(cols['lanes'], 1)
+    link_types, _ = _convert_strs_to_ints(cols['link_type'], 1)
+    free_speeds, _ = _convert_strs_to_ints(cols['free_speed'], 60)
+    # issue: int??
+    capacities, _ = _convert_strs_to_ints(cols['capacity'], 49500)
+
+    # it can be an empty string
+    link_ids = [x for x, v in zip(cols['link_id'], valid) if v]
+    link_size = len(link_ids)
+
+    # if link.csv does not have no column 'allowed_uses',
+    # set allowed_uses to 'all'
+    # developer's note:
+    # we may need to change this implemenation as we cannot deal with
+    # cases a link which is not open to any modes
+    if 'allowed_uses' in cols:
+        allowed_uses = [
+            x if x else 'all'
+            for x, v in zip(cols['allowed_uses'], valid) if v
+        ]
+    else:
+        allowed_uses = ['all'] * link_size
+
+    # if link.csv does not have no column 'geometry',
+    # set geometry to ''
+    if 'geometry' in cols:
+        geometries = [x for x, v in zip(cols['geometry'], valid) if v]
+    else:
+        geometries = [''] * link_size
+
+    lengths = lengths[valid]
+    free_speeds = free_speeds[valid]
+    capacities = capacities[valid]
+
+    # VDF Attributes
+    # case i: link.csv does not VDF attributes at all
+    # case ii: link.csv only has partial VDF attributes
+    # under case i, we will set up only one VDFPeriod ojbect using
+    # default values
+    # under case ii, we will set up some VDFPeriod ojbects up to
+    # the number of complete set of VDF_alpha, VDF_beta, and VDF_mu
+    vdf_params_by_period = []
+    for i in range(demand_period_size):
+        suffix = str(i+1)
+        if i > 0 and any(h+suffix not in cols
+                         for h in ['VDF_alpha', 'VDF_beta', 'VDF_mu']):
+            break
+
+        vdf_params_by_period.append(zip(
+            # default values will be applied in the constructor
+            _get_vdf_values(cols, 'VDF_alpha'+suffix, [0.15] * link_size,
+                            valid),
+            _get_vdf_values(cols, 'VDF_beta'+suffix, [4] * link_size, valid),
+            _get_vdf_values(cols, 'VDF_mu'+suffix, [1000] * link_size, valid),
+            # set it up using length and free_speed from link
+            _get_vdf_values(
+                cols, 'VDF_fftt'+suffix,
+                (lengths / np.maximum(0.001, free_speeds) * 60).tolist(),
+                valid
+            ),
+            # set it up using capacity from link
+            _get_vdf_values(cols, 'VDF_cap'+suffix, capacities.tolist(),
+                            valid),
+            # not a mandatory column
+            _get_vdf_values(cols, 'VDF_phf'+suffix, [-1] * link_size, valid)
+        ))
+
+    from_node_nos = from_node_nos[valid]
+    to_node_nos = to_node_nos[valid]
+
+    _setup_links(zip(link_ids,
+                     from_node_nos.tolist(),
+                     to_node_nos.tolist(),
+                     lengths.tolist(),
+                     lanes[valid].tolist(),
+                     link_types[valid].tolist(),
+                     free_speeds.tolist(),
+                     capacities.tolist(),
+                     allowed_uses,
+                     geometries),
+                 zip(*vdf_params_by_period),
+                 links,
+                 nodes,
+                 link_id_dict,
+                 agent_type_size,
+                 demand_period_size,
+                 load_demand)
+
+    print(f"the number of links is {len(links)}")
+
+    return _build_topology(from_node_nos, to_node_nos, len(nodes))
+
+
+def _add_demand(oz_ids,
+                dz_ids,
+                volumes,
                 agent_type_id,
                 demand_period_id,
                 zone_to_node_dict,
                 column_pool):
+    """ add OD volumes in arrays to column pool
 
-    """ step 3:read input_agent """
-    with open(input_dir+'/'+file, 'r', encoding='utf-8') as fp:
-        print('read demand.csv')
+    Invalid OD pairs are discarded in the same way as read_demand(). Return
+    the number of agents.
+    """
+    at = agent_type_id
+    dp = demand_period_id
+
+    oz_ids = np.asarray(oz_ids, dtype=np.int64)
+    dz_ids = np.asarray(dz_ids, dtype=np.int64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+
+    # o_zone_id or d_zone_id does not exist in node.csv, discard it
+    zone_ids = np.fromiter(zone_to_node_dict.keys(), dtype=np.int64)
+    valid = np.isin(oz_ids, zone_ids) & np.isin(dz_ids, zone_ids)
+    # invalid or zero volume, discard it
+    valid &= ~np.isnan(volumes) & (volumes != 0)
+
+    # precheck on connectivity of each OD pair
+    degrees = np.array(_zone_degrees, dtype=np.int64)
+    oz_degrees = degrees[oz_ids[valid]]
+    dz_degrees = degrees[dz_ids[valid]]
+    connected = (oz_degrees % 2 == 1) & (dz_degrees >= 2)
+    # print out the warnings on disconnected OD pairs
+    for oz_id, dz_id in zip(oz_ids[valid][~connected].tolist(),
+                            dz_ids[valid][~connected].tolist()):
+        _are_od_connected(oz_id, dz_id)
+    valid[valid] = connected
+
+    volumes = volumes[valid]
+    # set up volume for ColumnVec
+    for oz_id, dz_id, vol in zip(oz_ids[valid].tolist(),
+                                 dz_ids[valid].tolist(),
+                                 volumes.tolist()):
+        if (at, dp, oz_id, dz_id) not in column_pool.keys():
+            column_pool[(at, dp, oz_id, dz_id)] = ColumnVec()
+        column_pool[(at, dp, oz_id, dz_id)].od_vol += vol
+
+    # the same as int(volume + 1) for each OD pair
+    return int((volumes + 1).astype(np.int64).sum())
+
+
+def _load_demand_tables(filename):
+    """ load OD tables from an OD matrix file by save_demand_matrices()
+
+    Return zone ids as the zone index and a dict of OD tables, each of which
+    is keyed by (agent type, demand period) and consists of origin zone
+    indices, destination zone indices, and volumes of nonzero OD pairs.
+    """
+    with np.load(filename) as data:
+        zone_ids = data['zone_ids']
+        tables = {}
+        for i, (at, dp, sparse) in enumerate(
+            zip(data['agent_types'].tolist(),
+                data['demand_periods'].tolist(),
+                data['sparse'].tolist())
+        ):
+            if sparse:
+                tables[(at, dp)] = (
+                    data[f'orig_idx{i}'], data[f'dest_idx{i}'], data[f'vol{i}']
+                )
+            else:
+                mat = data[f'matrix{i}']
+                orig_idx, dest_idx = np.nonzero(mat)
+                tables[(at, dp)] = (orig_idx, dest_idx, mat[orig_idx, dest_idx])
 
-        at = agent_type_id
-        dp = demand_period_id
+    return zone_ids, tables
 
-        reader = csv.DictReader(fp)
-        total_agents = 0
-        for line in reader:
-            # invalid origin zone id, discard it
-            oz_id = _convert_str_to_int(line['o_zone_id'])
-            if oz_id is None:
-                continue
 
-            # invalid destinationzone id, discard it
-            dz_id = _convert_str_to_int(line['d_zone_id'])
-            if dz_id is None:
-                continue
+def read_demand(input_dir,
+                file,
+                agent_type_id,
+                demand_period_id,
+                zone_to_node_dict,
+                column_pool,
+                table=None):
 
-            # o_zone_id does not exist in node.csv, discard it
-            if oz_id not in zone_to_node_dict.keys():
-                continue
+    """ step 3:read input_agent
 
-            # d_zone_id does not exist in node.csv, discard it
-            if dz_id not in zone_to_node_dict.keys():
-                continue
+    file can be either a csv file or an OD matrix file (.npz) by
+    save_demand_matrices(). For the latter, table is (agent type, demand
+    period) to retrieve the corresponding OD table. It can be omitted if
+    there is only one OD table in file.
+    """
+    filename = input_dir+'/'+file
+    if file.endswith('.npz'):
+        print(f'read {file}')
+
+        zone_ids, tables = _load_demand_tables(filename)
+        if table not in tables:
+            if len(tables) != 1:
+                raise Exception(f'NO OD TABLE {table} IN {file}')
+            table = next(iter(tables))
+
+        orig_idx, dest_idx, volumes = tables[table]
+        oz_ids = zone_ids[orig_idx]
+        dz_ids = zone_ids[dest_idx]
+    else:
+        cols = _read_csv_columns(filename)
+        print('read demand.csv')
 
-            volume = _convert_str_to_float(line['volume'])
-            if volume is None:
-                continue
+        # invalid origin zone id or destination zone id, discard it
+        oz_ids, valid = _convert_strs_to_ints(cols['o_zone_id'])
+        dz_ids, valid_ = _convert_strs_to_ints(cols['d_zone_id'])
+        valid &= valid_
 
-            if volume == 0:
-                continue
+        oz_ids = oz_ids[valid]
+        dz_ids = dz_ids[valid]
+        volumes = _convert_strs_to_floats(cols['volume'])[valid]
 
-            # precheck on connectivity of each OD pair
-            if not _are_od_connected(oz_id, dz_id):
-                continue
+    total_agents = _add_demand(oz_ids,
+                               dz_ids,
+                               volumes,
+                               agent_type_id,
+                               demand_period_id,
+                               zone_to_node_dict,
+                               column_pool)
 
-            # set up volume for ColumnVec
-            if (at, dp, oz_id, dz_id) not in column_pool.keys():
-                column_pool[(at, dp, oz_id, dz_id)] = ColumnVec()
-            column_pool[(at, dp, oz_id, dz_id)].od_vol += volume
+    print(f"the number of agents is {total_agents}")
 
-            total_agents += int(volume + 1)
+    if total_agents == 0:
+        raise Exception('NO VALID OD VOLUME!! DOUBLE CHECK YOUR demand.csv')
 
-        print(f"the number of agents is {total_agents}")
 
-        if total_agents == 0:
-            raise Exception('NO VALID OD VOLUME!! DOUBLE CHECK YOUR demand.csv')
+def read_measurement(input_dir,nodes,links,zones,id_to_no_dict,zone_to_node_dict,zone_id_to_zone_dict,
+                     file='measurement.csv', demand_period_ids=None):
+    """ for odme
 
-def read_measurement(input_dir,nodes,links,zones,id_to_no_dict,zone_to_node_dict,zone_id_to_zone_dict):
-    """ for odme """
+    Link counts are observed by demand period, which is given in the optional
+    column of demand_period and mapped to its id using demand_period_ids
+    (i.e., a dict of demand period to its id). Link counts without it are
+    taken as the ones of the first demand period. Productions and attractions
+    are always over all demand periods.
+    """
 
     """ step :read input_agent """
-    with open(input_dir+'/measurement.csv', 'r', encoding='utf-8') as fp:
-        print('read measurement.csv')
+    with open(input_dir+'/'+file, 'r', encoding='utf-8') as fp:
+        print(f'read {file}')
         reader = csv.DictReader(fp)
         for line in reader:
             if line["measurement_type"]=="link":
@@ -507,7 +735,13 @@ def read_measurement(input_dir,nodes,links,zones,id_to_no_dict,zone_to_node_dict
                 from_node=id_to_no_dict[from_node_id]
                 to_node=id_to_no_dict[to_node_id]
                 link_seq=nodes[from_node].to_node_2_link_seq_no_map[to_node]
-                links[link_seq].obs_count=float(line["count"])
+                tau = 0
+                dp = line.get('demand_period')
+                if dp:
+                    if demand_period_ids is None or dp not in demand_period_ids:
+                        raise Exception('NO demand period: '+dp)
+                    tau = demand_period_ids[dp]
+                links[link_seq].obs_count_by_period[tau]=float(line["count"])
             elif line["measurement_type"]=="production":
                 zone_no=_convert_str_to_int(line['o_zone_id'])
                 zone_id_to_zone_dict[zone_no].obs_production=float(line["count"])
@@ -597,28 +831,284 @@ def read_settings(input_dir, assignment):
         raise e
 
 
-def read_network(load_demand='true', input_dir='.',odme=False):
+def _get_network_snapshot_key(input_dir, demand_period_size):
+    """ hash of node.csv, link.csv, and anything else affecting parsing them """
+    h = hashlib.sha1(f'{SNAPSHOT_VERSION},{demand_period_size}'.encode())
+
+    for file in ['node.csv', 'link.csv']:
+        with open(input_dir+'/'+file, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                h.update(chunk)
+
+    return h.hexdigest()
+
+
+_TOPOLOGY_ARRAYS = ['from_node_no', 'to_node_no', 'first_link_from',
+                    'last_link_from', 'sorted_link_no']
+
+
+def _map_network_snapshot(snapshot_path, network):
+    """ memory-map the network topology and BPR parameters in snapshot_path
+    as read-only, which are used by network directly
+    """
+    network.topology_arrays = {
+        name: np.load(os.path.join(snapshot_path, name+'.npy'), mmap_mode='r')
+        for name in _TOPOLOGY_ARRAYS
+    }
+    network.bpr_params = np.load(os.path.join(snapshot_path, 'bpr_params.npy'),
+                                 mmap_mode='r')
+
+
+def _get_network_snapshot_path(snapshot_dir, key):
+    """ each snapshot lives in its own subdirectory of snapshot_dir named by
+    its key, which is never modified once it is in place
+    """
+    return os.path.join(snapshot_dir, key)
+
+
+def _save_network_snapshot(network, snapshot_dir, key, demand_period_size):
+    """ save parsed nodes and links as numpy arrays to snapshot_dir
+
+    Each array goes to its own .npy file. All of them and key.txt (the last
+    one) are written to a temporary directory, which is then renamed to the
+    snapshot path in one go. Therefore, an incomplete snapshot will never be
+    picked up by _load_network_snapshot(), and a snapshot in use, e.g., being
+    memory-mapped by other processes, will never be overwritten.
+
+    Snapshots with other keys (i.e., stale ones) are removed afterwards.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    nodes = network.node_list
+    links = network.link_list
+
+    # VDF parameters by link and demand period, where an empty string from
+    # link.csv is saved as nan
+    vdf_size = max((len(link.vdfperiods) for link in links), default=0)
+    vdf_params = np.full((len(links), vdf_size, 6), np.nan)
+    for i, link in enumerate(links):
+        for j, vdf in enumerate(link.vdfperiods):
+            vdf_params[i, j] = [
+                np.nan if x == '' else x
+                for x in (vdf.alpha, vdf.beta, vdf.mu,
+                          vdf.fftt, vdf.capacity, vdf.phf)
+            ]
+
+    arrays = {
+        'node_id': np.array([x.external_node_id for x in nodes],
+                            dtype=np.int64),
+        'zone_id': np.array([x.zone_id for x in nodes], dtype=np.int64),
+        'coord_x': np.array([x.coord_x for x in nodes], dtype=str),
+        'coord_y': np.array([x.coord_y for x in nodes], dtype=str),
+        'link_id': np.array([x.id for x in links], dtype=str),
+        'from_node_no': np.array([x.from_node_seq_no for x in links],
+                                 dtype=np.int64),
+        'to_node_no': np.array([x.to_node_seq_no for x in links],
+                               dtype=np.int64),
+        'length': np.array([x.length for x in links], dtype=np.float64),
+        'lanes': np.array([x.lanes for x in links], dtype=np.int64),
+        'link_type': np.array([x.type for x in links], dtype=np.int64),
+        'free_speed': np.array([x.free_speed for x in links], dtype=np.int64),
+        'capacity': np.array([x.lane_capacity for x in links],
+                             dtype=np.int64),
+        'allowed_uses': np.array([x.allowed_uses for x in links], dtype=str),
+        'geometry': np.array([x.geometry for x in links], dtype=str),
+        'vdf_size': np.array([len(x.vdfperiods) for x in links],
+                             dtype=np.int64),
+        'vdf_params': vdf_params,
+        'bpr_params': LinkArrays.get_bpr_params(links, demand_period_size)
+    }
+
+    # c_int is 32-bit on all platforms supported by the path engine
+    for name, arr in zip(_TOPOLOGY_ARRAYS, network.get_topology()):
+        arrays[name] = np.array(arr, dtype=np.int32)
+
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=snapshot_dir)
+    try:
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_dir, name+'.npy'), arr)
+
+        with open(os.path.join(tmp_dir, 'key.txt'), 'w') as fp:
+            fp.write(key)
+
+        # it fails if the same snapshot has been put in place by another
+        # process in the meantime, which is as good as ours
+        os.rename(tmp_dir, _get_network_snapshot_path(snapshot_dir, key))
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(_get_network_snapshot_path(snapshot_dir, key)):
+            raise
+
+    # stale snapshots can still be safely removed while memory-mapped on
+    # POSIX systems, and they are simply left over if not (e.g., on Windows)
+    for name in os.listdir(snapshot_dir):
+        if name != key and not name.startswith('.'):
+            path = os.path.join(snapshot_dir, name)
+            if os.path.isfile(os.path.join(path, 'key.txt')):
+                shutil.rmtree(path, ignore_errors=True)
+
+    print(f'save network snapshot to {snapshot_dir}')
+
+
+def _load_network_snapshot(snapshot_dir, key, network, agent_type_size,
+                           demand_period_size, load_demand, mmap=False):
+    """ set up nodes and links of network from snapshot_dir
+
+    If mmap is True, the snapshot will be memory-mapped and the network
+    topology will wrap the mapping, see Network.allocate_for_CAPI().
+
+    Return False if there is no valid snapshot matching key.
+    """
+    mmap_mode = 'r' if mmap else None
+    snapshot_path = _get_network_snapshot_path(snapshot_dir, key)
+    try:
+        with open(os.path.join(snapshot_path, 'key.txt')) as fp:
+            if fp.read() != key:
+                return False
+
+        if mmap:
+            _map_network_snapshot(snapshot_path, network)
+
+        arr = {
+            name: np.load(os.path.join(snapshot_path, name+'.npy'),
+                          mmap_mode=mmap_mode)
+            for name in ['node_id', 'zone_id', 'coord_x', 'coord_y',
+                         'link_id', 'from_node_no', 'to_node_no', 'length',
+                         'lanes', 'link_type', 'free_speed', 'capacity',
+                         'allowed_uses', 'geometry', 'vdf_size', 'vdf_params',
+                         'bpr_params']
+        }
+    except (OSError, ValueError):
+        network.topology_arrays = None
+        network.bpr_params = None
+        return False
+
+    print(f'load network snapshot from {snapshot_dir}')
+
+    _setup_nodes(arr['node_id'].tolist(),
+                 arr['zone_id'].tolist(),
+                 arr['coord_x'].tolist(),
+                 arr['coord_y'].tolist(),
+                 network.node_list,
+                 network.internal_node_seq_no_dict,
+                 network.external_node_id_dict,
+                 network.zone_to_nodes_dict,
+                 network.zone_id_to_zone_dict)
+
+    print(f"the number of nodes is {len(network.node_list)}")
+
+    if load_demand:
+        _initialize_zone_degrees(network.get_zone_size())
+
+    vdf_params = [
+        [['' if x != x else x for x in params] for params in link_params[:n]]
+        for link_params, n in zip(arr['vdf_params'].tolist(),
+                                  arr['vdf_size'].tolist())
+    ]
+
+    _setup_links(zip(arr['link_id'].tolist(),
+                     arr['from_node_no'].tolist(),
+                     arr['to_node_no'].tolist(),
+                     arr['length'].tolist(),
+                     arr['lanes'].tolist(),
+                     arr['link_type'].tolist(),
+                     arr['free_speed'].tolist(),
+                     arr['capacity'].tolist(),
+                     arr['allowed_uses'].tolist(),
+                     arr['geometry'].tolist()),
+                 vdf_params,
+                 network.link_list,
+                 network.node_list,
+                 network.link_id_dict,
+                 agent_type_size,
+                 demand_period_size,
+                 load_demand)
+
+    if not mmap:
+        network.topology_arrays = _build_topology(arr['from_node_no'],
+                                                  arr['to_node_no'],
+                                                  len(network.node_list))
+        network.bpr_params = arr['bpr_params']
+
+    print(f"the number of links is {len(network.link_list)}")
+
+    return True
+
+
+def read_network(load_demand='true', input_dir='.',odme=False,
+                 memory_blocks=0, memory_budget=None, snapshot_dir=None,
+                 mmap_snapshot=False):
+    """ read network, demand, and settings from input_dir
+
+    memory_blocks is the number of groups of origin zones, each of which comes
+    with its own SPNetworks and is processed by its own thread in column
+    generation. If it is 0, it will be determined by the number of CPU cores
+    and memory_budget (in bytes, and a quarter of the physical memory will be
+    used if it is None). Threads only overlap in shortest path calculations by
+    the C++ path engine, while setting up columns from shortest path trees is
+    serialized by the GIL.
+
+    If snapshot_dir is not None, nodes and links will be loaded from the
+    network snapshot in it as long as node.csv and link.csv are unchanged
+    since the snapshot was taken. Otherwise, they will be parsed from the two
+    files and a new snapshot will be saved to snapshot_dir.
+
+    If mmap_snapshot is True, the snapshot will be memory-mapped as read-only.
+    The path engine will work on the mapped network topology directly, and so
+    will the BPR functions on the mapped BPR parameters of links (see
+    LinkArrays). Therefore, processes reading the same snapshot share one
+    physical copy of these arrays via the page cache. Note that Node, Link,
+    and VDFPeriod objects are still set up from the snapshot in each process.
+    """
     assignm = Assignment()
+    assignm.memory_blocks = memory_blocks
+    assignm.memory_budget = memory_budget
     network = Network()
 
     read_settings(input_dir, assignm)
 
-    read_nodes(input_dir,
-               network.node_list,
-               network.internal_node_seq_no_dict,
-               network.external_node_id_dict,
-               network.zone_to_nodes_dict,
-               network.zone_id_to_zone_dict)
-
-    read_links(input_dir,
-               network.link_list,
-               network.node_list,
-               network.internal_node_seq_no_dict,
-               network.link_id_dict,
-               network.get_zone_size(),
-               assignm.get_agent_type_count(),
-               assignm.get_demand_period_count(),
-               load_demand)
+    snapshot_key = None
+    if snapshot_dir is not None:
+        snapshot_key = _get_network_snapshot_key(
+            input_dir, assignm.get_demand_period_count()
+        )
+
+    if snapshot_key is None or not _load_network_snapshot(
+        snapshot_dir,
+        snapshot_key,
+        network,
+        assignm.get_agent_type_count(),
+        assignm.get_demand_period_count(),
+        load_demand,
+        mmap_snapshot
+    ):
+        read_nodes(input_dir,
+                   network.node_list,
+                   network.internal_node_seq_no_dict,
+                   network.external_node_id_dict,
+                   network.zone_to_nodes_dict,
+                   network.zone_id_to_zone_dict)
+
+        network.topology_arrays = read_links(input_dir,
+                   network.link_list,
+                   network.node_list,
+                   network.internal_node_seq_no_dict,
+                   network.link_id_dict,
+                   network.get_zone_size(),
+                   assignm.get_agent_type_count(),
+                   assignm.get_demand_period_count(),
+                   load_demand)
+
+        if snapshot_key is not None:
+            _save_network_snapshot(network,
+                                   snapshot_dir,
+                                   snapshot_key,
+                                   assignm.get_demand_period_count())
+            if mmap_snapshot:
+                _map_network_snapshot(
+                    _get_network_snapshot_path(snapshot_dir, snapshot_key),
+                    network
+                )
     if odme:
         read_measurement(input_dir,
                          network.node_list,
@@ -626,7 +1116,8 @@ def read_network(load_demand='true', input_dir='.',odme=False):
                          network.get_zones(),
                          network.internal_node_seq_no_dict,
                          network.zone_to_nodes_dict,
-                         network.zone_id_to_zone_dict
+                         network.zone_id_to_zone_dict,
+                         demand_period_ids=assignm.map_dp_id
                    )
 
     if load_demand:
@@ -638,7 +1129,8 @@ def read_network(load_demand='true', input_dir='.',odme=False):
                         at,
                         dp,
                         network.zone_to_nodes_dict,
-                        assignm.column_pool)
+                        assignm.column_pool,
+                        (d.get_agent_type(), d.get_period()))
 
     network.update(assignm.get_agent_type_count(),
                    assignm.get_demand_period_count())
@@ -782,15 +1274,252 @@ def load_columns(ui, input_dir='.'):
         update_links_using_columns(ui)
 
 
-def output_columns(ui, output_geometry=True, output_dir='.'):
-    with open(output_dir+'/agent.csv', 'w',  newline='') as fp:
+def _open_output_file(filename, compression):
+    """ open filename in binary mode for writing with optional compression
+
+    compression can be None, 'gzip', or 'zstd', where the latter two append
+    .gz and .zst to filename, respectively.
+
+    Return the file object and the actual file name.
+    """
+    if compression == 'zstd':
+        try:
+            import zstandard as zstd
+
+            filename += '.zst'
+            return (zstd.ZstdCompressor().stream_writer(open(filename, 'wb')),
+                    filename)
+        except ImportError:
+            # just in case user does not have zstandard installed
+            print('Please intall zstandard for zstd compression!')
+            print('gzip will be used instead.\n')
+            compression = 'gzip'
+
+    if compression == 'gzip':
+        filename += '.gz'
+        return gzip.open(filename, 'wb', compresslevel=6), filename
+
+    if compression is None:
+        return open(filename, 'wb'), filename
+
+    raise Exception('Please choose correct compression: None, gzip, or zstd')
+
+
+class _BufferedCSVWriter:
+    """ csv writer formatting rows in chunks and writing them in background
+
+    Rows are formatted into an in-memory buffer, which is handed over to a
+    background thread to encode, compress (optional), and write to file once
+    it holds chunk_size rows. Therefore, formatting and file I/O overlap.
+    """
+    def __init__(self, filename, compression=None, chunk_size=10000):
+        self.fp, self.filename = _open_output_file(filename, compression)
+        self.chunk_size = chunk_size
+        self.row_num = 0
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf)
+        self.error = None
+        # bound the number of pending chunks to cap memory usage
+        self.chunks = queue.Queue(maxsize=4)
+        self.thread = threading.Thread(target=self._write_chunks)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+
+            # keep consuming chunks on error so that the producer never blocks
+            if self.error is not None:
+                continue
+
+            try:
+                self.fp.write(chunk.encode('utf-8'))
+            except Exception as e:
+                self.error = e
+
+    def _flush(self):
+        if self.row_num:
+            self.chunks.put(self.buf.getvalue())
+            self.buf = io.StringIO()
+            self.writer = csv.writer(self.buf)
+            self.row_num = 0
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.row_num += 1
+        if self.row_num >= self.chunk_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self.chunks.put(None)
+        self.thread.join()
+        self.fp.close()
+
+        if self.error is not None:
+            raise self.error
+
+
+def save_column_pool(ui, output_dir='.'):
+    """ save column pool to column_pool.npz in binary
+
+    OD pairs, columns, and their attributes are saved as numpy arrays. Node
+    and link sequences of columns are delta encoded and then stored as
+    varints, which can be restored by load_column_pool().
+    """
+    np.savez_compressed(output_dir+'/column_pool.npz',
+                        **get_column_pool_arrays(ui._base_assignment))
+
+
+def load_column_pool(ui, input_dir='.'):
+    """ load column pool from column_pool.npz by save_column_pool()
+
+    Each OD pair in column_pool.npz, along with its OD volume and columns,
+    will replace the existing one in column pool. Link volumes and travel
+    times will be updated accordingly.
+    """
+    with np.load(input_dir+'/column_pool.npz') as data:
+        print('read column_pool.npz')
+
+        A = ui._base_assignment
+        link_arr = restore_column_pool(A, data)
+
+        # update link volumes in bulk, where columns between OD pairs
+        # without positive volume do not contribute as in column generation
+        col_nums = data['col_nums']
+        link_nums = data['link_nums']
+        od_vols = data['od_vols']
+
+        link_size = len(A.get_links())
+        dp_size = A.get_demand_period_count()
+        col_taus = np.repeat(data['od_keys'][:, 1], col_nums)
+        col_vols = np.where(np.repeat(od_vols > 0, col_nums), data['vols'], 0)
+        link_vols = np.bincount(
+            np.repeat(col_taus, link_nums) * link_size + link_arr,
+            weights=np.repeat(col_vols, link_nums),
+            minlength=dp_size * link_size
+        ).reshape(dp_size, link_size)
+
+        for link, vols_by_period in zip(A.get_links(), link_vols.T.tolist()):
+            for tau, v in enumerate(vols_by_period):
+                link.flow_vol_by_period[tau] = v
+
+        A.get_network().get_link_arrays().update_travel_times()
+
+
+def save_demand_matrices(ui, output_dir='.', sparse=None):
+    """ save OD volumes in column pool to demand.npz as OD matrices
+
+    There is one OD table for each pair of agent type and demand period, which
+    can be stored as either a dense matrix or a sparse one (i.e., zone indices
+    and volumes of nonzero OD pairs) over a common zone index. If sparse is
+    None, the format of each table will be decided by its density.
+
+    demand.npz can be read back via read_demand_matrices() or used as a demand
+    file in settings.yml.
+    """
+    A = ui._base_assignment
+
+    # zone index, do not count virtual zone with id as -1
+    zone_ids = np.array(
+        sorted(z for z in A.network.zone_to_nodes_dict.keys() if z != -1),
+        dtype=np.int64
+    )
+    zone_size = len(zone_ids)
+
+    od_tables = {}
+    for (at, dp, oz_id, dz_id), cv in A.get_column_pool().items():
+        if cv.get_od_volume() == 0:
+            continue
+        if (at, dp) not in od_tables:
+            od_tables[(at, dp)] = ([], [], [])
+        od_tables[(at, dp)][0].append(oz_id)
+        od_tables[(at, dp)][1].append(dz_id)
+        od_tables[(at, dp)][2].append(cv.get_od_volume())
+
+    arrays = {'zone_ids': zone_ids}
+    sparse_flags = []
+    for i, (oz_ids, dz_ids, vols) in enumerate(od_tables.values()):
+        orig_idx = np.searchsorted(zone_ids, oz_ids).astype(np.int32)
+        dest_idx = np.searchsorted(zone_ids, dz_ids).astype(np.int32)
+        vols = np.array(vols, dtype=np.float64)
+
+        # a sparse table takes 16 bytes for each nonzero OD pair while a dense
+        # one takes 8 bytes for each OD pair
+        is_sparse = sparse
+        if is_sparse is None:
+            is_sparse = 2 * len(vols) < zone_size ** 2
+
+        if is_sparse:
+            arrays[f'orig_idx{i}'] = orig_idx
+            arrays[f'dest_idx{i}'] = dest_idx
+            arrays[f'vol{i}'] = vols
+        else:
+            mat = np.zeros((zone_size, zone_size))
+            mat[orig_idx, dest_idx] = vols
+            arrays[f'matrix{i}'] = mat
+
+        sparse_flags.append(is_sparse)
+
+    arrays['agent_types'] = np.array(
+        [A.get_agent_type_str(at) for at, _ in od_tables.keys()], dtype=str
+    )
+    arrays['demand_periods'] = np.array(
+        [A.get_demand_period_str(dp) for _, dp in od_tables.keys()], dtype=str
+    )
+    arrays['sparse'] = np.array(sparse_flags, dtype=bool)
+
+    np.savez_compressed(output_dir+'/demand.npz', **arrays)
+
+
+def read_demand_matrices(filename='demand.npz'):
+    """ read all OD tables from an OD matrix file by save_demand_matrices()
+
+    Return zone ids along with a dict of dense OD matrices keyed by (agent
+    type, demand period), where the matrices are indexed by the positions of
+    zone ids.
+    """
+    zone_ids, tables = _load_demand_tables(filename)
+    zone_size = len(zone_ids)
+
+    matrices = {}
+    for k, (orig_idx, dest_idx, vols) in tables.items():
+        mat = np.zeros((zone_size, zone_size))
+        mat[orig_idx, dest_idx] = vols
+        matrices[k] = mat
+
+    return zone_ids, matrices
+
+
+def output_columns(ui, output_geometry=True, output_dir='.',
+                   compression=None):
+    """ output columns to agent.csv
+
+    compression can be 'gzip' or 'zstd' (requiring zstandard), which appends
+    .gz or .zst to the file name. The same goes for the other output
+    functions.
+    """
+    with _BufferedCSVWriter(output_dir+'/agent.csv', compression) as writer:
         base = ui._base_assignment
 
         nodes = base.get_nodes()
         links = base.get_links()
         column_pool = base.get_column_pool()
 
-        writer = csv.writer(fp)
+        # build strings of node ids, link ids, and node coordinates only once
+        # rather than for every column
+        node_ids = [str(node.get_node_id()) for node in nodes]
+        link_ids = [str(link.get_link_id()) for link in links]
+        if output_geometry:
+            coords = [node.get_coordinate() for node in nodes]
 
         line = ['agent_id',
                 'o_zone_id',
@@ -826,16 +1555,16 @@ def output_columns(ui, output_geometry=True, output_dir='.'):
             for col in cv.get_columns().values():
                 i += 1
                 node_seq = path_sep.join(
-                    str(nodes[x].get_node_id()) for x in reversed(col.nodes)
+                    node_ids[x] for x in reversed(col.nodes)
                 )
                 link_seq = path_sep.join(
-                    str(links[x].get_link_id()) for x in reversed(col.links)
+                    link_ids[x] for x in reversed(col.links)
                 )
 
                 geometry = ''
                 if output_geometry:
                     geometry = ', '.join(
-                        nodes[x].get_coordinate() for x in reversed(col.nodes)
+                        coords[x] for x in reversed(col.nodes)
                     )
                     geometry = 'LINESTRING (' + geometry + ')'
 
@@ -855,22 +1584,25 @@ def output_columns(ui, output_geometry=True, output_dir='.'):
 
                 writer.writerow(line)
 
+        filename = os.path.basename(writer.filename)
         if output_dir == '.':
-            print('\ncheck agent.csv in '
+            print(f'\ncheck {filename} in '
                   +os.getcwd()+' for path finding results')
         else:
-            print('\ncheck agent.csv in '
+            print(f'\ncheck {filename} in '
                   +os.path.join(os.getcwd(), output_dir)
                   +' for path finding results')
 
 
-def output_link_performance(ui, output_dir='.'):
-    with open(output_dir+'/link_performance.csv', 'w',  newline='') as fp:
+def output_link_performance(ui, output_dir='.', compression=None):
+    with _BufferedCSVWriter(output_dir+'/link_performance.csv',
+                            compression) as writer:
         base = ui._base_assignment
 
         links = base.get_links()
-
-        writer = csv.writer(fp)
+        link_arrays = base.get_network().get_link_arrays()
+        travel_times = link_arrays.get_travel_times().tolist()
+        vocs = link_arrays.get_vocs().tolist()
 
         line = ['link_id',
                 'from_node_id',
@@ -887,9 +1619,10 @@ def output_link_performance(ui, output_dir='.'):
 
         writer.writerow(line)
 
-        for link in links:
+        for i, link in enumerate(links):
             for dp in base.get_demand_periods():
-                avg_travel_time = link.get_period_avg_travel_time(dp.get_id())
+                tau = dp.get_id()
+                avg_travel_time = travel_times[tau][i]
                 speed = link.get_length() / (max(0.001, avg_travel_time) / 60)
 
                 line = [link.get_link_id(),
@@ -899,7 +1632,7 @@ def output_link_performance(ui, output_dir='.'):
                         link.get_period_flow_vol(dp.get_id()),
                         avg_travel_time,
                         speed,
-                        link.get_period_voc(dp.get_id()),
+                        vocs[tau][i],
                         '',
                         '',
                         link.get_geometry(),
@@ -907,65 +1640,49 @@ def output_link_performance(ui, output_dir='.'):
 
                 writer.writerow(line)
 
+        filename = os.path.basename(writer.filename)
         if output_dir == '.':
-            print('\ncheck link_performance.csv in '
+            print(f'\ncheck {filename} in '
                   +os.getcwd()+' for link performance')
         else:
-            print('\ncheck link_performance.csv in '
+            print(f'\ncheck {filename} in '
                   +os.path.join(os.getcwd(), output_dir)
                   +' for link performance')
 
-def output_odme_performance(ui, output_dir='.'):
-    with open(output_dir+'/odme_performance.csv', 'w',  newline='') as fp:
-        base = ui._base_assignment
-        network=base.get_network()
-        nodes=base.get_nodes()
-        links = base.get_links()
-        zones = base.get_zones()
-        writer = csv.writer(fp)
+_ODME_PERFORMANCE_HEADERS = ['measurement_type',
+                             'o_zone_id',
+                             'd_zone_id',
+                             'from_node_id',
+                             'to_node_id',
+                             'obs_count',
+                             'est_count',
+                             'demand_period']
 
-        line = ['measurement_type',
-                'o_zone_id',
-                'd_zone_id',
-                'from_node_id',
-                'to_node_id',
-                'obs_count',
-                'est_count']
 
-        writer.writerow(line)
+def output_odme_performance(ui, output_dir='.', compression=None):
+    with _BufferedCSVWriter(output_dir+'/odme_performance.csv',
+                            compression) as writer:
+        base = ui._base_assignment
 
-        for link in links:
-            if link.obs_count>0:  #with data
-                measurement_type="link"
-                from_node_id=link.external_from_node
-                to_node_id=link.external_to_node
-                obs_count=link.obs_count
-                est_count=link.flow_vol_by_period[0]
-                line=[measurement_type,"","",from_node_id,to_node_id,obs_count,est_count]
-                writer.writerow(line)
-        for zone in zones:
-            if network.zone_id_to_zone_dict[zone].obs_production >0:
-                measurement_type="production"
-                o_zone_id=zone
-                obs_count=network.zone_id_to_zone_dict[zone].obs_production
-                est_count=network.zone_id_to_zone_dict[zone].est_production
-                line=[measurement_type,o_zone_id,"","","",obs_count,est_count]
-                writer.writerow(line)
-            if network.zone_id_to_zone_dict[zone].obs_attraction >0:
-                measurement_type="attraction"
-                d_zone_id=zone
-                obs_count=network.zone_id_to_zone_dict[zone].obs_attraction
-                est_count=network.zone_id_to_zone_dict[zone].est_attraction
-                line=[measurement_type,"",d_zone_id,"","",obs_count,est_count]
-                writer.writerow(line)
+        writer.writerow(_ODME_PERFORMANCE_HEADERS)
 
-def output_path_link_propotion(ui, output_dir='.'):
-    with open(output_dir+'/path_link_propotion.csv', 'w',  newline='') as fp:
+        for line in _get_odme_performance(base):
+            writer.writerow(line)
+
+def output_path_link_propotion(ui, output_dir='.', compression=None):
+    with _BufferedCSVWriter(output_dir+'/path_link_propotion.csv',
+                            compression) as writer:
         base = ui._base_assignment
         links = base.get_links()
-        writer = csv.writer(fp)
         column_pool = base.get_column_pool()
 
+        # link id, from node id, and to node id of each link
+        link_attrs = [
+            (link.get_link_id(), link.get_from_node_id(),
+             link.get_to_node_id())
+            for link in links
+        ]
+
         line = ['agent_id',
                 'o_zone_id',
                 'd_zone_id',
@@ -990,15 +1707,15 @@ def output_path_link_propotion(ui, output_dir='.'):
 
             for col in cv.get_columns().values():
                 i+=1
+                path_id = col.get_seq_no()
                 for x in reversed(col.links):
-                    line=[i,oz_id,dz_id,col.get_seq_no(),links[x].get_link_id(),links[x].get_from_node_id(),
-                    links[x].get_to_node_id(),1]
+                    line=[i,oz_id,dz_id,path_id,*link_attrs[x],1]
                     writer.writerow(line)
               
-def output_od_path_propotion(ui, output_dir='.'):
-    with open(output_dir+'/od_path_propotion.csv', 'w',  newline='') as fp:
+def output_od_path_propotion(ui, output_dir='.', compression=None):
+    with _BufferedCSVWriter(output_dir+'/od_path_propotion.csv',
+                            compression) as writer:
         base = ui._base_assignment
-        writer = csv.writer(fp)
         column_pool = base.get_column_pool()
 
         line = ['agent_id',
@@ -1025,13 +1742,20 @@ def output_od_path_propotion(ui, output_dir='.'):
                 line=[i,oz_id,dz_id,col.get_seq_no(),col.get_volume()/cv.get_od_volume()]
                 writer.writerow(line)
     
-def output_od_link_propotion(ui, output_dir='.'):
-    with open(output_dir+'/od_link_propotion.csv', 'w',  newline='') as fp:
+def output_od_link_propotion(ui, output_dir='.', compression=None):
+    with _BufferedCSVWriter(output_dir+'/od_link_propotion.csv',
+                            compression) as writer:
         base = ui._base_assignment
         links = base.get_links()
-        writer = csv.writer(fp)
         column_pool = base.get_column_pool()
 
+        # link id, from node id, and to node id of each link
+        link_attrs = [
+            (link.get_link_id(), link.get_from_node_id(),
+             link.get_to_node_id())
+            for link in links
+        ]
+
         line = ['agent_id',
                 'o_zone_id',
                 'd_zone_id',
@@ -1053,23 +1777,27 @@ def output_od_link_propotion(ui, output_dir='.'):
             oz_id = k[2]
             dz_id = k[3]
 
-            od_link_propotion=[0]*len(links)
+            # only links on columns of this OD pair are needed
+            od_link_propotion={}
             output_links=set()
             for col in cv.get_columns().values():
                 for x in reversed(col.links):
                     output_links.add(x)
-                    od_link_propotion[x]+=col.get_volume()/cv.get_od_volume()
+                    od_link_propotion[x]=(
+                        od_link_propotion.get(x, 0)
+                        +col.get_volume()/cv.get_od_volume()
+                    )
             for x in output_links:
                 i+=1
-                line=[i,oz_id,dz_id,links[x].get_link_id(),links[x].get_from_node_id(),
-                    links[x].get_to_node_id(),od_link_propotion[x]]
+                line=[i,oz_id,dz_id,*link_attrs[x],od_link_propotion[x]]
                 writer.writerow(line)
 
 
 
-def output_agent_paths(ui, output_geometry=True, output_dir='.'):
-    with open(output_dir+'/agent_paths.csv', 'w',  newline='') as f:
-        writer = csv.writer(f)
+def output_agent_paths(ui, output_geometry=True, output_dir='.',
+                       compression=None):
+    with _BufferedCSVWriter(output_dir+'/agent_paths.csv',
+                            compression) as writer:
 
         line = ['agent_id',
                 'o_zone_id',
@@ -1090,47 +1818,283 @@ def output_agent_paths(ui, output_geometry=True, output_dir='.'):
         base = ui._base_assignment
         nodes = base.get_nodes()
         agents = base.get_agents()
-        agents.sort(key=lambda agent: agent.get_orig_node_id())
+
+        if output_geometry:
+            coords = [node.get_coordinate() for node in nodes]
+
+        # agents sorted by origin node id
+        agent_nos = []
+        if agents is not None:
+            agent_nos = np.argsort(agents.o_node_ids, kind='stable').tolist()
 
         pre_dest_node_id = -1
-        for a in agents:
-            if a.get_dest_node_id() == pre_dest_node_id:
+        for agent_no in agent_nos:
+            if agents.get_dest_node_id(agent_no) == pre_dest_node_id:
                 continue
 
-            pre_dest_node_id = a.get_dest_node_id()
+            pre_dest_node_id = agents.get_dest_node_id(agent_no)
 
-            agent_id = a.get_id()
+            agent_id = agent_no + 1
 
-            if not a.get_node_path():
+            node_path = agents.get_node_path(agent_no)
+            if not node_path:
                continue
 
             geometry = ''
             if output_geometry:
                 geometry = ', '.join(
-                    nodes[x].get_coordinate() for x in reversed(a.get_node_path())
+                    coords[x] for x in reversed(node_path)
                 )
                 geometry = 'LINESTRING (' + geometry + ')'
 
             line = [agent_id,
-                    a.get_orig_zone_id(),
-                    a.get_dest_zone_id(),
+                    agents.get_orig_zone_id(agent_no),
+                    agents.get_dest_zone_id(agent_no),
                     0,
                     'N/A',
                     'N/A',
                     'N/A',
                     'N/A',
                     'N/A',
-                    a.get_path_cost(),
+                    agents.get_path_cost(agent_no),
                     base.get_agent_node_path(agent_id, True),
                     base.get_agent_link_path(agent_id, True),
                     geometry]
 
             writer.writerow(line)
 
+        filename = os.path.basename(writer.filename)
         if output_dir == '.':
-            print('\ncheck agent_paths.csv in '
+            print(f'\ncheck {filename} in '
                    +os.getcwd()+' for unique agent paths')
         else:
-            print('\ncheck agent_paths.csv in '
+            print(f'\ncheck {filename} in '
                   +os.path.join(os.getcwd(), output_dir)
-                  +' for unique agent paths')
\ No newline at end of file
+                  +' for unique agent paths')
+
+
+def _get_pyarrow():
+    """ return pyarrow and pyarrow.parquet, or None's if not installed """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        return pa, pq
+    except ImportError:
+        # just in case user does not have pyarrow installed
+        print('Please intall pyarrow for Parquet outputs!')
+        print('CSV will be used instead.\n')
+        return None, None
+
+
+def _get_output_columns(A):
+    """ column pool arrays of OD pairs with positive volumes for outputs
+
+    Node and link sequences are reversed to be from origin to destination
+    like agent.csv. Besides the arrays from get_column_pool_arrays(), it
+    includes col_od_keys (OD key of each column), node_offsets, and
+    link_offsets.
+    """
+    arrs = get_column_pool_arrays(A, False)
+
+    od_mask = arrs['od_vols'] > 0
+    col_od_mask = np.repeat(od_mask, arrs['col_nums'])
+    col_od_keys = np.repeat(arrs['od_keys'], arrs['col_nums'], axis=0)
+
+    out = {'col_od_keys': col_od_keys[col_od_mask]}
+    for name in ['seq_nos', 'vols', 'tolls', 'travel_times', 'dists']:
+        out[name] = arrs[name][col_od_mask]
+
+    for seq, num in [('nodes', 'node_nums'), ('links', 'link_nums')]:
+        counts = arrs[num]
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        # reverse each sequence, i.e., the k-th element of a sequence is
+        # taken from the k-th last one
+        pos = np.arange(arrs[seq].size)
+        values = arrs[seq][
+            np.repeat(ends - 1, counts) - (pos - np.repeat(starts, counts))
+        ]
+
+        elem_mask = np.repeat(col_od_mask, counts)
+        counts = counts[col_od_mask]
+        out[seq] = values[elem_mask]
+        out[num] = counts
+        out[seq[:-1]+'_offsets'] = np.concatenate(([0], np.cumsum(counts)))
+
+    return out
+
+
+def output_link_performance_parquet(ui, output_dir='.'):
+    """ output link performance to link_performance.parquet
+
+    It has the same fields as link_performance.csv except the empty ones, i.e.,
+    queue, density, and notes. output_link_performance() will be used instead
+    if pyarrow is not installed.
+    """
+    pa, pq = _get_pyarrow()
+    if pa is None:
+        output_link_performance(ui, output_dir)
+        return
+
+    base = ui._base_assignment
+    links = base.get_links()
+    dps = base.get_demand_periods()
+    dp_size = len(dps)
+
+    vols = np.array([link.flow_vol_by_period for link in links],
+                    dtype=np.float64).reshape(-1, dp_size)
+    link_arrays = base.get_network().get_link_arrays()
+    dp_ids = [dp.get_id() for dp in dps]
+    travel_times = link_arrays.get_travel_times()[dp_ids].T
+    vocs = link_arrays.get_vocs()[dp_ids].T
+    lengths = np.array([link.get_length() for link in links],
+                       dtype=np.float64)
+
+    # one record per link per demand period, sorted by link first
+    link_idx = pa.array(np.repeat(np.arange(len(links)), dp_size))
+    table = pa.table({
+        'link_id': pa.array([link.get_link_id() for link in links],
+                            pa.string()).take(link_idx),
+        'from_node_id': pa.array([link.get_from_node_id() for link in links],
+                                 pa.int64()).take(link_idx),
+        'to_node_id': pa.array([link.get_to_node_id() for link in links],
+                               pa.int64()).take(link_idx),
+        'time_period': pa.array([dp.get_period() for dp in dps] * len(links),
+                                pa.string()).dictionary_encode(),
+        'volume': vols.ravel(),
+        'travel_time': travel_times.ravel(),
+        'speed': (
+            lengths[:, None] / (np.maximum(0.001, travel_times) / 60)
+        ).ravel(),
+        'VOC': vocs.ravel(),
+        'geometry': pa.array([link.get_geometry() for link in links],
+                             pa.string()).take(link_idx)
+    })
+
+    pq.write_table(table, output_dir+'/link_performance.parquet')
+
+
+def output_columns_parquet(ui, output_dir='.'):
+    """ output columns to agent.parquet
+
+    Node and link sequences are stored as lists of node IDs and link IDs
+    rather than strings. Geometry is not included, which can be derived from
+    node coordinates. output_columns() will be used instead if pyarrow is not
+    installed.
+    """
+    pa, pq = _get_pyarrow()
+    if pa is None:
+        output_columns(ui, True, output_dir)
+        return
+
+    base = ui._base_assignment
+    nodes = base.get_nodes()
+    links = base.get_links()
+    cols = _get_output_columns(base)
+
+    node_ids = np.array([node.get_node_id() for node in nodes],
+                        dtype=np.int64)
+    link_ids = pa.array([link.get_link_id() for link in links], pa.string())
+
+    od_keys = cols['col_od_keys']
+    at_strs = pa.array([at.get_type() for at in base.get_agent_types()],
+                       pa.string())
+    dp_strs = pa.array([dp.get_period() for dp in base.get_demand_periods()],
+                       pa.string())
+
+    table = pa.table({
+        'agent_id': np.arange(1, od_keys.shape[0] + 1),
+        'o_zone_id': od_keys[:, 2],
+        'd_zone_id': od_keys[:, 3],
+        'path_id': cols['seq_nos'],
+        'agent_type': pa.DictionaryArray.from_arrays(od_keys[:, 0], at_strs),
+        'demand_period': pa.DictionaryArray.from_arrays(od_keys[:, 1],
+                                                        dp_strs),
+        'volume': cols['vols'],
+        'toll': cols['tolls'],
+        'travel_time': cols['travel_times'],
+        'distance': cols['dists'],
+        'node_sequence': pa.ListArray.from_arrays(
+            cols['node_offsets'], node_ids[cols['nodes']]
+        ),
+        'link_sequence': pa.ListArray.from_arrays(
+            cols['link_offsets'], link_ids.take(cols['links'])
+        )
+    })
+
+    pq.write_table(table, output_dir+'/agent.parquet')
+
+
+def output_path_link_propotion_parquet(ui, output_dir='.'):
+    """ output path-link incidences to path_link_propotion.parquet
+
+    It has the same records as path_link_propotion.csv.
+    output_path_link_propotion() will be used instead if pyarrow is not
+    installed.
+    """
+    pa, pq = _get_pyarrow()
+    if pa is None:
+        output_path_link_propotion(ui, output_dir)
+        return
+
+    base = ui._base_assignment
+    links = base.get_links()
+    cols = _get_output_columns(base)
+
+    # one record per link on each column
+    link_idx = pa.array(cols['links'])
+    col_idx = np.repeat(np.arange(cols['seq_nos'].size), cols['link_nums'])
+    od_keys = cols['col_od_keys'][col_idx]
+
+    table = pa.table({
+        'agent_id': col_idx + 1,
+        'o_zone_id': od_keys[:, 2],
+        'd_zone_id': od_keys[:, 3],
+        'path_id': cols['seq_nos'][col_idx],
+        'link_sequence': pa.array([link.get_link_id() for link in links],
+                                  pa.string()).take(link_idx),
+        'from_node_id': pa.array([link.get_from_node_id() for link in links],
+                                 pa.int64()).take(link_idx),
+        'to_node_id': pa.array([link.get_to_node_id() for link in links],
+                               pa.int64()).take(link_idx),
+        'incidence': np.ones(col_idx.size, dtype=np.int64)
+    })
+
+    pq.write_table(table, output_dir+'/path_link_propotion.parquet')
+
+
+def output_odme_performance_parquet(ui, output_dir='.'):
+    """ output ODME performance to odme_performance.parquet
+
+    It has the same records as odme_performance.csv, where missing IDs and
+    demand periods are nulls rather than empty strings.
+    output_odme_performance() will be used instead if pyarrow is not
+    installed.
+    """
+    pa, pq = _get_pyarrow()
+    if pa is None:
+        output_odme_performance(ui, output_dir)
+        return
+
+    headers = _ODME_PERFORMANCE_HEADERS
+    records = np.array(_get_odme_performance(ui._base_assignment),
+                       dtype=object).reshape(-1, len(headers))
+    # empty strings are missing values
+    masks = records == ''
+    records[masks] = 0
+
+    columns = {}
+    for i, h in enumerate(headers):
+        if h in ('measurement_type', 'demand_period'):
+            columns[h] = pa.array(records[:, i].astype(str), pa.string(),
+                                  mask=masks[:, i]).dictionary_encode()
+        elif h in ('obs_count', 'est_count'):
+            columns[h] = records[:, i].astype(np.float64)
+        else:
+            columns[h] = pa.array(records[:, i].astype(np.int64), pa.int64(),
+                                  mask=masks[:, i])
+
+    table = pa.table(columns)
+
+    pq.write_table(table, output_dir+'/odme_performance.parquet')
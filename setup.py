@@ -16,6 +16,15 @@ setuptools.setup(
     packages=['path4gmns'],
     package_dir={'path4gmns': 'path4gmns'},
     package_data={'path4gmns': ['bin/*']},
+    install_requires=['numpy'],
+    extras_require={
+        # the least-squares ODME solver, i.e., odme_solver='lsq'
+        'lsq': ['scipy'],
+        # faster CSV reading and the *_parquet() outputs
+        'parquet': ['pyarrow'],
+        # all optional dependencies are needed to run all tests
+        'test': ['pytest', 'scipy', 'pyarrow'],
+    },
     license='Apache License 2.0',
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'data'
+)
+
+ODME_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir,
+    'formal_cases_ODME', 'Sioux_falls', 'odme', 'Path4GMNS'
+)
+
+ODME_BATCH_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir,
+    'Sioux Falls odme', 'Sioux_Falls_multi_OD_pairs'
+)
+
+
+@pytest.fixture(autouse=True)
+def _run_in_tmp_path(tmp_path, monkeypatch):
+    """ keep log files and outputs out of the source tree """
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def sioux_falls_dir():
+    return os.path.join(DATA_DIR, 'Sioux_Falls')
+
+
+@pytest.fixture
+def odme_dir():
+    return ODME_DIR
+
+
+@pytest.fixture
+def odme_batch_dir():
+    """ Sioux Falls with the same measurements under different seed demand """
+    return ODME_BATCH_DIR
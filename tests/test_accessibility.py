@@ -0,0 +1,81 @@
+import csv
+
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns.accessibility import _get_interval_id, \
+                                    _output_accessibility_aggregated, \
+                                    _update_min_travel_time
+from path4gmns.classes import AccessNetwork
+from path4gmns.consts import MAX_LABEL_COST
+from path4gmns.path import single_source_shortest_path
+
+
+def _get_min_travel_time_dict(an, at):
+    """ min travel times keyed by (from_zone_id, to_zone_id, at_type_str) """
+    an.update_generalized_link_cost(at)
+
+    min_travel_times = {}
+    for c in an.get_centroids():
+        single_source_shortest_path(an, c.get_node_id())
+        for c_ in an.get_centroids():
+            if c_ == c:
+                continue
+
+            min_travel_times[(c.get_zone_id(), c_.get_zone_id(),
+                              at.get_type())] = (
+                an.get_node_label_cost(c_.get_node_no())
+            )
+
+    return min_travel_times
+
+
+@pytest.mark.parametrize('worker_num', [1, 3])
+def test_skims_match_min_travel_time_dict(sioux_falls_dir, tmp_path,
+                                          worker_num):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    base = network._base_assignment
+    ats = base.get_agent_types()
+
+    an = AccessNetwork(base.network)
+    zones = [c.get_zone_id() for c in an.get_centroids()]
+    zone_nos = {z: i for i, z in enumerate(zones)}
+
+    skims = np.full((len(ats), len(zones), len(zones)), np.nan)
+    expected = {}
+    max_min = 0
+    for i, at in enumerate(ats):
+        an.set_target_mode(at.get_type())
+        expected.update(_get_min_travel_time_dict(an, at))
+        max_min = max(max_min,
+                      _update_min_travel_time(an, at, skims[i], worker_num))
+
+    assert np.isnan(skims[:, range(len(zones)), range(len(zones))]).all()
+    assert np.count_nonzero(~np.isnan(skims)) == len(expected)
+    at_nos = {at.get_type(): i for i, at in enumerate(ats)}
+    for (oz, dz, at_str), v in expected.items():
+        assert skims[at_nos[at_str], zone_nos[oz], zone_nos[dz]] == v
+
+    finite = [v for v in expected.values() if v < MAX_LABEL_COST]
+    assert max_min == max(finite)
+
+    # the number of accessible zones from each zone within each time budget
+    interval_num = _get_interval_id(max_min) + 1
+    _output_accessibility_aggregated(skims, interval_num, zones, ats,
+                                     str(tmp_path))
+
+    with open(tmp_path / 'accessibility_aggregated.csv') as fp:
+        rows = list(csv.reader(fp))[1:]
+    assert len(rows) == len(zones) * len(ats)
+
+    for row in rows:
+        oz, at_str = int(row[0]), row[2]
+        ids = [
+            _get_interval_id(v)
+            for (oz_, _, at_str_), v in expected.items()
+            if oz_ == oz and at_str_ == at_str and v < MAX_LABEL_COST
+        ]
+        assert [int(x) for x in row[3:]] == [
+            sum(1 for x in ids if x <= i) for i in range(interval_num)
+        ]
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns.checkpoint import _decode_sequences, _decode_varints, \
+                                 _encode_sequences, _encode_varints
+
+
+def test_varints_round_trip():
+    rng = np.random.default_rng(0)
+    values = np.concatenate((
+        [0, 1, -1, 63, -64, 64, -65, 127, 128,
+         np.iinfo(np.int64).max, np.iinfo(np.int64).min],
+        rng.integers(-2**40, 2**40, 1000)
+    )).astype(np.int64)
+
+    buf = _encode_varints(values)
+    assert buf.dtype == np.uint8
+    assert np.array_equal(_decode_varints(buf), values)
+    assert _decode_varints(_encode_varints([])).size == 0
+
+
+def test_sequences_round_trip():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 20, 100)
+    counts[:3] = 0
+    seqs = rng.integers(0, 100000, counts.sum())
+
+    buf = _encode_sequences(seqs, counts)
+    assert np.array_equal(_decode_sequences(buf, counts), seqs)
+
+
+def _get_states(network):
+    A = network._base_assignment
+    vols = [link.flow_vol_by_period[0] for link in A.get_links()]
+    cols = {
+        (k, node_sum): (col.links, col.get_volume())
+        for k, cv in A.get_column_pool().items()
+        for node_sum, col in cv.get_columns().items()
+    }
+
+    return vols, cols
+
+
+@pytest.mark.parametrize('assignment_mode, kwargs', [
+    (1, {}),
+    (3, {}),
+    (3, {'odme_line_search': True}),
+    (3, {'odme_solver': 'lsq'}),
+])
+def test_resume_matches_uninterrupted_run(sioux_falls_dir, odme_dir,
+                                          tmp_path, assignment_mode, kwargs):
+    if kwargs.get('odme_solver') == 'lsq':
+        pytest.importorskip('scipy')
+
+    if assignment_mode == 1:
+        def read_network():
+            return pg.read_network(input_dir=sioux_falls_dir)
+    else:
+        def read_network():
+            return pg.read_network(input_dir=odme_dir, odme=True)
+
+    network = read_network()
+    pg.perform_network_assignment(assignment_mode, 6, 5, network,
+                                  checkpoint_dir=str(tmp_path / 'expected'),
+                                  **kwargs)
+    expected_vols, expected_cols = _get_states(network)
+
+    checkpoint_dir = tmp_path / 'checkpoint'
+    network = read_network()
+    pg.perform_network_assignment(assignment_mode, 3, 5, network,
+                                  checkpoint_dir=str(checkpoint_dir),
+                                  **kwargs)
+
+    network = read_network()
+    pg.perform_network_assignment(
+        assignment_mode, 6, 5, network,
+        checkpoint_dir=str(checkpoint_dir),
+        resume_from=str(checkpoint_dir / 'checkpoint.npz'),
+        **kwargs
+    )
+    vols, cols = _get_states(network)
+
+    assert vols == expected_vols
+    assert cols == expected_cols
+
+    # columns are indexed in the same order in ODME
+    with np.load(tmp_path / 'expected' / 'checkpoint.npz') as expected, \
+         np.load(checkpoint_dir / 'checkpoint.npz') as data:
+        assert data['has_incidence'] == (assignment_mode == 3)
+        assert np.array_equal(data['path_od_nos'], expected['path_od_nos'])
+
+
+def test_resume_rejects_other_format_versions(sioux_falls_dir, tmp_path):
+    checkpoint_dir = tmp_path / 'checkpoint'
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    pg.perform_network_assignment(1, 1, 1, network,
+                                  checkpoint_dir=str(checkpoint_dir))
+
+    # a checkpoint before versioning
+    checkpoint_file = str(checkpoint_dir / 'checkpoint.npz')
+    with np.load(checkpoint_file) as data:
+        arrays = {k: data[k] for k in data.files if k != 'version'}
+    np.savez(checkpoint_file, **arrays)
+
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    with pytest.raises(Exception, match='format version 1'):
+        pg.perform_network_assignment(1, 2, 1, network,
+                                      resume_from=checkpoint_file)
@@ -0,0 +1,224 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns import classes
+from path4gmns.classes import Assignment
+from path4gmns.path import single_source_shortest_path
+
+
+@pytest.mark.parametrize('cpu_num, memory_budget, block_num', [
+    (8, None, 8),
+    # more cores than zones
+    (64, None, 24),
+    # each memory block takes 24 * (3 * 4 + 8) = 480 bytes for one demand
+    (8, 1500, 3),
+    (8, 1, 1),
+])
+def test_memory_block_num(sioux_falls_dir, monkeypatch,
+                          cpu_num, memory_budget, block_num):
+    monkeypatch.setattr(classes.os, 'cpu_count', lambda: cpu_num)
+    # the physical memory is unknown
+    monkeypatch.setattr(classes, '_get_physical_memory', lambda: 0)
+
+    network = pg.read_network(input_dir=sioux_falls_dir,
+                              memory_budget=memory_budget)
+    A = network._base_assignment
+
+    assert A.get_memory_blocks() == block_num
+    assert len(list(A.get_spnetworks())) == block_num * len(A.demands)
+
+    # each zone goes to exactly one memory block
+    orig_zones = sorted(z for sp in A.get_spnetworks()
+                        for z in sp.get_orig_zones())
+    assert orig_zones == list(range(1, 25))
+
+
+def test_memory_block_num_is_fixed_unless_it_is_zero(sioux_falls_dir,
+                                                     monkeypatch):
+    monkeypatch.setattr(classes.os, 'cpu_count', lambda: 8)
+
+    network = pg.read_network(input_dir=sioux_falls_dir, memory_blocks=5,
+                              memory_budget=1)
+
+    assert network._base_assignment.get_memory_blocks() == 5
+
+
+def _schedule(zone_node_nums, od_rows, memory_blocks, node_size=100):
+    zone_nodes = {z: list(range(n)) for z, n in zone_node_nums.items()}
+    network = SimpleNamespace(get_node_size=lambda: node_size,
+                              get_nodes_from_zone=zone_nodes.get)
+    column_pool = {
+        (0, 0, z, d): None
+        for z, n in od_rows.items()
+        for d in range(n)
+    }
+    A = SimpleNamespace(network=network, column_pool=column_pool,
+                        memory_blocks=memory_blocks)
+
+    return Assignment._schedule_memory_blocks(A, list(zone_node_nums.keys()))
+
+
+def test_schedule_memory_blocks_balances_workloads():
+    zone_node_nums = {1: 1, 2: 9, 3: 2, 4: 1, 5: 6, 6: 3, 7: 1, 8: 4}
+    od_rows = {z: 10 * z for z in zone_node_nums}
+
+    blocks = _schedule(zone_node_nums, od_rows, 3)
+
+    assert len(blocks) == 3
+    assert sorted(z for b in blocks for z in b) == list(zone_node_nums)
+    assert all(b == sorted(b) for b in blocks)
+
+    workloads = {
+        z: n * (100 + od_rows[z]) for z, n in zone_node_nums.items()
+    }
+    loads = [sum(workloads[z] for z in b) for b in blocks]
+    # longest processing time first never leaves a block behind the others
+    # by more than the largest workload of a zone
+    assert max(loads) - min(loads) <= max(workloads.values())
+
+    # round robin by zone id puts zone 2 and zone 5 together
+    round_robin = [
+        sum(workloads[z] for z in zone_node_nums if (z - 1) % 3 == i)
+        for i in range(3)
+    ]
+    assert max(loads) < max(round_robin)
+
+
+def test_schedule_memory_blocks_drops_empty_blocks():
+    blocks = _schedule({1: 1, 2: 2}, {}, 4)
+
+    assert blocks == [[2], [1]]
+
+
+def test_link_arrays_match_vdf_periods(sioux_falls_dir):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    pg.perform_network_assignment(1, 2, 2, network)
+
+    A = network._base_assignment
+    link_arrays = A.get_network().get_link_arrays()
+    link_arrays.update_travel_times()
+
+    travel_times = link_arrays.get_travel_times()
+    vocs = link_arrays.get_vocs()
+    derivatives = link_arrays.get_derivatives()
+    for i, link in enumerate(A.get_links()):
+        for tau, vdf in enumerate(link.vdfperiods):
+            assert link.get_period_travel_time(tau) == travel_times[tau, i]
+
+            tt = vdf.run_bpr(link.get_period_flow_vol(tau))
+            assert tt == pytest.approx(travel_times[tau, i])
+            assert vdf.get_voc() == pytest.approx(vocs[tau, i])
+            assert vdf.get_derivative() == pytest.approx(derivatives[tau, i])
+
+
+def test_agent_table_shares_paths(sioux_falls_dir):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    network.find_path_for_agents(seed=1)
+
+    G = network._base_assignment.network
+    agents = G.get_agents()
+    assert len(agents) == G.get_agent_count() > 0
+
+    o_node_ids = agents.o_node_ids
+    d_node_ids = agents.d_node_ids
+    routed = o_node_ids != d_node_ids
+    # agents with the same origin and destination nodes have no path
+    assert (agents.path_nos[~routed] == -1).all()
+
+    # one path in the path store for each pair of origin and destination
+    # nodes, which is shared by all agents between them
+    od_pairs = np.unique(np.stack((o_node_ids[routed], d_node_ids[routed])),
+                         axis=1)
+    assert len(agents.node_paths) == len(agents.link_paths) == od_pairs.shape[1]
+
+    path_nos = agents.path_nos[routed]
+    od_path_nos = {}
+    for o, d, p in zip(o_node_ids[routed].tolist(),
+                       d_node_ids[routed].tolist(),
+                       path_nos.tolist()):
+        assert od_path_nos.setdefault((o, d), p) == p
+    assert sorted(od_path_nos.values()) == list(range(od_pairs.shape[1]))
+
+    for agent_id in [1, len(agents) // 2, len(agents)]:
+        agent_no = agent_id - 1
+        if not routed[agent_no]:
+            continue
+
+        o = agents.get_orig_node_id(agent_no)
+        d = agents.get_dest_node_id(agent_no)
+        assert network.get_agent_orig_node_id(agent_id) == o
+        assert network.get_agent_dest_node_id(agent_id) == d
+        assert (
+            network.get_agent_node_path(agent_id).replace('node path', 'path')
+            == network.find_shortest_path(o, d, 'node')
+        )
+
+
+def test_setup_agents_is_reproducible(sioux_falls_dir):
+    tables = []
+    for _ in range(2):
+        network = pg.read_network(input_dir=sioux_falls_dir)
+        A = network._base_assignment
+        A.network.setup_agents(A.get_column_pool(), 7)
+        tables.append(A.network.get_agents())
+
+    for name in ['o_zone_ids', 'd_zone_ids', 'o_node_ids', 'd_node_ids',
+                 'agent_types']:
+        assert np.array_equal(getattr(tables[0], name),
+                              getattr(tables[1], name))
+
+
+def _get_base_states(G):
+    return (
+        list(G.node_list),
+        list(G.link_list),
+        [list(node.outgoing_link_list) for node in G.node_list],
+        dict(G.internal_node_seq_no_dict),
+        dict(G.external_node_id_dict),
+        {z: list(v) for z, v in G.zone_to_nodes_dict.items()},
+        G.get_node_size(),
+        G.get_link_size(),
+        [list(x) for x in G.get_topology()]
+    )
+
+
+def test_access_network_leaves_base_network_unmodified(sioux_falls_dir):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    G = network._base_assignment.network
+    expected = _get_base_states(G)
+    expected_path = network.find_shortest_path(1, 20)
+
+    an = classes.AccessNetwork(G)
+    an.set_target_mode('p')
+    an.update_generalized_link_cost(
+        network._base_assignment.get_agent_type('p')
+    )
+    for c in an.get_centroids():
+        single_source_shortest_path(an, c.get_node_id())
+
+    assert _get_base_states(G) == expected
+    assert network.find_shortest_path(1, 20) == expected_path
+
+    # centroids come after base nodes and connectors after base links
+    zones = [z for z in G.get_zones() if z != -1]
+    connector_num = 2 * sum(len(G.get_nodes_from_zone(z)) for z in zones)
+    assert an.get_node_size() == G.get_node_size() + len(zones)
+    assert an.get_link_size() == G.get_link_size() + connector_num
+    assert [c.get_node_no() for c in an.get_centroids()] == list(
+        range(G.get_node_size(), an.get_node_size())
+    )
+
+    link_size = an.get_link_size()
+    from_node_nos = np.ctypeslib.as_array(an.get_from_node_no_arr(),
+                                          (link_size,))
+    to_node_nos = np.ctypeslib.as_array(an.get_to_node_no_arr(),
+                                        (link_size,))
+    base_from_node_nos, base_to_node_nos = expected[-1][:2]
+    assert from_node_nos[:G.get_link_size()].tolist() == base_from_node_nos
+    assert to_node_nos[:G.get_link_size()].tolist() == base_to_node_nos
+    # each connector joins a centroid and a node in its zone
+    is_centroid = from_node_nos[G.get_link_size():] >= G.get_node_size()
+    assert is_centroid.sum() == connector_num // 2
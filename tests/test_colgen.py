@@ -0,0 +1,183 @@
+import csv
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns import colgen
+from path4gmns.colgen import _get_beckmann_obj, _get_link_flows, \
+                             _is_od_converged, \
+                             _update_link_travel_time_and_cost
+
+
+def _get_relative_gap(network):
+    """ the volume-weighted relative cost difference to the best column """
+    A = network._base_assignment
+    links = A.get_links()
+
+    gap = 0
+    total_cost = 0
+    for k, cv in A.get_column_pool().items():
+        if cv.get_od_volume() <= 0 or not cv.get_column_num():
+            continue
+
+        costs = [
+            (sum(links[i].get_period_travel_time(k[1]) for i in col.links),
+             col.get_volume())
+            for col in cv.get_columns().values()
+        ]
+        min_cost = min(c for c, _ in costs)
+        gap += sum(v * (c - min_cost) for c, v in costs)
+        total_cost += sum(v * c for c, v in costs)
+
+    return gap / total_cost
+
+
+def _run_ue(input_dir, column_update_num, **kwargs):
+    network = pg.read_network(input_dir=input_dir)
+    pg.perform_network_assignment(1, 20, column_update_num, network,
+                                  **kwargs)
+    return _get_relative_gap(network)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'line_search': True},
+    {'active_set': True}
+])
+def test_newton_gap_goes_down(sioux_falls_dir, kwargs):
+    gaps = [
+        _run_ue(sioux_falls_dir, n, flow_update='newton', **kwargs)
+        for n in [1, 5, 20]
+    ]
+
+    assert gaps[0] > gaps[1] > gaps[2]
+    assert gaps[2] < _run_ue(sioux_falls_dir, 20, **kwargs)
+    assert gaps[2] < 0.0001
+
+
+def _write_two_route_network(input_dir, settings_file):
+    """ two routes with steep BPR functions between a single OD pair """
+    with open(input_dir / 'node.csv', 'w') as f:
+        f.write('node_id,zone_id,x_coord,y_coord\n'
+                '1,1,0,0\n'
+                '2,2,2,0\n'
+                '3,,1,1\n'
+                '4,,1,-1\n')
+
+    with open(input_dir / 'link.csv', 'w') as f:
+        f.write('link_id,from_node_id,to_node_id,length,lanes,capacity,'
+                'free_speed,link_type,VDF_fftt1,VDF_cap1,VDF_alpha1,'
+                'VDF_beta1,VDF_PHF1\n'
+                '1,1,3,1,1,50,60,1,1,50,0.15,4,1\n'
+                '2,3,2,0.01,1,10000,60,1,0,10000,0,1,1\n'
+                '3,1,4,2,1,50,60,1,2,50,0.15,4,1\n'
+                '4,4,2,0.01,1,10000,60,1,0,10000,0,1,1\n')
+
+    with open(input_dir / 'demand.csv', 'w') as f:
+        f.write('o_zone_id,d_zone_id,volume\n'
+                '1,2,200\n')
+
+    shutil.copy(settings_file, input_dir)
+
+
+def test_line_search_backtracks_on_overshooting_steps(sioux_falls_dir,
+                                                      tmp_path, capsys):
+    _write_two_route_network(tmp_path,
+                             os.path.join(sioux_falls_dir, 'settings.yml'))
+
+    objs = []
+    for line_search in [False, True]:
+        network = pg.read_network(input_dir=str(tmp_path))
+        # the full gradient step shifts all volume from the congested route
+        # to the other one, which overshoots
+        pg.perform_network_assignment(1, 3, 1, network,
+                                      line_search=line_search)
+
+        A = network._base_assignment
+        flows = _get_link_flows(A.get_links(), A.get_demand_periods())
+        link_arrays = A.get_network().get_link_arrays()
+        objs.append(_get_beckmann_obj(flows, link_arrays.get_vdf_arrays()))
+
+    assert 'step length from line search: 0.25' in capsys.readouterr().out
+    assert objs[1] < objs[0] / 5
+
+
+def test_active_set_drops_and_brings_back_od_pairs(sioux_falls_dir, tmp_path,
+                                                   monkeypatch):
+    # a light demand so that not all OD pairs go through congested links
+    input_dir = tmp_path / 'sioux_falls'
+    shutil.copytree(sioux_falls_dir, input_dir)
+    with open(input_dir / 'demand.csv') as f:
+        rows = list(csv.reader(f))
+    vol_idx = rows[0].index('volume')
+    for row in rows[1:]:
+        row[vol_idx] = str(float(row[vol_idx]) * 0.3)
+    with open(input_dir / 'demand.csv', 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+    network = pg.read_network(input_dir=str(input_dir))
+    pg.perform_network_assignment(1, 10, 0, network)
+
+    A = network._base_assignment
+    links = A.get_links()
+    link_arrays = A.get_network().get_link_arrays()
+
+    # link travel times at the beginning of each column update and whether
+    # each active OD pair is dropped from the active set in it
+    travel_times = []
+    dropped = []
+
+    def update_link_travel_time_and_cost(link_arrays):
+        _update_link_travel_time_and_cost(link_arrays)
+        travel_times.append(
+            np.array([link.get_period_travel_time(0) for link in links])
+        )
+        dropped.append({})
+
+    def is_od_converged(cv, *args):
+        res = _is_od_converged(cv, *args)
+        dropped[-1][cv] = res
+        return res
+
+    monkeypatch.setattr(colgen, '_update_link_travel_time_and_cost',
+                        update_link_travel_time_and_cost)
+    monkeypatch.setattr(colgen, '_is_od_converged', is_od_converged)
+
+    tol = 0.001
+    colgen._optimize_column_pool(A.get_column_pool(), links, link_arrays,
+                                 A.get_agent_types(), A.get_demand_periods(),
+                                 20, active_set=True, active_set_tol=tol)
+
+    od_num = sum(
+        1 for cv in A.get_column_pool().values() if cv.get_od_volume() > 0
+    )
+    assert len(dropped[0]) == od_num
+
+    # the iteration in which each inactive OD pair was dropped
+    inactive = {}
+    reentry_num = 0
+    for i, res in enumerate(dropped):
+        for cv, j in list(inactive.items()):
+            link_nos = list(
+                {x for col in cv.get_columns().values() for x in col.links}
+            )
+            ref_tts = travel_times[j][link_nos]
+            changed = np.abs(travel_times[i][link_nos] - ref_tts) > (
+                tol * np.maximum(0.0001, ref_tts)
+            )
+            # an OD pair comes back if and only if any link on its columns
+            # changes its travel time significantly
+            assert changed.any() == (cv in res)
+            if cv in res:
+                del inactive[cv]
+                reentry_num += 1
+
+        for cv, is_dropped in res.items():
+            if is_dropped:
+                inactive[cv] = i
+
+    assert 0 < reentry_num and inactive
+    assert len(dropped[-1]) < od_num
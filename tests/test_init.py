@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import path4gmns as pg
+
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir)
+
+
+def test_import_is_lazy():
+    # a fresh interpreter as path4gmns has been fully imported by other tests
+    code = (
+        'import sys\n'
+        'import path4gmns as pg\n'
+        'print(sorted(m for m in sys.modules if m.startswith("path4gmns.")))\n'
+        'print("numpy" in sys.modules)\n'
+        'pg.save_column_pool\n'
+        'print("path4gmns.utils" in sys.modules)\n'
+        'print(pg.path._cdll is None)\n'
+        'print(pg.dtaapi._dtalite_engine is None)\n'
+    )
+    res = subprocess.run([sys.executable, '-c', code], cwd=PACKAGE_DIR,
+                         capture_output=True, text=True, check=True)
+
+    # no submodule or numpy until a public function is accessed, and the
+    # engines are loaded on first use rather than on import
+    assert res.stdout.split() == ['[]', 'False', 'True', 'True', 'True']
+
+
+def test_getattr():
+    func = pg.read_network
+    assert func is pg.utils.read_network
+    # it is cached in the package afterwards
+    assert vars(pg)['read_network'] is func
+
+    for name in pg.__all__:
+        assert callable(getattr(pg, name))
+
+    assert pg.colgen.__name__ == 'path4gmns.colgen'
+
+    with pytest.raises(AttributeError, match='no_such_function'):
+        pg.no_such_function
+
+
+def test_dir():
+    names = dir(pg)
+
+    assert names == sorted(names)
+    assert set(pg.__all__) <= set(names)
+    assert '__version__' in names
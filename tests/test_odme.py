@@ -0,0 +1,256 @@
+import csv
+import os
+import shutil
+
+import pytest
+
+import path4gmns as pg
+from path4gmns import utils
+from path4gmns.odme import _get_measurements, _get_odme_performance
+
+
+SEEDS = ['ODME-seed_6000', 'ODME-seed_8000']
+
+
+@pytest.mark.parametrize('worker_num', [1, 2])
+def test_odme_batch_matches_single_runs(odme_batch_dir, monkeypatch,
+                                        worker_num):
+    expected = []
+    for seed in SEEDS:
+        network = pg.read_network(input_dir=os.path.join(odme_batch_dir, seed),
+                                  odme=True)
+        pg.perform_network_assignment(3, 3, 3, network)
+        expected.append(_get_odme_performance(network._base_assignment))
+
+    network = pg.read_network(load_demand=False,
+                              input_dir=os.path.join(odme_batch_dir, SEEDS[0]))
+    # as if the network were the only one read in this process
+    monkeypatch.setattr(utils, '_zone_degrees', [])
+
+    scenarios = [
+        (os.path.join(odme_batch_dir, seed, 'demand.csv'),
+         os.path.join(odme_batch_dir, seed, 'measurement.csv'))
+        for seed in SEEDS
+    ]
+    res = pg.perform_odme_batch(network, scenarios, 3, 3,
+                                worker_num=worker_num)
+
+    assert res == expected
+
+
+def _get_od_volumes(network):
+    return {
+        k: sum(col.get_volume() for col in cv.get_columns().values())
+        for k, cv in network._base_assignment.get_column_pool().items()
+    }
+
+
+def test_lsq_solver_honors_seed_demand(odme_dir):
+    pytest.importorskip('scipy')
+
+    seed = {
+        k: cv.get_od_volume()
+        for k, cv in pg.read_network(input_dir=odme_dir, odme=True)
+                      ._base_assignment.get_column_pool().items()
+    }
+
+    histories = []
+    devs = []
+    for w in [0, 0.01, 1e4]:
+        network = pg.read_network(input_dir=odme_dir, odme=True)
+        histories.append(
+            pg.perform_network_assignment(3, 3, 5, network,
+                                          odme_solver='lsq',
+                                          odme_seed_weight=w)
+        )
+        od_vols = _get_od_volumes(network)
+        devs.append(sum(abs(od_vols[k] - v) for k, v in seed.items())
+                    / sum(seed.values()))
+
+    # the more weight on the seed demand, the closer to it
+    assert devs[0] > devs[1] > devs[2]
+    assert devs[2] < 0.01
+    # while measurements still pull OD volumes away from it
+    for history in histories[:2]:
+        assert history[-1] < history[0] / 5
+
+
+@pytest.mark.parametrize('odme_line_search', [False, True])
+def test_odme_history_and_early_stop(odme_dir, capsys, odme_line_search):
+    network = pg.read_network(input_dir=odme_dir, odme=True)
+    history = pg.perform_network_assignment(
+        3, 8, 3, network, odme_line_search=odme_line_search
+    )
+
+    # the total gap of each ODME iteration
+    assert len(history) == 8
+    assert all(isinstance(x, float) for x in history)
+    if odme_line_search:
+        # the gap never goes up with line search
+        assert all(x >= y for x, y in zip(history, history[1:]))
+        assert history[-1] < history[0] / 100
+
+    A = network._base_assignment
+    network_ = A.get_network()
+    measurements = _get_measurements(A.get_links(), network_.get_zones(),
+                                     network_.zone_id_to_zone_dict)
+    total_obs = sum(x[x > 0].sum() for x in measurements)
+
+    # stop at the first iteration reaching the least gap in the first five
+    k = history.index(min(history[:5]))
+    odme_tol = history[k] / total_obs
+
+    capsys.readouterr()
+    network = pg.read_network(input_dir=odme_dir, odme=True)
+    history_ = pg.perform_network_assignment(
+        3, 8, 3, network, odme_tol=odme_tol,
+        odme_line_search=odme_line_search
+    )
+
+    assert history_ == history[:k+1]
+    assert f'ODME converged at iter {k}' in capsys.readouterr().out
+
+
+SETTINGS = '''agents:
+  - type: p
+    name: passenger
+    vot: 10
+    flow_type: 0
+    pce: 1
+    free_speed: 60
+
+demand_periods:
+  - period: AM
+    time_period: 0700_0800
+  - period: PM
+    time_period: 1700_1800
+
+demand_files:
+  - file_name: demand.csv
+    format_type: column
+    period: AM
+    agent_type: p
+  - file_name: demand_pm.csv
+    format_type: column
+    period: PM
+    agent_type: p
+'''
+
+
+def _write_two_period_case(odme_dir, input_dir):
+    """ Sioux Falls with PM counts at half of AM ones and zonal totals x1.5
+
+    PM demand is also half of AM demand.
+    """
+    os.makedirs(input_dir)
+    shutil.copy(os.path.join(odme_dir, 'node.csv'), input_dir)
+    shutil.copy(os.path.join(odme_dir, 'demand.csv'), input_dir)
+
+    with open(os.path.join(input_dir, 'settings.yml'), 'w') as fp:
+        fp.write(SETTINGS)
+
+    # the same VDF parameters for PM
+    with open(os.path.join(odme_dir, 'link.csv')) as fp:
+        rows = list(csv.DictReader(fp))
+    for r in rows:
+        r.update({'VDF_fftt2': r['VDF_fftt1'], 'VDF_cap2': r['VDF_cap1'],
+                  'VDF_alpha2': r['VDF_alpha1'], 'VDF_beta2': r['VDF_beta1'],
+                  'VDF_mu2': 1000})
+    with open(os.path.join(input_dir, 'link.csv'), 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+
+    with open(os.path.join(odme_dir, 'demand.csv')) as fp:
+        rows = list(csv.DictReader(fp))
+    with open(os.path.join(input_dir, 'demand_pm.csv'), 'w',
+              newline='') as fp:
+        writer = csv.DictWriter(fp, rows[0].keys())
+        writer.writeheader()
+        for r in rows:
+            r['volume'] = float(r['volume']) / 2
+            writer.writerow(r)
+
+    with open(os.path.join(odme_dir, 'measurement.csv')) as fp:
+        rows = list(csv.DictReader(fp))
+    with open(os.path.join(input_dir, 'measurement.csv'), 'w',
+              newline='') as fp:
+        writer = csv.DictWriter(fp, list(rows[0].keys()) + ['demand_period'])
+        writer.writeheader()
+        for r in rows:
+            count = float(r['count'])
+            if r['measurement_type'] == 'link':
+                writer.writerow({**r, 'demand_period': 'AM'})
+                writer.writerow({**r, 'count': count / 2,
+                                 'demand_period': 'PM'})
+            else:
+                writer.writerow({**r, 'count': count * 1.5})
+
+    # AM link counts by (from_node_id, to_node_id)
+    return {
+        (int(r['from_node_id']), int(r['to_node_id'])): float(r['count'])
+        for r in rows if r['measurement_type'] == 'link'
+    }
+
+
+def test_multi_period_measurements(odme_dir, tmp_path):
+    pytest.importorskip('yaml')
+
+    input_dir = tmp_path / 'two_period'
+    am_counts = _write_two_period_case(odme_dir, str(input_dir))
+
+    network = pg.read_network(input_dir=str(input_dir), odme=True)
+    A = network._base_assignment
+    assert A.map_dp_id == {'AM': 0, 'PM': 1}
+
+    obs_links = {
+        (link.external_from_node, link.external_to_node):
+            list(link.obs_count_by_period)
+        for link in A.get_links() if any(link.obs_count_by_period)
+    }
+    assert obs_links == {k: [v, v / 2] for k, v in am_counts.items()}
+
+    history = pg.perform_network_assignment(3, 10, 5, network,
+                                            odme_line_search=True)
+    assert history[-1] < history[0] / 100
+
+    # deviations are estimated by demand period
+    records = _get_odme_performance(A)
+    link_records = [x for x in records if x[0] == 'link']
+    assert len(link_records) == 2 * len(am_counts)
+    for link in A.get_links():
+        for tau in [0, 1]:
+            if link.obs_count_by_period[tau] > 0:
+                assert link.est_count_dev_by_period[tau] == pytest.approx(
+                    link.flow_vol_by_period[tau] - link.obs_count_by_period[tau]
+                )
+
+    for dp in ['AM', 'PM']:
+        recs = [x for x in link_records if x[7] == dp]
+        assert len(recs) == len(am_counts)
+        for _, _, _, from_node_id, to_node_id, obs, _, _ in recs:
+            count = am_counts[(from_node_id, to_node_id)]
+            assert obs == (count if dp == 'AM' else count / 2)
+
+    # productions and attractions are over both demand periods
+    zones = A.get_network().zone_id_to_zone_dict
+    for x in records:
+        if x[0] == 'production':
+            assert x[6] == zones[x[1]].est_production
+        elif x[0] == 'attraction':
+            assert x[6] == zones[x[2]].est_attraction
+
+
+def test_unknown_demand_period_in_measurements(odme_dir, tmp_path):
+    pytest.importorskip('yaml')
+
+    input_dir = tmp_path / 'two_period'
+    _write_two_period_case(odme_dir, str(input_dir))
+
+    with open(input_dir / 'measurement.csv') as fp:
+        text = fp.read()
+    with open(input_dir / 'measurement.csv', 'w') as fp:
+        fp.write(text.replace(',PM', ',MD', 1))
+
+    with pytest.raises(Exception, match='NO demand period: MD'):
+        pg.read_network(input_dir=str(input_dir), odme=True)
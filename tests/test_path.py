@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns.consts import MAX_LABEL_COST
+from path4gmns.path import bounded_shortest_path, find_path_for_agents, \
+                           single_source_shortest_path
+
+
+def _get_time_budgets(label_costs):
+    """ budgets halfway between distinct labels and one to reach all nodes """
+    labels = np.unique(label_costs[label_costs < MAX_LABEL_COST])
+    return [
+        (labels[i] + labels[i+1]) / 2 for i in range(0, len(labels) - 1, 3)
+    ] + [labels[-1] + 1]
+
+
+@pytest.mark.parametrize('engine_type', ['c', 'python'])
+@pytest.mark.parametrize('mode', ['p', 'w'])
+def test_bounded_search_matches_unbounded_search(sioux_falls_dir,
+                                                 engine_type, mode):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    an = network._base_assignment._get_accessnetwork(mode)
+    link_size = an.get_link_size()
+    link_costs = np.ctypeslib.as_array(an.get_link_costs(), (link_size,))
+    from_node_nos = np.ctypeslib.as_array(an.get_from_node_no_arr(),
+                                          (link_size,))
+
+    for source_node_id in [1, 10, 24]:
+        single_source_shortest_path(an, source_node_id)
+        label_costs = np.ctypeslib.as_array(an.get_node_label_costs()).copy()
+        link_preds = np.ctypeslib.as_array(an.get_link_preds()).copy()
+
+        for time_budget in _get_time_budgets(label_costs):
+            node_nos, labels, preds = bounded_shortest_path(an,
+                                                            source_node_id,
+                                                            time_budget,
+                                                            engine_type)
+
+            expected = np.flatnonzero(label_costs <= time_budget)
+            assert node_nos.tolist() == expected.tolist()
+            assert labels.tolist() == pytest.approx(
+                label_costs[expected].tolist()
+            )
+
+            if engine_type == 'c':
+                assert preds.tolist() == link_preds[expected].tolist()
+            else:
+                # it may take another one of equal-cost predecessor links
+                is_source = labels == 0
+                assert (preds[is_source] == -1).all()
+                preds = preds[~is_source]
+                assert (
+                    label_costs[from_node_nos[preds]] + link_costs[preds]
+                    == pytest.approx(labels[~is_source])
+                )
+
+
+@pytest.mark.parametrize('worker_num', [1, 3])
+def test_accessible_nodes_batch(sioux_falls_dir, worker_num):
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    A = network._base_assignment
+
+    source_node_ids = list(range(1, 25))
+    time_budgets = [5 + i % 4 * 5 for i in range(len(source_node_ids))]
+
+    expected = [
+        A.get_accessible_nodes(x, t, 'p')
+        for x, t in zip(source_node_ids, time_budgets)
+    ]
+    assert any(expected) and not all(len(x) == 23 for x in expected)
+
+    res = network.get_accessible_nodes_batch(source_node_ids, time_budgets,
+                                             'p', worker_num)
+    assert res == expected
+
+    res = network.get_accessible_nodes_batch(source_node_ids, 10, 'p',
+                                             worker_num)
+    assert res == [A.get_accessible_nodes(x, 10, 'p') for x in source_node_ids]
+
+
+def _route_agents(input_dir, worker_num, engine_type='c'):
+    network = pg.read_network(input_dir=input_dir)
+    G = network._base_assignment.network
+    find_path_for_agents(G, network._base_assignment.get_column_pool(),
+                         engine_type, 3, worker_num)
+
+    agents = G.get_agents()
+    paths = [
+        (p, agents.node_paths[p], agents.link_paths[p])
+        for p in agents.path_nos.tolist()
+    ]
+
+    return agents, paths
+
+
+@pytest.mark.parametrize('worker_num, engine_type', [
+    (3, 'c'),
+    (8, 'c'),
+    # it falls back to a single thread
+    (3, 'python'),
+])
+def test_find_path_for_agents_in_parallel(sioux_falls_dir, worker_num,
+                                          engine_type):
+    expected_agents, expected_paths = _route_agents(sioux_falls_dir, 1)
+    agents, paths = _route_agents(sioux_falls_dir, worker_num, engine_type)
+
+    assert np.array_equal(agents.o_node_ids, expected_agents.o_node_ids)
+    assert np.array_equal(agents.d_node_ids, expected_agents.d_node_ids)
+    if engine_type == 'c':
+        # so are path nos as paths from each worker are stored in order
+        assert paths == expected_paths
+        assert np.array_equal(agents.path_costs, expected_agents.path_costs)
+    else:
+        # it may take another one of equal-cost paths
+        assert np.allclose(agents.path_costs, expected_agents.path_costs)
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+import path4gmns as pg
+
+
+def _get_network_attrs(network):
+    ui = network._base_assignment.network
+    nodes = [
+        (x.external_node_id, x.zone_id, x.coord_x, x.coord_y)
+        for x in ui.node_list
+    ]
+    links = [
+        (x.id, x.from_node_seq_no, x.to_node_seq_no, x.length, x.lanes,
+         x.type, x.free_speed, x.lane_capacity, x.allowed_uses,
+         [(v.alpha, v.beta, v.mu, v.fftt, v.capacity, v.phf)
+          for v in x.vdfperiods])
+        for x in ui.link_list
+    ]
+    topology = [np.asarray(x).tolist() for x in ui.get_topology()]
+
+    return nodes, links, topology
+
+
+def _get_link_volumes(network):
+    pg.perform_network_assignment(1, 5, 5, network)
+    return [
+        link.get_period_flow_vol(0)
+        for link in network._base_assignment.get_links()
+    ]
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_snapshot_matches_csv(sioux_falls_dir, tmp_path, capsys, mmap):
+    snapshot_dir = str(tmp_path / 'snapshot')
+
+    network = pg.read_network(input_dir=sioux_falls_dir)
+    expected_attrs = _get_network_attrs(network)
+    expected_vols = _get_link_volumes(network)
+
+    # the first one parses the csv files and saves the snapshot, and the
+    # second one loads it
+    for i in range(2):
+        network = pg.read_network(input_dir=sioux_falls_dir,
+                                  snapshot_dir=snapshot_dir,
+                                  mmap_snapshot=mmap)
+        out = capsys.readouterr().out
+        if i:
+            assert 'load network snapshot' in out
+        else:
+            assert 'save network snapshot' in out
+
+        assert _get_network_attrs(network) == expected_attrs
+        assert _get_link_volumes(network) == pytest.approx(expected_vols)
+
+        # the BPR parameters are used without being copied
+        ui = network._base_assignment.network
+        bpr_params = ui.get_link_arrays().get_vdf_arrays()
+        assert all(isinstance(x.base, np.memmap) == mmap for x in bpr_params)
+
+
+def test_snapshot_is_replaced_atomically(sioux_falls_dir, tmp_path):
+    snapshot_dir = tmp_path / 'snapshot'
+    stale_dir = snapshot_dir / 'stale'
+    stale_dir.mkdir(parents=True)
+    (stale_dir / 'key.txt').write_text('stale')
+
+    pg.read_network(input_dir=sioux_falls_dir, snapshot_dir=str(snapshot_dir))
+
+    # only the new snapshot is left, without any temporary directory
+    names = os.listdir(snapshot_dir)
+    assert len(names) == 1
+    assert (snapshot_dir / names[0] / 'key.txt').read_text() == names[0]
@@ -0,0 +1,243 @@
+import contextlib
+import csv
+import gzip
+import io
+import os
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+import path4gmns as pg
+from path4gmns import utils
+
+
+def _read_network_attrs(input_dir):
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = pg.read_network(input_dir=input_dir)
+
+    A = network._base_assignment
+    ui = A.network
+    nodes = [
+        (x.external_node_id, x.zone_id, x.coord_x, x.coord_y)
+        for x in ui.node_list
+    ]
+    links = [
+        (x.id, x.from_node_seq_no, x.to_node_seq_no, x.length, x.lanes,
+         x.type, x.free_speed, x.lane_capacity, x.allowed_uses, x.geometry,
+         [(v.alpha, v.beta, v.mu, v.fftt, v.capacity, v.phf)
+          for v in x.vdfperiods])
+        for x in ui.link_list
+    ]
+    od_vols = {k: cv.get_od_volume() for k, cv in A.get_column_pool().items()}
+
+    return nodes, links, od_vols
+
+
+def test_read_network_with_and_without_pyarrow(sioux_falls_dir, monkeypatch):
+    pytest.importorskip('pyarrow')
+
+    expected = _read_network_attrs(sioux_falls_dir)
+
+    monkeypatch.setattr(utils, '_read_csv_columns_with_pyarrow',
+                        lambda *args: None)
+    assert _read_network_attrs(sioux_falls_dir) == expected
+
+
+def test_read_csv_columns(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+
+    filename = str(tmp_path / 'link.csv')
+    with open(filename, 'w') as fp:
+        fp.write('link_id,length,lanes,VDF_alpha1,geometry,empty\n'
+                 '001,1.5,2,,"LINESTRING (0 0, 1 1)",\n'
+                 'a,,1.9,0.15,,\n')
+
+    cols = utils._read_csv_columns(filename, ['link_id', 'geometry'])
+
+    monkeypatch.setattr(utils, '_read_csv_columns_with_pyarrow',
+                        lambda *args: None)
+    cols_ = utils._read_csv_columns(filename, ['link_id', 'geometry'])
+
+    assert cols.keys() == cols_.keys()
+    for h in ['link_id', 'geometry', 'empty']:
+        assert cols[h] == cols_[h]
+
+    assert cols['link_id'] == ['001', 'a']
+    for h in ['length', 'VDF_alpha1']:
+        np.testing.assert_array_equal(utils._convert_strs_to_floats(cols[h]),
+                                      utils._convert_strs_to_floats(cols_[h]))
+
+    lanes, valid = utils._convert_strs_to_ints(cols['lanes'])
+    assert lanes.tolist() == [2, 1] and valid.all()
+
+
+def test_odme_performance_parquet_matches_csv(odme_dir, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = pg.read_network(input_dir=odme_dir, odme=True)
+        pg.perform_network_assignment(3, 2, 2, network)
+
+    pg.output_odme_performance(network, str(tmp_path))
+    pg.output_odme_performance_parquet(network, str(tmp_path))
+
+    with open(tmp_path / 'odme_performance.csv') as fp:
+        reader = csv.reader(fp)
+        headers = next(reader)
+        rows = list(reader)
+
+    table = pq.read_table(tmp_path / 'odme_performance.parquet')
+    assert table.column_names == headers
+    assert table.num_rows == len(rows) > 0
+
+    for row, rec in zip(rows, table.to_pylist()):
+        for h, x in zip(headers, row):
+            y = rec[h]
+            if y is None:
+                assert x == ''
+            elif isinstance(y, float):
+                assert float(x) == pytest.approx(y)
+            else:
+                assert x == str(y)
+
+
+def _get_column_states(network):
+    A = network._base_assignment
+    cols = {
+        (k, node_sum): (cv.get_od_volume(), col.get_seq_no(), col.nodes,
+                        col.links, col.get_volume(), col.get_toll(),
+                        col.get_travel_time(), col.get_distance())
+        for k, cv in A.get_column_pool().items()
+        for node_sum, col in cv.get_columns().items()
+    }
+    link_states = np.array([
+        (link.flow_vol_by_period, link.travel_time_by_period)
+        for link in A.get_links()
+    ])
+
+    return cols, link_states
+
+
+def test_column_pool_round_trip(sioux_falls_dir, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = pg.read_network(input_dir=sioux_falls_dir)
+        pg.perform_network_assignment(1, 3, 3, network)
+        pg.save_column_pool(network, str(tmp_path))
+
+        loaded = pg.read_network(input_dir=sioux_falls_dir)
+        pg.load_column_pool(loaded, str(tmp_path))
+
+    cols, link_states = _get_column_states(network)
+    assert len(cols) > 0
+
+    cols_, link_states_ = _get_column_states(loaded)
+    assert cols_ == cols
+    # link volumes are summed up in a different order
+    np.testing.assert_allclose(link_states_, link_states)
+
+
+def _get_csv_rows():
+    return [['id', 'name', 'value']] + [
+        [i, f'row "{i}", quoted' if i % 5 == 0 else f'row {i}', i / 3]
+        for i in range(100)
+    ]
+
+
+def _write_csv(filename, compression):
+    # a small chunk size to go through multiple chunks
+    with utils._BufferedCSVWriter(filename, compression, 7) as writer:
+        for row in _get_csv_rows():
+            writer.writerow(row)
+
+    return writer.filename
+
+
+@pytest.mark.parametrize('compression, ext', [(None, ''), ('gzip', '.gz')])
+def test_buffered_csv_writer_matches_csv_writer(tmp_path, compression, ext):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(_get_csv_rows())
+    expected = buf.getvalue().encode('utf-8')
+
+    filename = _write_csv(str(tmp_path / 'out.csv'), compression)
+    assert filename == str(tmp_path / 'out.csv') + ext
+
+    if compression == 'gzip':
+        with gzip.open(filename, 'rb') as fp:
+            assert fp.read() == expected
+    else:
+        with open(filename, 'rb') as fp:
+            assert fp.read() == expected
+
+
+def test_buffered_csv_writer_with_zstd(tmp_path, monkeypatch):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(_get_csv_rows())
+    expected = buf.getvalue().encode('utf-8')
+
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+    if zstd is not None:
+        filename = _write_csv(str(tmp_path / 'out.csv'), 'zstd')
+        assert filename.endswith('.csv.zst')
+        with open(filename, 'rb') as fp:
+            reader = zstd.ZstdDecompressor().stream_reader(fp)
+            assert reader.read() == expected
+
+    # it falls back to gzip without zstandard
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        filename = _write_csv(str(tmp_path / 'out2.csv'), 'zstd')
+    assert filename.endswith('.csv.gz')
+    with gzip.open(filename, 'rb') as fp:
+        assert fp.read() == expected
+
+
+def _get_od_volumes(network):
+    return {
+        k: cv.get_od_volume()
+        for k, cv in network._base_assignment.get_column_pool().items()
+        if cv.get_od_volume() > 0
+    }
+
+
+@pytest.mark.parametrize('sparse', [None, True, False])
+def test_demand_matrices_round_trip(sioux_falls_dir, tmp_path, sparse):
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = pg.read_network(input_dir=sioux_falls_dir)
+    pg.save_demand_matrices(network, str(tmp_path), sparse)
+
+    od_vols = _get_od_volumes(network)
+    assert len(od_vols) > 0
+
+    with np.load(tmp_path / 'demand.npz') as data:
+        # Sioux Falls is dense enough to take a dense matrix by default
+        assert data['sparse'].tolist() == [bool(sparse)]
+
+    zone_ids, matrices = pg.read_demand_matrices(str(tmp_path / 'demand.npz'))
+    assert zone_ids.tolist() == list(range(1, 25))
+    assert list(matrices.keys()) == [('p', 'AM')]
+
+    mat = matrices[('p', 'AM')]
+    assert np.count_nonzero(mat) == len(od_vols)
+    for (_, _, oz_id, dz_id), vol in od_vols.items():
+        assert mat[oz_id - 1, dz_id - 1] == vol
+
+    # demand.npz in place of demand.csv
+    input_dir = tmp_path / 'input'
+    os.makedirs(input_dir)
+    for f in ['node.csv', 'link.csv']:
+        shutil.copy(os.path.join(sioux_falls_dir, f), input_dir)
+    shutil.copy(tmp_path / 'demand.npz', input_dir)
+    with open(os.path.join(sioux_falls_dir, 'settings.yml')) as fp:
+        settings = fp.read()
+    with open(input_dir / 'settings.yml', 'w') as fp:
+        fp.write(settings.replace('demand.csv', 'demand.npz'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        network = pg.read_network(input_dir=str(input_dir))
+    assert _get_od_volumes(network) == od_vols